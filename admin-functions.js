@@ -445,8 +445,9 @@ async function loadPendingPriceChanges() {
         
         // Filter to unnotified changes only (we'd need to track this in the API)
         // For now, show recent changes from last 24 hours
-        const yesterday = new Date(Date.now() - 24 * 60 * 60 * 1000).toISOString();
-        const recentChanges = allChanges.filter(c => c.changed_at > yesterday);
+        // changed_at is SQLite UTC time ('YYYY-MM-DD HH:MM:SS')
+        const yesterday = Date.now() - 24 * 60 * 60 * 1000;
+        const recentChanges = allChanges.filter(c => new Date(c.changed_at.replace(' ', 'T') + 'Z') > yesterday);
         
         const container = document.getElementById('pendingChanges');
         if (recentChanges.length === 0) {
@@ -762,7 +762,7 @@ function displayProducts(productsToShow) {
         item.innerHTML = `
             <div class="product-row">
                 <div class="product-photo">
-                    ${product.photo ? `<img src="${product.photo}" style="width: 50px; height: 50px; object-fit: cover; border-radius: 4px;">` : '📷'}
+                    ${product.photo ? `<img src="${product.photo.startsWith('/api/images/') ? product.photo.replace(/\.(\w+)$/, '-thumb.$1') : product.photo}" style="width: 50px; height: 50px; object-fit: cover; border-radius: 4px;">` : '📷'}
                     <input type="file" id="photo-${product.id}" accept="image/*" style="display: none;" onchange="uploadPhoto(${product.id}, this)">
                     <button class="btn" style="padding: 5px 10px; font-size: 0.8rem;" onclick="document.getElementById('photo-${product.id}').click()">Upload</button>
                 </div>
@@ -845,43 +845,28 @@ function uploadPhoto(id, input) {
             return;
         }
         
-        const reader = new FileReader();
-        reader.onload = function(e) {
-            const img = new Image();
-            img.onload = function() {
-                // Resize image to max 400x400
-                const canvas = document.createElement('canvas');
-                let width = img.width;
-                let height = img.height;
-                const maxSize = 400;
-                
-                if (width > height) {
-                    if (width > maxSize) {
-                        height *= maxSize / width;
-                        width = maxSize;
-                    }
-                } else {
-                    if (height > maxSize) {
-                        width *= maxSize / height;
-                        height = maxSize;
-                    }
-                }
-                
-                canvas.width = width;
-                canvas.height = height;
-                const ctx = canvas.getContext('2d');
-                ctx.drawImage(img, 0, 0, width, height);
-                
-                // Convert to base64 with reduced quality
-                const resizedBase64 = canvas.toDataURL('image/jpeg', 0.7);
-                console.log('📷 Resized image from', file.size, 'bytes to', resizedBase64.length, 'chars');
-                
-                updateProduct(id, 'photo', resizedBase64);
-                displayProducts(allProducts);
-            };
-            img.src = e.target.result;
-        };
-        reader.readAsDataURL(file);
+        // Server stores the photo by content hash and makes the resized variants
+        const formData = new FormData();
+        formData.append('photo', file);
+        
+        fetch(`${apiBase}/images`, {
+            method: 'POST',
+            body: formData
+        })
+        .then(response => response.json())
+        .then(result => {
+            if (!result.success) {
+                throw new Error(result.error || 'Upload failed');
+            }
+            console.log('📷 Uploaded photo', file.size, 'bytes ->', result.url);
+            updateProduct(id, 'photo', result.url);
+            displayProducts(allProducts);
+        })
+        .catch(error => {
+            console.error('Error uploading photo:', error);
+            alert(`❌ Error uploading photo: ${error.message}`);
+        });
+        input.value = '';
     }
 }
 
@@ -981,7 +966,7 @@ async function saveProducts() {
         }
         
         const result = await response.json();
-        alert(`✅ Success! ${result.updated_count} products saved to database.`);
+        alert(`✅ Success! ${result.updated_count} products changed (${result.unchanged_count} already up to date).`);
         
         // Reload to confirm changes
         await loadProducts();
@@ -1418,8 +1403,9 @@ async function loadPendingPriceChanges() {
         const allChanges = data.changes || data || [];
         
         // Filter to unnotified changes only from last 24 hours
-        const yesterday = new Date(Date.now() - 24 * 60 * 60 * 1000).toISOString();
-        const recentChanges = allChanges.filter(c => c.changed_at > yesterday);
+        // changed_at is SQLite UTC time ('YYYY-MM-DD HH:MM:SS')
+        const yesterday = Date.now() - 24 * 60 * 60 * 1000;
+        const recentChanges = allChanges.filter(c => new Date(c.changed_at.replace(' ', 'T') + 'Z') > yesterday);
         
         if (recentChanges.length === 0) {
             container.innerHTML = '<p style="margin: 0; color: #999;">✓ No pending price changes to notify</p>';
@@ -0,0 +1,288 @@
+# Glengala Fresh - Customer stats and achievements
+# user_stats keeps the running counters rewards-system.js used to rebuild from
+# the order history in localStorage. place_order bumps them in the order's own
+# transaction and only the achievements watching a counter that moved are
+# checked, so neither an order nor a profile load gets slower as a customer's
+# history grows - and the history follows them to every device.
+
+import json
+from datetime import datetime, timezone
+from itertools import groupby
+
+# Same ids and thresholds as achievementDefs (rewards-system.js), which owns
+# the names, icons and rewards: (id, counter, threshold)
+ACHIEVEMENTS = [
+    ('first_order', 'ordersCount', 1),
+    ('getting_started', 'totalSpent', 30),
+    ('try_three', 'categoriesOrdered', 3),
+    ('third_order', 'ordersCount', 3),
+    ('local_supporter', 'ordersCount', 5),
+    ('glengala_regular', 'ordersCount', 10),
+    ('glengala_champion', 'ordersCount', 20),
+    ('centurion', 'totalSpent', 100),
+    ('super_shopper', 'totalSpent', 250),
+    ('big_spender', 'totalSpent', 500),
+    ('nice_haul', 'largestOrder', 40),
+    ('big_basket', 'largestOrder', 60),
+    ('mega_order', 'largestOrder', 100),
+    ('veggie_starter', 'veggiesBought', 5),
+    ('veggie_lover', 'veggiesBought', 20),
+    ('fruit_starter', 'fruitsBought', 5),
+    ('fruit_fan', 'fruitsBought', 15),
+    ('herb_enthusiast', 'herbsBought', 10),
+    ('nutty', 'nutsBought', 5),
+    ('variety_seeker', 'categoriesOrdered', 5),
+    ('two_week_streak', 'weeklyStreak', 2),
+    ('weekly_regular', 'weeklyStreak', 4),
+    ('monthly_legend', 'weeklyStreak', 8),
+    ('early_bird', 'earlyOrders', 1),
+    ('night_owl', 'lateOrders', 1),
+]
+
+# Free deliveries each achievement grants: the 'free_delivery' rewards in
+# achievementDefs (rewards-system.js)
+FREE_DELIVERY_REWARDS = {
+    'first_order': 1, 'try_three': 1, 'third_order': 1, 'local_supporter': 1,
+    'glengala_regular': 2, 'centurion': 1, 'super_shopper': 2, 'big_spender': 3,
+    'big_basket': 1, 'mega_order': 1, 'veggie_lover': 1, 'fruit_fan': 1,
+    'herb_enthusiast': 1, 'variety_seeker': 1, 'weekly_regular': 1, 'monthly_legend': 2,
+}
+
+# Counters, named as in getDefaultStats (rewards-system.js)
+COUNTERS = ['ordersCount', 'totalSpent', 'itemsBought', 'largestOrder', 'veggiesBought',
+            'fruitsBought', 'herbsBought', 'nutsBought', 'juicesBought', 'categoriesOrdered',
+            'weeklyStreak', 'lastOrderWeek', 'earlyOrders', 'lateOrders']
+
+# Quantity counters by product category
+CATEGORY_COUNTERS = {
+    'vegetables': 'veggiesBought',
+    'fruits': 'fruitsBought',
+    'herbs': 'herbsBought',
+    'nuts': 'nutsBought',
+    'juices': 'juicesBought',
+}
+
+# Orders before EARLY_HOUR or from LATE_HOUR on (shop's local time)
+EARLY_HOUR = 10
+LATE_HOUR = 19
+
+# counter -> [(threshold, achievement id)]
+_WATCHING = {}
+for _id, _counter, _threshold in ACHIEVEMENTS:
+    _WATCHING.setdefault(_counter, []).append((_threshold, _id))
+
+# The whole profile in one statement: user row, counters and earned achievements
+PROFILE_SQL = f'''SELECT u.*, {', '.join(f's.{counter}' for counter in COUNTERS)},
+    (SELECT json_group_array(json_object('id', a.achievement_id, 'earned_at', a.earned_at,
+                                         'new', a.seen = 0))
+     FROM user_achievements a WHERE a.user_id = u.id) AS achievements
+    FROM users u LEFT JOIN user_stats s ON s.user_id = u.id
+    WHERE u.id = ?'''
+
+
+def create_schema(c):
+    """Create the stats and achievements tables (called from init_db)"""
+    c.execute('''CREATE TABLE IF NOT EXISTS user_stats
+                 (user_id INTEGER PRIMARY KEY,
+                  ordersCount INTEGER DEFAULT 0,
+                  totalSpent REAL DEFAULT 0,
+                  itemsBought INTEGER DEFAULT 0,
+                  largestOrder REAL DEFAULT 0,
+                  veggiesBought REAL DEFAULT 0,
+                  fruitsBought REAL DEFAULT 0,
+                  herbsBought REAL DEFAULT 0,
+                  nutsBought REAL DEFAULT 0,
+                  juicesBought REAL DEFAULT 0,
+                  categoriesOrdered INTEGER DEFAULT 0,
+                  weeklyStreak INTEGER DEFAULT 0,
+                  lastOrderWeek INTEGER,
+                  earlyOrders INTEGER DEFAULT 0,
+                  lateOrders INTEGER DEFAULT 0,
+                  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  FOREIGN KEY (user_id) REFERENCES users (id))''')
+    # seen = 0 until the customer's device has shown the unlock
+    c.execute('''CREATE TABLE IF NOT EXISTS user_achievements
+                 (user_id INTEGER NOT NULL,
+                  achievement_id TEXT NOT NULL,
+                  earned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  seen INTEGER DEFAULT 0,
+                  PRIMARY KEY (user_id, achievement_id),
+                  FOREIGN KEY (user_id) REFERENCES users (id)) WITHOUT ROWID''')
+
+
+def empty_stats():
+    stats = dict.fromkeys(COUNTERS, 0)
+    stats['lastOrderWeek'] = None
+    return stats
+
+
+def week_of(moment):
+    """Monday-based week number, continuous across years"""
+    return (moment.toordinal() - 1) // 7
+
+
+def apply_order(stats, total, lines, placed_at):
+    """Counters after one more order, by the rules of updateStats (rewards-system.js).
+
+    lines are the priced items, each with category and quantity.
+    """
+    new = dict(stats)
+    new['ordersCount'] += 1
+    new['totalSpent'] = round(new['totalSpent'] + total, 2)
+    new['itemsBought'] += len(lines)
+    new['largestOrder'] = max(new['largestOrder'], total)
+
+    categories = set()
+    for line in lines:
+        category = line.get('category') or 'other'
+        categories.add(category)
+        counter = CATEGORY_COUNTERS.get(category)
+        if counter:
+            new[counter] += line.get('quantity') or 1
+    # Categories in a single order, as the client counted it
+    new['categoriesOrdered'] = max(new['categoriesOrdered'], len(categories))
+
+    week = week_of(placed_at)
+    if new['lastOrderWeek'] is None or week > new['lastOrderWeek'] + 1:
+        new['weeklyStreak'] = 1
+    elif week == new['lastOrderWeek'] + 1:
+        new['weeklyStreak'] += 1
+    new['lastOrderWeek'] = max(week, new['lastOrderWeek'] or week)
+
+    if placed_at.hour < EARLY_HOUR:
+        new['earlyOrders'] += 1
+    elif placed_at.hour >= LATE_HOUR:
+        new['lateOrders'] += 1
+    return new
+
+
+def unlocked(old, new):
+    """Ids of achievements whose counter crossed its threshold between old and new"""
+    earned = []
+    for counter, watchers in _WATCHING.items():
+        before, after = old[counter] or 0, new[counter] or 0
+        if after == before:
+            continue
+        for threshold, achievement_id in watchers:
+            if before < threshold <= after:
+                earned.append(achievement_id)
+    return earned
+
+
+def _save(c, user_id, stats):
+    columns = ', '.join(COUNTERS)
+    placeholders = ', '.join('?' for _ in COUNTERS)
+    updates = ', '.join(f'{counter} = excluded.{counter}' for counter in COUNTERS)
+    c.execute(f'''INSERT INTO user_stats (user_id, {columns}) VALUES (?, {placeholders})
+                  ON CONFLICT(user_id) DO UPDATE SET {updates}, updated_at = CURRENT_TIMESTAMP''',
+              (user_id, *(stats[counter] for counter in COUNTERS)))
+
+
+def record_order(c, user_id, total, lines, placed_at=None):
+    """Update a customer's counters for a new order; returns newly earned achievement ids.
+
+    Call inside the order's transaction (place_order does).
+    """
+    placed_at = placed_at or datetime.now()
+    c.execute(f"SELECT {', '.join(COUNTERS)} FROM user_stats WHERE user_id = ?", (user_id,))
+    row = c.fetchone()
+    old = dict(zip(COUNTERS, row)) if row else empty_stats()
+    new = apply_order(old, total, lines, placed_at)
+    _save(c, user_id, new)
+
+    earned = []
+    for achievement_id in unlocked(old, new):
+        c.execute('''INSERT OR IGNORE INTO user_achievements (user_id, achievement_id)
+                     VALUES (?, ?)''', (user_id, achievement_id))
+        # Already held (a streak that broke and came back) isn't news
+        if c.rowcount:
+            earned.append(achievement_id)
+    return earned
+
+
+def free_deliveries_left(c, user_id):
+    """Free deliveries earned through achievements, less those already used"""
+    c.execute('SELECT achievement_id FROM user_achievements WHERE user_id = ?', (user_id,))
+    earned = sum(FREE_DELIVERY_REWARDS.get(row[0], 0) for row in c.fetchall())
+    if not earned:
+        return 0
+    c.execute('SELECT COUNT(*) FROM orders WHERE user_id = ? AND free_delivery = 1', (user_id,))
+    return max(0, earned - c.fetchone()[0])
+
+
+def mark_seen(c, user_id, achievement_ids=None):
+    """Flag unlocks as shown (all of them if no ids); returns how many changed"""
+    if achievement_ids is None:
+        c.execute('UPDATE user_achievements SET seen = 1 WHERE user_id = ? AND seen = 0', (user_id,))
+        return c.rowcount
+    c.executemany('UPDATE user_achievements SET seen = 1 WHERE user_id = ? AND achievement_id = ?',
+                  [(user_id, str(achievement_id)) for achievement_id in achievement_ids])
+    return c.rowcount
+
+
+def profile(row):
+    """Split a PROFILE_SQL row into user fields, 'stats' and achievements"""
+    data = dict(row)
+    earned = json.loads(data.pop('achievements') or '[]')
+    stats = {counter: data.pop(counter) for counter in COUNTERS}
+    data['stats'] = stats if stats['ordersCount'] is not None else empty_stats()
+    data['achievements'] = [{'id': a['id'], 'earned_at': a['earned_at']} for a in earned]
+    data['new_achievements'] = [a['id'] for a in earned if a['new']]
+    return data
+
+
+def _placed_at(created_at):
+    """Local time of an orders.created_at (stored in UTC by CURRENT_TIMESTAMP)"""
+    try:
+        moment = datetime.fromisoformat(str(created_at))
+    except ValueError:
+        return datetime.now()
+    return moment.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+
+
+def backfill(conn):
+    """Build user_stats from order history for customers without a row (idempotent).
+
+    Achievements earned this way are marked seen - they aren't new.
+    """
+    c = conn.cursor()
+    c.execute('''SELECT o.user_id, o.items, o.total, o.created_at FROM orders o
+                 WHERE o.user_id IS NOT NULL
+                 AND NOT EXISTS (SELECT 1 FROM user_stats s WHERE s.user_id = o.user_id)
+                 ORDER BY o.user_id, o.created_at, o.id''')
+    rows = c.fetchall()
+    if not rows:
+        return 0
+    # Old orders' items may not carry a category; use the product's current one
+    c.execute('SELECT id, category FROM products')
+    categories = dict(c.fetchall())
+
+    users = 0
+    for user_id, orders in groupby(rows, key=lambda row: row[0]):
+        stats = empty_stats()
+        earned = []
+        for _, items_json, total, created_at in orders:
+            try:
+                items = json.loads(items_json)
+            except (TypeError, ValueError):
+                items = []
+            lines = []
+            for item in items if isinstance(items, list) else []:
+                if not isinstance(item, dict):
+                    continue
+                category = item.get('category') or categories.get(item.get('id', item.get('product_id')))
+                try:
+                    quantity = float(item.get('quantity') or 1)
+                except (TypeError, ValueError):
+                    quantity = 1
+                lines.append({'category': category, 'quantity': quantity})
+            new = apply_order(stats, total or 0, lines, _placed_at(created_at))
+            # Step by step: a streak that has since broken still earned its badges
+            earned.extend(unlocked(stats, new))
+            stats = new
+        _save(c, user_id, stats)
+        c.executemany('''INSERT OR IGNORE INTO user_achievements (user_id, achievement_id, seen)
+                         VALUES (?, ?, 1)''', [(user_id, achievement_id) for achievement_id in earned])
+        users += 1
+    conn.commit()
+    return users
@@ -0,0 +1,173 @@
+# Glengala Fresh - Admission control and load shedding
+# Every API request belongs to a class - orders, writes, reads or polling - and
+# has to get past two checks before it runs:
+#
+#   * a token bucket per client and class, so one client can't flood a route
+#     (429 with the time until its next token in Retry-After), and
+#   * a concurrency budget: each class may only start while fewer than its
+#     share of MAX_IN_FLIGHT requests are running. Orders may use every slot,
+#     polling only a few, so when the server is busy the slots that free up go
+#     to the classes that still have room - orders first.
+#
+# Polling is shed at once (429, come back later); other classes wait up to
+# their policy's `wait` for a slot before getting a 503.
+
+import math
+import os
+import threading
+import time
+from collections import namedtuple
+
+ENABLED = os.environ.get('ADMISSION_CONTROL', '1') != '0'
+# Requests running at once, across all classes (roughly the WSGI thread count)
+MAX_IN_FLIGHT = int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', 16))
+# Client buckets kept before idle (full) ones are dropped
+MAX_CLIENTS = 10000
+# Retry-After for polling shed under load: the next poll will do
+POLL_RETRY_AFTER = 30
+# Proxies in front of the app whose X-Forwarded-For may be believed (1 on
+# PythonAnywhere). 0 keys clients by the socket address, since any client can
+# send a forwarding header of its own
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', 0))
+
+# rate: tokens per second and client, burst: bucket size,
+# share: fraction of MAX_IN_FLIGHT the class may fill, wait: seconds to queue for a slot
+Policy = namedtuple('Policy', 'rate burst share wait')
+
+# Highest priority first
+POLICIES = {
+    'order': Policy(rate=1, burst=30, share=1.0, wait=5.0),
+    'write': Policy(rate=5, burst=60, share=0.75, wait=2.0),
+    'read': Policy(rate=20, burst=200, share=0.5, wait=0.5),
+    'poll': Policy(rate=1, burst=20, share=0.25, wait=0),
+}
+
+
+class Rejected(Exception):
+    """A request turned away: status (429/503), Retry-After seconds and why"""
+
+    def __init__(self, request_class, reason, status, retry_after):
+        super().__init__(f'{request_class} request rejected ({reason})')
+        self.request_class = request_class
+        self.reason = reason
+        self.status = status
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """A running request's slot; give it back with Admission.release()"""
+    __slots__ = ('request_class', 'released')
+
+    def __init__(self, request_class):
+        self.request_class = request_class
+        self.released = False
+
+
+class Admission:
+    def __init__(self, policies=POLICIES, max_in_flight=MAX_IN_FLIGHT):
+        self.policies = policies
+        self.limits = {name: max(1, int(max_in_flight * policy.share))
+                       for name, policy in policies.items()}
+        self.in_flight = dict.fromkeys(policies, 0)
+        self.total = 0
+        self._buckets = {}
+        self._bucket_lock = threading.Lock()
+        self._slots = threading.Condition()
+        self.admitted = dict.fromkeys(policies, 0)
+        # (class, reason) -> count; reason is 'rate' or 'busy'
+        self.rejected = {}
+        self.waited = dict.fromkeys(policies, 0)
+
+    def _reject(self, request_class, reason, status, retry_after):
+        with self._bucket_lock:
+            key = (request_class, reason)
+            self.rejected[key] = self.rejected.get(key, 0) + 1
+        raise Rejected(request_class, reason, status, retry_after)
+
+    def _take_token(self, request_class, client, now):
+        """Spend one of client's tokens; returns seconds until one is due if there is none"""
+        policy = self.policies[request_class]
+        key = (request_class, client)
+        with self._bucket_lock:
+            tokens, stamp = self._buckets.get(key, (policy.burst, now))
+            tokens = min(policy.burst, tokens + (now - stamp) * policy.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return (1 - tokens) / policy.rate
+            self._buckets[key] = (tokens - 1, now)
+            if len(self._buckets) > MAX_CLIENTS:
+                self._prune(now)
+        return 0
+
+    def _refund(self, request_class, client):
+        with self._bucket_lock:
+            tokens, stamp = self._buckets.get((request_class, client), (0, 0))
+            self._buckets[(request_class, client)] = (tokens + 1, stamp)
+
+    def _prune(self, now):
+        """Drop buckets that have refilled - they'd be recreated just the same"""
+        for (request_class, client), (tokens, stamp) in list(self._buckets.items()):
+            policy = self.policies[request_class]
+            if tokens + (now - stamp) * policy.rate >= policy.burst:
+                del self._buckets[(request_class, client)]
+
+    def admit(self, request_class, client):
+        """Take a slot for one request, or raise Rejected"""
+        now = time.monotonic()
+        wait = self._take_token(request_class, client, now)
+        if wait:
+            self._reject(request_class, 'rate', 429, math.ceil(wait))
+
+        policy = self.policies[request_class]
+        limit = self.limits[request_class]
+        with self._slots:
+            if self.total >= limit and policy.wait:
+                deadline = now + policy.wait
+                self.waited[request_class] += 1
+                while self.total >= limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._slots.wait(remaining)
+            if self.total >= limit:
+                admitted = False
+            else:
+                admitted = True
+                self.total += 1
+                self.in_flight[request_class] += 1
+                self.admitted[request_class] += 1
+        if not admitted:
+            # Turned away for load, not for this client's rate
+            self._refund(request_class, client)
+            if request_class == 'poll':
+                self._reject(request_class, 'busy', 429, POLL_RETRY_AFTER)
+            self._reject(request_class, 'busy', 503, 1)
+        return Ticket(request_class)
+
+    def release(self, ticket):
+        if ticket.released:
+            return
+        ticket.released = True
+        with self._slots:
+            self.total -= 1
+            self.in_flight[ticket.request_class] -= 1
+            self._slots.notify_all()
+
+    def get_stats(self):
+        with self._bucket_lock:
+            rejected = {name: {} for name in self.policies}
+            for (request_class, reason), count in self.rejected.items():
+                rejected[request_class][reason] = count
+            clients = len(self._buckets)
+        return {
+            'enabled': ENABLED,
+            'in_flight': dict(self.in_flight),
+            'limits': dict(self.limits),
+            'admitted': dict(self.admitted),
+            'waited': dict(self.waited),
+            'rejected': rejected,
+            'client_buckets': clients,
+        }
+
+
+admission = Admission()
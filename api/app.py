@@ -1,179 +1,468 @@
 # Glengala Fresh - Backend API
 # PythonAnywhere Flask API for live pricing and gamification
 
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, jsonify, request, send_file, Response, g
 from flask_cors import CORS
-import sqlite3
+from werkzeug.middleware.proxy_fix import ProxyFix
+import io
 import json
-from datetime import datetime, timedelta
+import logging
+from datetime import datetime, timedelta, timezone
 import os
+from db import pool, get_db
+from cache import (VersionedCache, Snapshot, snapshot_response, dynamic_response, dumps,
+                   compose, combined_tag)
+import catalog_sync
+import images
+from images import ImageError
+import product_views
+from product_views import ViewError
+import order_items
+import bulk_update
+import importer
+from importer import ImportFileError
+import quote
+import search
+import assets
+import orders
+import achievements
+import reports
+from reports import ReportError
+import idempotency
+from idempotency import IdempotencyError
+from writer import writer, WriterBusy
+from quote import QuoteError
+from events import bus, TooManyStreams
+import admission as admission_control
+from admission import admission, Rejected
+import coherence as cache_coherence
+from coherence import coherence
+import push_dispatch
+from push_dispatch import dispatcher, mock_push
+import migrations
+import query_plans
+import metrics
+import db
 
 app = Flask(__name__)
 CORS(app)
+if admission_control.TRUSTED_PROXY_HOPS:
+    # remote_addr becomes the client address the trusted proxy saw
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=admission_control.TRUSTED_PROXY_HOPS)
 
-# Database path
-DB_PATH = os.environ.get('DATABASE_PATH', os.path.join(os.path.dirname(__file__), 'glengala.db'))
+# Logging (LOG_LEVEL=DEBUG adds per-request detail)
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+                    format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+log = logging.getLogger('glengala')
+
+# price_changes.changed_at is UTC in SQLite's CURRENT_TIMESTAMP format
+SQLITE_TIME = '%Y-%m-%d %H:%M:%S'
+
+# Pooled SQLite connections, released back to the pool after every request
+db.init_app(app)
+
+# Fingerprinted static assets from the build manifest
+asset_store = assets.AssetStore()
 
 # Initialize database
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    with pool.connection() as conn:
+        c = conn.cursor()
     
-    # Products table
-    c.execute('''CREATE TABLE IF NOT EXISTS products
-                 (id INTEGER PRIMARY KEY,
-                  name TEXT NOT NULL,
-                  category TEXT NOT NULL,
-                  price REAL NOT NULL,
-                  unit TEXT NOT NULL,
-                  active INTEGER DEFAULT 1,
-                  mostPopular INTEGER DEFAULT 0,
-                  popularOrder INTEGER DEFAULT 0,
-                  photo TEXT,
-                  hasSpecial INTEGER DEFAULT 0,
-                  specialPrice REAL DEFAULT 0,
-                  specialQuantity INTEGER DEFAULT 0,
-                  specialUnit TEXT,
-                  isPremium INTEGER DEFAULT 0,
-                  isOrganic INTEGER DEFAULT 0,
-                  stock INTEGER DEFAULT 999,
-                  trending INTEGER DEFAULT 0,
-                  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-    
-    # Daily specials table
-    c.execute('''CREATE TABLE IF NOT EXISTS daily_specials
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  product_id INTEGER NOT NULL,
-                  discount_percent REAL DEFAULT 0,
-                  special_date DATE NOT NULL,
-                  active INTEGER DEFAULT 1,
-                  FOREIGN KEY (product_id) REFERENCES products (id))''')
-    
-    # Users table for gamification
-    c.execute('''CREATE TABLE IF NOT EXISTS users
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  name TEXT NOT NULL,
-                  phone TEXT UNIQUE NOT NULL,
-                  address TEXT,
-                  postcode TEXT,
-                  loyalty_points INTEGER DEFAULT 0,
-                  current_streak INTEGER DEFAULT 0,
-                  longest_streak INTEGER DEFAULT 0,
-                  last_order_date DATE,
-                  total_orders INTEGER DEFAULT 0,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-    
-    # Orders table
-    c.execute('''CREATE TABLE IF NOT EXISTS orders
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  user_id INTEGER,
-                  items TEXT NOT NULL,
-                  total REAL NOT NULL,
-                  fulfilment TEXT,
-                  delivery_time TEXT,
-                  status TEXT DEFAULT 'pending',
-                  points_earned INTEGER DEFAULT 0,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                  FOREIGN KEY (user_id) REFERENCES users (id))''')
-    
-    # Challenges table
-    c.execute('''CREATE TABLE IF NOT EXISTS challenges
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  user_id INTEGER,
-                  challenge_type TEXT NOT NULL,
-                  description TEXT,
-                  target INTEGER,
-                  progress INTEGER DEFAULT 0,
-                  reward_points INTEGER,
-                  completed INTEGER DEFAULT 0,
-                  expires_at TIMESTAMP,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                  FOREIGN KEY (user_id) REFERENCES users (id))''')
-    
-    # Favorites table
-    c.execute('''CREATE TABLE IF NOT EXISTS favorites
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  user_id INTEGER NOT NULL,
-                  product_id INTEGER NOT NULL,
-                  added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                  FOREIGN KEY (user_id) REFERENCES users (id),
-                  FOREIGN KEY (product_id) REFERENCES products (id))''')
-    
-    # Push subscriptions table
-    c.execute('''CREATE TABLE IF NOT EXISTS push_subscriptions
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  user_id INTEGER,
-                  endpoint TEXT UNIQUE NOT NULL,
-                  p256dh TEXT NOT NULL,
-                  auth TEXT NOT NULL,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                  FOREIGN KEY (user_id) REFERENCES users (id))''')
-    
-    # Price changes tracking for in-app notifications
-    c.execute('''CREATE TABLE IF NOT EXISTS price_changes
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  product_id INTEGER NOT NULL,
-                  product_name TEXT NOT NULL,
-                  old_price REAL NOT NULL,
-                  new_price REAL NOT NULL,
-                  changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                  notified INTEGER DEFAULT 0,
-                  FOREIGN KEY (product_id) REFERENCES products (id))''')
-    
-    # Shop customization settings table
-    c.execute('''CREATE TABLE IF NOT EXISTS settings
-                 (id INTEGER PRIMARY KEY CHECK (id = 1),
-                  primary_color TEXT DEFAULT '#2FA44F',
-                  secondary_color TEXT DEFAULT '#3A6FD8',
-                  gradient_start TEXT DEFAULT '#4CAF50',
-                  gradient_end TEXT DEFAULT '#45a049',
-                  gradient_angle INTEGER DEFAULT 135,
-                  shop_name TEXT DEFAULT 'Glengala Fresh',
-                  shop_description TEXT,
-                  contact_phone TEXT,
-                  contact_email TEXT,
-                  customization_json TEXT,
-                  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-    
-    # Add customization_json column if it doesn't exist (migration)
-    try:
-        c.execute('ALTER TABLE settings ADD COLUMN customization_json TEXT')
-    except:
-        pass  # Column already exists)
+        # Products table
+        c.execute('''CREATE TABLE IF NOT EXISTS products
+                     (id INTEGER PRIMARY KEY,
+                      name TEXT NOT NULL,
+                      category TEXT NOT NULL,
+                      price REAL NOT NULL,
+                      unit TEXT NOT NULL,
+                      active INTEGER DEFAULT 1,
+                      mostPopular INTEGER DEFAULT 0,
+                      popularOrder INTEGER DEFAULT 0,
+                      photo TEXT,
+                      hasSpecial INTEGER DEFAULT 0,
+                      specialPrice REAL DEFAULT 0,
+                      specialQuantity INTEGER DEFAULT 0,
+                      specialUnit TEXT,
+                      isPremium INTEGER DEFAULT 0,
+                      isOrganic INTEGER DEFAULT 0,
+                      stock INTEGER DEFAULT 999,
+                      trending INTEGER DEFAULT 0,
+                      updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    
+        # Daily specials table
+        c.execute('''CREATE TABLE IF NOT EXISTS daily_specials
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      product_id INTEGER NOT NULL,
+                      discount_percent REAL DEFAULT 0,
+                      special_date DATE NOT NULL,
+                      active INTEGER DEFAULT 1,
+                      FOREIGN KEY (product_id) REFERENCES products (id))''')
+    
+        # Users table for gamification
+        c.execute('''CREATE TABLE IF NOT EXISTS users
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      name TEXT NOT NULL,
+                      phone TEXT UNIQUE NOT NULL,
+                      address TEXT,
+                      postcode TEXT,
+                      loyalty_points INTEGER DEFAULT 0,
+                      current_streak INTEGER DEFAULT 0,
+                      longest_streak INTEGER DEFAULT 0,
+                      last_order_date DATE,
+                      total_orders INTEGER DEFAULT 0,
+                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    
+        # Orders table
+        c.execute('''CREATE TABLE IF NOT EXISTS orders
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      user_id INTEGER,
+                      items TEXT NOT NULL,
+                      total REAL NOT NULL,
+                      fulfilment TEXT,
+                      delivery_time TEXT,
+                      status TEXT DEFAULT 'pending',
+                      points_earned INTEGER DEFAULT 0,
+                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                      FOREIGN KEY (user_id) REFERENCES users (id))''')
+    
+        # Challenges table
+        c.execute('''CREATE TABLE IF NOT EXISTS challenges
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      user_id INTEGER,
+                      challenge_type TEXT NOT NULL,
+                      description TEXT,
+                      target INTEGER,
+                      progress INTEGER DEFAULT 0,
+                      reward_points INTEGER,
+                      completed INTEGER DEFAULT 0,
+                      expires_at TIMESTAMP,
+                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                      FOREIGN KEY (user_id) REFERENCES users (id))''')
+    
+        # Favorites table
+        c.execute('''CREATE TABLE IF NOT EXISTS favorites
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      user_id INTEGER NOT NULL,
+                      product_id INTEGER NOT NULL,
+                      added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                      FOREIGN KEY (user_id) REFERENCES users (id),
+                      FOREIGN KEY (product_id) REFERENCES products (id))''')
+    
+        # Push subscriptions table
+        c.execute('''CREATE TABLE IF NOT EXISTS push_subscriptions
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      user_id INTEGER,
+                      endpoint TEXT UNIQUE NOT NULL,
+                      p256dh TEXT NOT NULL,
+                      auth TEXT NOT NULL,
+                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                      FOREIGN KEY (user_id) REFERENCES users (id))''')
+    
+        # Price changes tracking for in-app notifications
+        c.execute('''CREATE TABLE IF NOT EXISTS price_changes
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      product_id INTEGER NOT NULL,
+                      product_name TEXT NOT NULL,
+                      old_price REAL NOT NULL,
+                      new_price REAL NOT NULL,
+                      changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                      notified INTEGER DEFAULT 0,
+                      FOREIGN KEY (product_id) REFERENCES products (id))''')
+    
+        # Shop customization settings table
+        c.execute('''CREATE TABLE IF NOT EXISTS settings
+                     (id INTEGER PRIMARY KEY CHECK (id = 1),
+                      primary_color TEXT DEFAULT '#2FA44F',
+                      secondary_color TEXT DEFAULT '#3A6FD8',
+                      gradient_start TEXT DEFAULT '#4CAF50',
+                      gradient_end TEXT DEFAULT '#45a049',
+                      gradient_angle INTEGER DEFAULT 135,
+                      shop_name TEXT DEFAULT 'Glengala Fresh',
+                      shop_description TEXT,
+                      contact_phone TEXT,
+                      contact_email TEXT,
+                      customization_json TEXT,
+                      updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    
+        # Catalog change log for delta sync
+        catalog_sync.create_schema(c)
+    
+        # Normalised order line items and trending counters
+        order_items.create_schema(c)
+    
+        # Per-customer counters and earned achievements
+        achievements.create_schema(c)
+    
+        # Daily sales rollups for /api/admin/reports
+        reports.create_schema(c)
+    
+        # Change stamps that keep other workers' caches in step
+        cache_coherence.create_schema(c)
+    
+        # Push notification dispatch queue
+        push_dispatch.create_schema(c)
+    
+        # Idempotency keys for order retries and offline replays
+        idempotency.create_schema(c)
+    
+        # Full-text product search, kept in sync by triggers
+        search.create_schema(c)
+        search.ensure_index(c)
+    
+        # Add customization_json column if it doesn't exist (migration)
+        try:
+            c.execute('ALTER TABLE settings ADD COLUMN customization_json TEXT')
+        except:
+            pass  # Column already exists)
+    
+        # Insert default settings if not exists
+        c.execute('INSERT OR IGNORE INTO settings (id) VALUES (1)')
+    
+        conn.commit()
+    
+        # Versioned schema changes (indexes etc.)
+        migrations.migrate(conn)
+    
+        # Backfill line items for orders placed before order_items existed
+        backfilled = order_items.backfill(conn)
+        if backfilled:
+            log.info('Backfilled line items for %d orders', backfilled)
+    
+        # Customer stats for orders placed before user_stats existed
+        backfilled = achievements.backfill(conn)
+        if backfilled:
+            log.info('Built achievement stats for %d customers', backfilled)
     
-    # Insert default settings if not exists
-    c.execute('INSERT OR IGNORE INTO settings (id) VALUES (1)')
+        # Sales rollups for orders placed before the report tables existed
+        backfilled = reports.backfill(conn)
+        if backfilled:
+            log.info('Rolled up sales for %d orders', backfilled)
     
-    conn.commit()
-    conn.close()
+        # Move any inline base64 photos into the image store
+        migrated = images.migrate_base64_photos(conn)
+        if migrated:
+            log.info('Moved %d product photos into %s', len(migrated), images.IMAGE_DIR)
+    
+        # Flag any hot query that full-scans a large table
+        query_plans.report(conn)
+
+# Hot queries for the startup plan check - keep in step with the routes below
+query_plans.register('get_products', 'SELECT * FROM products WHERE active = 1 ORDER BY category, name')
+query_plans.register('get_product', 'SELECT * FROM products WHERE id = ?', (1,))
+query_plans.register('get_daily_specials', '''SELECT p.*, ds.discount_percent
+    FROM products p JOIN daily_specials ds ON p.id = ds.product_id
+    WHERE ds.special_date = ? AND ds.active = 1''', ('2024-01-01',))
+query_plans.register('register_user', 'SELECT * FROM users WHERE phone = ?', ('0400000000',))
+query_plans.register('get_user', achievements.PROFILE_SQL, (1,))
+query_plans.register('get_user.challenges', '''SELECT * FROM challenges
+    WHERE user_id = ? AND completed = 0 AND expires_at > datetime('now')''', (1,))
+query_plans.register('get_user.favorites', '''SELECT p.* FROM products p
+    JOIN favorites f ON p.id = f.product_id WHERE f.user_id = ?''', (1,))
+query_plans.register('remove_favorite', 'DELETE FROM favorites WHERE user_id = ? AND product_id = ?', (1, 1))
+query_plans.register('create_order.user', orders.USER_UPDATE, (1, 1))
+query_plans.register('create_order.idempotency', '''SELECT fingerprint, response, created_at
+    FROM idempotency_keys WHERE key = ?''', ('key',))
+query_plans.register('get_trending', order_items.trending_sql('p.*'))
+query_plans.register('get_product_changes', '''SELECT DISTINCT product_id FROM catalog_changes
+    WHERE version > ? AND version <= ?''', (0, 1))
+query_plans.register('get_price_changes', '''SELECT pc.*, p.photo, p.category, p.unit
+    FROM price_changes pc JOIN products p ON pc.product_id = p.id
+    WHERE pc.changed_at > ? ORDER BY pc.changed_at DESC LIMIT 50''', ('2024-01-01',))
+query_plans.register('send_price_notifications', '''SELECT * FROM price_changes
+    WHERE notified = 0 ORDER BY changed_at DESC''')
+query_plans.register('sales_report.products', '''SELECT s.product_id, SUM(s.revenue) AS revenue
+    FROM sales_product_daily s WHERE s.day BETWEEN ? AND ?
+    GROUP BY s.product_id ORDER BY revenue DESC LIMIT 20''', ('2024-01-01', '2024-12-31'))
+
+# Request metrics: per-route timing plus the SQL each request ran
+
+@app.before_request
+def start_request_metrics():
+    rule = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.begin_request(request.method, rule)
+
+@app.after_request
+def finish_request_metrics(response):
+    stats = metrics.end_request(response.status_code)
+    if stats is not None:
+        response.headers['Server-Timing'] = (
+            f'app;dur={stats.elapsed * 1000:.2f}, '
+            f'db;dur={stats.sql_seconds * 1000:.2f};desc="{stats.statements} queries"')
+    return response
+
+@app.teardown_request
+def discard_request_metrics(exc=None):
+    # after_request doesn't run if the response itself failed
+    metrics.end_request(500)
+
+# Admission control: which class each route's requests belong to (admission.py).
+# Anything not listed is a read if it's a GET and a write otherwise.
+ROUTE_CLASSES = {
+    '/api/order': 'order',
+    '/api/orders/batch': 'order',
+    '/api/cart/quote': 'order',
+    # What the shop checks on a timer
+    '/api/products/changes': 'poll',
+    '/api/price-changes': 'poll',
+    '/api/mark-changes-seen': 'poll',
+    '/api/push/status': 'poll',
+    # Never queued: pages and assets come from memory, the stream has its own
+    # limit and metrics must answer when things are at their worst
+    '/': None,
+    '/<path:filename>': None,
+    '/api/images/<name>': None,
+    '/api/stream': None,
+    '/api/metrics': None,
+    '/api/mock-push/<token>': None,
+    '/api/mock-push': None,
+}
+
+def classify_request():
+    if request.url_rule is None:
+        return None
+    rule = request.url_rule.rule
+    if rule in ROUTE_CLASSES:
+        return ROUTE_CLASSES[rule]
+    return 'read' if request.method in ('GET', 'HEAD') else 'write'
+
+@app.before_request
+def admit_request():
+    if not admission_control.ENABLED:
+        return
+    request_class = classify_request()
+    if request_class is None:
+        return
+    # Behind a proxy, ProxyFix (TRUSTED_PROXY_HOPS) has already put the client's address here
+    client = request.remote_addr
+    g.admission_ticket = admission.admit(request_class, client)
+
+@app.before_request
+def sync_caches():
+    # Writes other workers have committed, before this request reads a cache
+    coherence.check()
+
+@app.teardown_request
+def release_request(exc=None):
+    ticket = g.pop('admission_ticket', None)
+    if ticket is not None:
+        admission.release(ticket)
 
 # API Routes
 
+@app.errorhandler(WriterBusy)
+def writer_busy(e):
+    """Write queue backed up - ask the client to retry shortly"""
+    response = jsonify({'success': False, 'error': 'Server busy, please retry'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '2'
+    return response
+
+@app.errorhandler(Rejected)
+def request_rejected(e):
+    """Over this client's rate, or the server is too busy for this class of request"""
+    error = 'Too many requests' if e.reason == 'rate' else 'Server busy, please retry'
+    response = jsonify({'success': False, 'error': error})
+    response.status_code = e.status
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+def load_catalog(columns=product_views.COLUMNS):
+    """Build the public catalog payload (only runs after a product write)"""
+    with pool.connection() as conn:
+        c = conn.cursor()
+        # Read the version first: a write landing in between only makes the
+        # products newer than the version, and deltas are idempotent
+        version = catalog_sync.current_version(c)
+        updated_at = catalog_sync.changed_at(c, version)
+        c.execute(f'''SELECT {product_views.select_list(columns, alias=None)}
+                      FROM products WHERE active = 1 ORDER BY category, name''')
+        products = [dict(row) for row in c.fetchall()]
+    
+    log.debug('Rebuilt catalog: %d products at version %s', len(products), version)
+    # Nothing here depends on when or where it was built, so every worker
+    # serves the same bytes (and ETag) for the same version
+    return {'products': products, 'version': version, 'updated_at': updated_at}
+
+# Pre-serialised catalog per view, invalidated by every product write route
+catalog_caches = {
+    view: VersionedCache(f'catalog:{view}', lambda columns=columns: load_catalog(columns))
+    for view, columns in product_views.VIEWS.items()
+}
+
+def load_price_table():
+    with pool.connection() as conn:
+        return quote.load_table(conn)
+
+# Compiled price table for /api/cart/quote and create_order
+price_book = quote.PriceBook(load_price_table)
+
+# Ranked product search with an LRU of recent queries
+product_search = search.ProductSearch(pool.connection)
+
+def invalidate_catalog():
+    for cache in catalog_caches.values():
+        cache.invalidate()
+    price_book.invalidate()
+    product_search.invalidate()
+    # Trending rows, specials and price changes embed product columns too
+    invalidate_trending()
+    for cache in specials_caches.values():
+        cache.invalidate()
+    price_changes_cache.invalidate()
+
 @app.route('/api/products', methods=['GET'])
 def get_products():
-    """Get all active products with live prices"""
-    print(f"Fetching products from DB")
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    
-    c.execute('''SELECT * FROM products WHERE active = 1 ORDER BY category, name''')
-    products = [dict(row) for row in c.fetchall()]
-    
-    print(f"Returning {len(products)} products, first product unit: {products[0]['unit'] if products else 'none'}")
-    conn.close()
-    return jsonify({'products': products, 'updated_at': datetime.now().isoformat()})
+    """Get all active products with live prices (?view=list|detail|admin or ?fields=)"""
+    try:
+        view, columns = product_views.resolve(request.args)
+    except ViewError as e:
+        return jsonify({'error': str(e)}), 400
+    if view is None:
+        # Ad-hoc field lists are not cached
+        return jsonify(load_catalog(columns))
+    return snapshot_response(catalog_caches[view].get())
 
-@app.route('/api/settings', methods=['GET'])
-def get_settings():
-    """Get shop customization settings"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    
-    c.execute('SELECT * FROM settings WHERE id = 1')
-    settings = c.fetchone()
-    conn.close()
+@app.route('/api/products/changes', methods=['GET'])
+def get_product_changes():
+    """Products changed since a catalog version (falls back to the full catalog)"""
+    since = request.args.get('since', type=int)
+    if since is None:
+        return jsonify({'error': 'since parameter required'}), 400
+    try:
+        view, columns = product_views.resolve(request.args)
+    except ViewError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Hand the connection back before any fallback - the snapshot loaders
+    # borrow their own, and holding two per request can starve the pool
+    with pool.connection() as conn:
+        changes = catalog_sync.changes_since(conn.cursor(), since, columns)
+    if changes is None:
+        # Too far behind - the cached full snapshot is the cheapest answer
+        if view is None:
+            return jsonify(load_catalog(columns))
+        return snapshot_response(catalog_caches[view].get())
+    return jsonify(changes)
+
+@app.route('/api/search', methods=['GET'])
+def search_products():
+    """Ranked, typo-tolerant product search (?q=, ?limit=, ?view= or ?fields=)"""
+    query = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', search.DEFAULT_RESULTS, type=int), 1),
+                search.MAX_RESULTS)
+    try:
+        view, columns = product_views.resolve(request.args, default='list')
+    except ViewError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(product_search.search(query, columns, limit))
+
+def load_settings():
+    """Build the settings document: stored columns merged with customization_json"""
+    with pool.connection() as conn:
+        c = conn.cursor()
+        c.execute('SELECT * FROM settings WHERE id = 1')
+        settings = c.fetchone()
     if settings:
         result = dict(settings)
         # Parse customization_json if it exists
@@ -184,6 +473,9 @@ def get_settings():
                 result.update(full_settings)
             except:
                 pass
+        # Already merged in; the stored counter wins over any saved copy of it
+        result.pop('customization_json', None)
+        result['version'] = settings['version']
         # Ensure shopHeader is present and complete
         if 'shopHeader' not in result or not result.get('shopHeader'):
             result['shopHeader'] = {
@@ -202,10 +494,10 @@ def get_settings():
                 'backgroundColor': '#f6fdf7',
                 'textColor': '#1f4d2c'
             }
-        return jsonify(result)
+        return result
     else:
         # Return defaults if no settings exist
-        return jsonify({
+        return {
             'id': 1,
             'primary_color': '#2FA44F',
             'secondary_color': '#3A6FD8',
@@ -216,6 +508,7 @@ def get_settings():
             'shop_description': None,
             'contact_phone': None,
             'contact_email': None,
+            'version': 0,
             'shopHeader': {
                 'backgroundType': 'default',
                 'backgroundColor': '#000000',
@@ -229,19 +522,31 @@ def get_settings():
                 'backgroundColor': '#f6fdf7',
                 'textColor': '#1f4d2c'
             }
-        })
+        }
+
+# Merged settings document, rebuilt by update_settings (and on other workers
+# when they see the 'settings' topic move)
+settings_cache = VersionedCache('settings', load_settings)
+
+@app.route('/api/settings', methods=['GET'])
+def get_settings():
+    """Get shop customization settings"""
+    return snapshot_response(settings_cache.get())
 
 @app.route('/api/products/<int:product_id>', methods=['GET'])
 def get_product(product_id):
     """Get single product"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    try:
+        view, columns = product_views.resolve(request.args)
+    except ViewError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    conn = get_db()
     c = conn.cursor()
     
-    c.execute('SELECT * FROM products WHERE id = ?', (product_id,))
+    c.execute(f'SELECT {product_views.select_list(columns, alias=None)} FROM products WHERE id = ?', (product_id,))
     product = c.fetchone()
     
-    conn.close()
     if product:
         return jsonify(dict(product))
     return jsonify({'error': 'Product not found'}), 404
@@ -250,40 +555,45 @@ def get_product(product_id):
 def update_settings():
     """Update shop customization settings"""
     data = request.json
-    print(f"Saving settings: {data}")
-    
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    log.debug('Saving settings: %s', data)
     
-    # Store the full settings object as JSON
+    # Store the full settings object as JSON (less what the document adds itself)
+    data = {key: value for key, value in data.items() if key not in ('version', 'customization_json')}
     customization_json = json.dumps(data)
     
-    c.execute('''UPDATE settings SET
-                 primary_color = ?,
-                 secondary_color = ?,
-                 gradient_start = ?,
-                 gradient_end = ?,
-                 gradient_angle = ?,
-                 shop_name = ?,
-                 shop_description = ?,
-                 contact_phone = ?,
-                 contact_email = ?,
-                 customization_json = ?,
-                 updated_at = CURRENT_TIMESTAMP
-                 WHERE id = 1''',
-              (data.get('primary_color', '#2FA44F'),
-               data.get('secondary_color', '#3A6FD8'),
-               data.get('gradient_start', '#4CAF50'),
-               data.get('gradient_end', '#45a049'),
-               data.get('gradient_angle', 135),
-               data.get('shop_name', 'Glengala Fresh'),
-               data.get('shop_description'),
-               data.get('contact_phone'),
-               data.get('contact_email'),
-               customization_json))
-    
-    conn.commit()
-    conn.close()
+    def save(c):
+        c.execute('''UPDATE settings SET
+                     primary_color = ?,
+                     secondary_color = ?,
+                     gradient_start = ?,
+                     gradient_end = ?,
+                     gradient_angle = ?,
+                     shop_name = ?,
+                     shop_description = ?,
+                     contact_phone = ?,
+                     contact_email = ?,
+                     customization_json = ?,
+                     version = version + 1,
+                     updated_at = CURRENT_TIMESTAMP
+                     WHERE id = 1''',
+                  (data.get('primary_color', '#2FA44F'),
+                   data.get('secondary_color', '#3A6FD8'),
+                   data.get('gradient_start', '#4CAF50'),
+                   data.get('gradient_end', '#45a049'),
+                   data.get('gradient_angle', 135),
+                   data.get('shop_name', 'Glengala Fresh'),
+                   data.get('shop_description'),
+                   data.get('contact_phone'),
+                   data.get('contact_email'),
+                   customization_json))
+        coherence.bump(c, 'settings')
+    
+    writer.run(save)
+    settings_cache.invalidate()
+    # Build the new document now rather than on the next page load
+    settings_cache.get()
+    
+    bus.publish('settings', {'updated_at': datetime.now().isoformat()})
     
     return jsonify({'success': True, 'message': 'Settings updated successfully'})
 
@@ -292,50 +602,62 @@ def update_product(product_id):
     """Update product (admin only - add auth in production)"""
     try:
         data = request.json
-        print(f"Updating product {product_id} with data: {data}")
+        log.debug('Updating product %s with data: %s', product_id, data)
         
         if not data:
             return jsonify({'success': False, 'error': 'No data provided'}), 400
         
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        
-        # Get old price and name for tracking
-        c.execute('SELECT name, price FROM products WHERE id = ?', (product_id,))
-        old_product = c.fetchone()
-        old_price = old_product[1] if old_product else None
-        product_name = old_product[0] if old_product else 'Unknown'
-        
-        # Update all fields that can be changed
-        c.execute('''UPDATE products SET 
-                     name = ?, category = ?, price = ?, unit = ?, 
-                     active = ?, photo = ?, hasSpecial = ?, specialPrice = ?,
-                     specialQuantity = ?, specialUnit = ?, isPremium = ?, isOrganic = ?,
-                     stock = ?, mostPopular = ?, popularOrder = ?,
-                     updated_at = CURRENT_TIMESTAMP
-                     WHERE id = ?''',
-                  (data.get('name'), data.get('category'), data.get('price'), data.get('unit'),
-                   data.get('active', 1), data.get('photo', ''), 
-                   data.get('hasSpecial', 0), data.get('specialPrice', 0),
-                   data.get('specialQuantity', 0), data.get('specialUnit', ''),
-                   data.get('isPremium', 0), data.get('isOrganic', 0),
-                   data.get('stock', 999), data.get('mostPopular', 0), data.get('popularOrder', 0),
-                   product_id))
+        try:
+            photo = images.normalize_photo(data.get('photo', ''))
+        except ImageError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         
-        # Track price changes for in-app notifications
         new_price = data.get('price')
-        price_changed = old_price and new_price and float(old_price) != float(new_price)
         
-        if price_changed:
-            c.execute('''INSERT INTO price_changes 
-                         (product_id, product_name, old_price, new_price, changed_at, notified)
-                         VALUES (?, ?, ?, ?, ?, 0)''',
-                      (product_id, product_name, old_price, new_price, datetime.now().isoformat()))
+        def save(c):
+            # Get old price and name for tracking
+            c.execute('SELECT name, price FROM products WHERE id = ?', (product_id,))
+            old_product = c.fetchone()
+            old_price = old_product[1] if old_product else None
+            product_name = old_product[0] if old_product else 'Unknown'
+            
+            # Update all fields that can be changed
+            c.execute('''UPDATE products SET 
+                         name = ?, category = ?, price = ?, unit = ?, 
+                         active = ?, photo = ?, hasSpecial = ?, specialPrice = ?,
+                         specialQuantity = ?, specialUnit = ?, isPremium = ?, isOrganic = ?,
+                         stock = ?, mostPopular = ?, popularOrder = ?,
+                         updated_at = CURRENT_TIMESTAMP
+                         WHERE id = ?''',
+                      (data.get('name'), data.get('category'), data.get('price'), data.get('unit'),
+                       data.get('active', 1), photo, 
+                       data.get('hasSpecial', 0), data.get('specialPrice', 0),
+                       data.get('specialQuantity', 0), data.get('specialUnit', ''),
+                       data.get('isPremium', 0), data.get('isOrganic', 0),
+                       data.get('stock', 999), data.get('mostPopular', 0), data.get('popularOrder', 0),
+                       product_id))
+            
+            # Track price changes for in-app notifications
+            price_changed = old_price and new_price and float(old_price) != float(new_price)
+            
+            if price_changed:
+                c.execute('''INSERT INTO price_changes 
+                             (product_id, product_name, old_price, new_price, changed_at, notified)
+                             VALUES (?, ?, ?, ?, ?, 0)''',
+                          (product_id, product_name, old_price, new_price,
+                           datetime.now(timezone.utc).strftime(SQLITE_TIME)))
+            
+            version = catalog_sync.record_changes(c, [product_id])
+            return old_price, product_name, price_changed, version
         
-        conn.commit()
-        conn.close()
+        old_price, product_name, price_changed, version = writer.run(save)
+        invalidate_catalog()
+        bus.publish('catalog', {'version': version, 'ids': [product_id]})
+        if price_changed:
+            bus.publish('price', {'product_id': product_id, 'product_name': product_name,
+                                  'old_price': old_price, 'new_price': new_price})
         
-        print(f"Product {product_id} updated successfully")
+        log.info('Product %s updated', product_id)
         return jsonify({
             'success': True, 
             'updated_at': datetime.now().isoformat(),
@@ -344,109 +666,184 @@ def update_product(product_id):
             'new_price': new_price
         })
     except Exception as e:
-        print(f"ERROR updating product {product_id}: {str(e)}")
-        print(f"Error type: {type(e).__name__}")
-        import traceback
-        traceback.print_exc()
+        log.exception('Updating product %s failed', product_id)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/products', methods=['POST'])
 def create_product():
     """Create new product (admin only)"""
     data = request.json
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    try:
+        photo = images.normalize_photo(data.get('photo', ''))
+    except ImageError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    def save(c):
+        c.execute('''INSERT INTO products 
+                     (name, category, price, unit, active, photo, hasSpecial, specialPrice,
+                      specialQuantity, specialUnit, isPremium, isOrganic, stock, mostPopular, popularOrder)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                  (data.get('name', 'New Product'), data.get('category', 'vegetables'), 
+                   data.get('price', 0), data.get('unit', 'kg'),
+                   data.get('active', 1), photo, 
+                   data.get('hasSpecial', 0), data.get('specialPrice', 0),
+                   data.get('specialQuantity', 0), data.get('specialUnit', ''),
+                   data.get('isPremium', 0), data.get('isOrganic', 0),
+                   data.get('stock', 999), data.get('mostPopular', 0), data.get('popularOrder', 0)))
+        product_id = c.lastrowid
+        return product_id, catalog_sync.record_changes(c, [product_id])
     
-    c.execute('''INSERT INTO products 
-                 (name, category, price, unit, active, photo, hasSpecial, specialPrice,
-                  specialQuantity, specialUnit, isPremium, isOrganic, stock, mostPopular, popularOrder)
-                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-              (data.get('name', 'New Product'), data.get('category', 'vegetables'), 
-               data.get('price', 0), data.get('unit', 'kg'),
-               data.get('active', 1), data.get('photo', ''), 
-               data.get('hasSpecial', 0), data.get('specialPrice', 0),
-               data.get('specialQuantity', 0), data.get('specialUnit', ''),
-               data.get('isPremium', 0), data.get('isOrganic', 0),
-               data.get('stock', 999), data.get('mostPopular', 0), data.get('popularOrder', 0)))
-    
-    product_id = c.lastrowid
-    conn.commit()
-    conn.close()
+    product_id, version = writer.run(save)
+    invalidate_catalog()
+    bus.publish('catalog', {'version': version, 'ids': [product_id]})
     
     return jsonify({'success': True, 'product_id': product_id, 'message': 'Product created successfully'})
 
 @app.route('/api/products/<int:product_id>', methods=['DELETE'])
 def delete_product(product_id):
     """Delete product (admin only)"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute('DELETE FROM products WHERE id = ?', (product_id,))
+    def delete(c):
+        c.execute('DELETE FROM products WHERE id = ?', (product_id,))
+        return catalog_sync.record_changes(c, [product_id])
     
-    conn.commit()
-    conn.close()
+    version = writer.run(delete)
+    invalidate_catalog()
+    bus.publish('catalog', {'version': version, 'ids': [product_id]})
     
     return jsonify({'success': True, 'message': 'Product deleted successfully'})
 
+def publish_bulk_changes(summary):
+    """Tell connected shops about a bulk save (one catalog event, one per price)"""
+    bus.publish('catalog', {'version': summary['version'],
+                            'ids': [change['id'] for change in summary['changes']]})
+    for change in summary['changes']:
+        if 'price' in change['fields']:
+            old_price, new_price = change['fields']['price']
+            bus.publish('price', {'product_id': change['id'], 'product_name': change['name'],
+                                  'old_price': old_price, 'new_price': new_price})
+
 @app.route('/api/products/bulk', methods=['POST'])
 def bulk_update_products():
     """Bulk update all products (admin only)"""
-    data = request.json
-    products = data.get('products', [])
-    print(f"Bulk updating {len(products)} products")
-    
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    updated_count = 0
-    for product in products:
-        product_id = product.get('id')
-        if product_id:
-            print(f"Updating product {product_id}: {product.get('name')} - unit: {product.get('unit')}")
-            c.execute('''UPDATE products SET 
-                         name = ?, category = ?, price = ?, unit = ?, 
-                         active = ?, photo = ?, hasSpecial = ?, specialPrice = ?,
-                         specialQuantity = ?, specialUnit = ?, isPremium = ?, isOrganic = ?,
-                         stock = ?, mostPopular = ?, popularOrder = ?,
-                         updated_at = CURRENT_TIMESTAMP
-                         WHERE id = ?''',
-                      (product.get('name'), product.get('category'), product.get('price'), product.get('unit'),
-                       product.get('active', 1), product.get('photo', ''), 
-                       product.get('hasSpecial', 0), product.get('specialPrice', 0),
-                       product.get('specialQuantity', 0), product.get('specialUnit', ''),
-                       product.get('isPremium', 0), product.get('isOrganic', 0),
-                       product.get('stock', 999), product.get('mostPopular', 0), product.get('popularOrder', 0),
-                       product_id))
-            updated_count += 1
-    
-    conn.commit()
-    conn.close()
-    
-    print(f"Bulk update completed: {updated_count} products updated")
-    return jsonify({'success': True, 'updated_count': updated_count, 'message': f'{updated_count} products updated successfully'})
+    data = request.json or {}
+    try:
+        rows = bulk_update.validate(data.get('products', []), bulk_update.CATALOG_FIELDS)
+    except bulk_update.BulkValidationError as e:
+        return jsonify({'success': False, 'error': str(e), 'errors': e.errors}), 400
+    
+    summary = writer.run(bulk_update.apply, rows, bulk_update.CATALOG_FIELDS)
+    if summary['updated_count']:
+        invalidate_catalog()
+        publish_bulk_changes(summary)
+    
+    log.info('Bulk update completed: %d changed, %d unchanged',
+             summary['updated_count'], summary['unchanged_count'])
+    return jsonify(dict(summary, success=True,
+                        message=f"{summary['updated_count']} products updated successfully"))
+
+@app.route('/api/admin/import', methods=['POST'])
+def import_products():
+    """Import a product file: products-data.js, an admin CSV/JSON export or NDJSON (admin only)
+
+    Multipart 'file' upload or a raw body (?format=...). ?dry_run=1 only
+    reports the diff; ?strict=1 rejects the file if any row is invalid.
+    """
+    upload = request.files.get('file')
+    fmt = request.args.get('format')
+    dry_run = request.args.get('dry_run') in ('1', 'true')
+    strict = request.args.get('strict') in ('1', 'true')
+    try:
+        fmt = fmt or importer.detect_format(upload.filename if upload else None)
+        if upload:
+            stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        else:
+            stream = io.StringIO(request.get_data(as_text=True), newline='')
+        errors = []
+        entries = list(importer.normalise(importer.records(stream, fmt), errors))
+    except (ImportFileError, UnicodeDecodeError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    if errors and strict:
+        return jsonify({'success': False, 'error': f'{len(errors)} invalid row(s)',
+                        'errors': errors[:importer.MAX_REPORTED]}), 400
+    if dry_run:
+        summary = importer.apply(get_db().cursor(), entries, dry_run=True)
+    else:
+        summary = writer.run(importer.apply, entries)
+    importer.add_errors(summary, errors)
+    changed_ids = summary.pop('ids')
+    if changed_ids:
+        invalidate_catalog()
+        # Past MAX_DELTA_PRODUCTS clients reload the whole catalog anyway
+        bus.publish('catalog', {'version': summary['version'],
+                                'ids': changed_ids[:catalog_sync.MAX_DELTA_PRODUCTS]})
+        log.info('Import completed: %d new, %d changed, %d invalid',
+                 summary['inserted'], summary['updated'], summary['invalid'])
+    return jsonify(dict(summary, success=True))
+
+@app.route('/api/images', methods=['POST'])
+def upload_image():
+    """Store a product photo and return its URL (admin only)"""
+    try:
+        if 'photo' in request.files:
+            url = images.store_image(request.files['photo'].read())
+        else:
+            data = request.get_json(silent=True) or {}
+            raw = images.decode_data_url(data.get('photo', ''))
+            if raw is None:
+                return jsonify({'success': False, 'error': 'No photo provided'}), 400
+            url = images.store_image(raw)
+    except ImageError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    return jsonify({'success': True, 'url': url, 'thumb_url': images.thumb_url(url)})
+
+@app.route('/api/images/<name>', methods=['GET'])
+def get_image(name):
+    """Serve a stored photo - names are content hashes, so cache forever"""
+    path = images.image_path(name)
+    if not path:
+        return jsonify({'error': 'Image not found'}), 404
+    response = send_file(path, conditional=True, etag=name.split('.')[0])
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+def load_daily_specials(columns=product_views.COLUMNS):
+    """Today's specials with the given product columns"""
+    with pool.connection() as conn:
+        c = conn.cursor()
+        today = datetime.now().date()
+        c.execute(f'''SELECT {product_views.select_list(columns)}, ds.discount_percent 
+                     FROM products p
+                     JOIN daily_specials ds ON p.id = ds.product_id
+                     WHERE ds.special_date = ? AND ds.active = 1''', (today,))
+        specials = [dict(row) for row in c.fetchall()]
+    return {'specials': specials}
+
+# Specials per view; they embed product columns (invalidated with the catalog)
+# and change with the date, hence the max age
+specials_caches = {
+    view: VersionedCache(f'specials:{view}', lambda columns=columns: load_daily_specials(columns),
+                         max_age=60)
+    for view, columns in product_views.VIEWS.items()
+}
 
 @app.route('/api/daily-specials', methods=['GET'])
 def get_daily_specials():
     """Get today's special offers"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    
-    today = datetime.now().date()
-    c.execute('''SELECT p.*, ds.discount_percent 
-                 FROM products p
-                 JOIN daily_specials ds ON p.id = ds.product_id
-                 WHERE ds.special_date = ? AND ds.active = 1''', (today,))
-    specials = [dict(row) for row in c.fetchall()]
-    
-    conn.close()
-    return jsonify({'specials': specials})
+    try:
+        view, columns = product_views.resolve(request.args)
+    except ViewError as e:
+        return jsonify({'error': str(e)}), 400
+    if view is None:
+        return jsonify(load_daily_specials(columns))
+    return snapshot_response(specials_caches[view].get())
 
 @app.route('/api/user/register', methods=['POST'])
 def register_user():
     """Register or get existing user"""
     data = request.json
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_db()
     c = conn.cursor()
     
     # Check if user exists
@@ -456,29 +853,31 @@ def register_user():
     if user:
         return jsonify({'user_id': user[0], 'existing': True})
     
-    # Create new user
-    c.execute('''INSERT INTO users (name, phone, address, postcode)
-                 VALUES (?, ?, ?, ?)''',
-              (data['name'], data['phone'], data.get('address', ''), data.get('postcode', '')))
-    conn.commit()
-    user_id = c.lastrowid
-    conn.close()
+    # Create new user (a concurrent registration may have beaten us to it)
+    def register(c):
+        c.execute('SELECT id FROM users WHERE phone = ?', (data['phone'],))
+        existing = c.fetchone()
+        if existing:
+            return existing[0], True
+        c.execute('''INSERT INTO users (name, phone, address, postcode)
+                     VALUES (?, ?, ?, ?)''',
+                  (data['name'], data['phone'], data.get('address', ''), data.get('postcode', '')))
+        return c.lastrowid, False
+    
+    user_id, existing = writer.run(register)
+    if existing:
+        return jsonify({'user_id': user_id, 'existing': True})
     
     return jsonify({'user_id': user_id, 'existing': False, 'loyalty_points': 0})
 
-@app.route('/api/user/<int:user_id>', methods=['GET'])
-def get_user(user_id):
-    """Get user profile with gamification stats"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    
-    c.execute('SELECT * FROM users WHERE id = ?', (user_id,))
+def load_user_profile(c, user_id, columns):
+    """Profile, stats, achievements, challenges and favorites (None if no such user)"""
+    # User row, achievement counters and earned achievements in one lookup
+    c.execute(achievements.PROFILE_SQL, (user_id,))
     user = c.fetchone()
     
     if not user:
-        conn.close()
-        return jsonify({'error': 'User not found'}), 404
+        return None
     
     # Get active challenges
     c.execute('''SELECT * FROM challenges 
@@ -487,140 +886,328 @@ def get_user(user_id):
     challenges = [dict(row) for row in c.fetchall()]
     
     # Get favorites
-    c.execute('''SELECT p.* FROM products p
+    c.execute(f'''SELECT {product_views.select_list(columns)} FROM products p
                  JOIN favorites f ON p.id = f.product_id
                  WHERE f.user_id = ?''', (user_id,))
     favorites = [dict(row) for row in c.fetchall()]
     
-    conn.close()
     
-    user_data = dict(user)
+    user_data = achievements.profile(user)
     user_data['challenges'] = challenges
     user_data['favorites'] = favorites
+    return user_data
+
+@app.route('/api/user/<int:user_id>', methods=['GET'])
+def get_user(user_id):
+    """Get user profile with gamification stats"""
+    try:
+        view, columns = product_views.resolve(request.args)
+    except ViewError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    user_data = load_user_profile(get_db().cursor(), user_id, columns)
+    if user_data is None:
+        return jsonify({'error': 'User not found'}), 404
     
     return jsonify(user_data)
 
+@app.route('/api/user/<int:user_id>/achievements/seen', methods=['POST'])
+def mark_achievements_seen(user_id):
+    """Acknowledge unlocks the customer has been shown ({ids: [...]}, or all)"""
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    if ids is not None and not isinstance(ids, list):
+        return jsonify({'success': False, 'error': 'ids must be a list'}), 400
+    
+    marked = writer.run(achievements.mark_seen, user_id, ids)
+    return jsonify({'success': True, 'marked': marked})
+
+# Most orders one /api/orders/batch request may carry
+MAX_ORDER_BATCH = 50
+
+def free_delivery_allowed(cart):
+    """True if the cart claims a free delivery reward its customer still holds"""
+    if not cart.get('free_delivery'):
+        return False
+    try:
+        user_id = int(cart.get('user_id'))
+    except (TypeError, ValueError):
+        # Rewards are counted server-side, so only account customers can spend them
+        return False
+    return achievements.free_deliveries_left(get_db().cursor(), user_id) > 0
+
+def prepare_order(data, key=None):
+    """Price and validate one order; returns (submission, None) or (None, error)"""
+    if not isinstance(data, dict):
+        return None, {'success': False, 'error': 'order must be an object'}
+    # Price the cart ourselves - the client's total is only a display figure
+    try:
+        key = idempotency.normalize_key(key if key is not None else data.get('idempotency_key'))
+        cart_quote = price_book.quote(data, free_delivery_allowed(data))
+    except (QuoteError, IdempotencyError) as e:
+        return None, {'success': False, 'error': str(e)}
+    if cart_quote['errors'] or not cart_quote['items']:
+        return None, {'success': False, 'error': 'Cart could not be priced',
+                      'errors': cart_quote['errors']}
+    if not cart_quote['delivery_available']:
+        return None, {'success': False, 'error': 'Delivery not available for this postcode'}
+    return {
+        'key': key,
+        'fingerprint': orders.request_fingerprint(data),
+        'user_id': data.get('user_id'),
+        'quote': cart_quote,
+        'fulfilment': data.get('fulfilment'),
+        'delivery_time': data.get('delivery_time'),
+    }, None
+
 @app.route('/api/order', methods=['POST'])
 def create_order():
-    """Create new order and update streaks/points"""
+    """Create new order and update streaks/points (send an Idempotency-Key to retry safely)"""
+    submission, error = prepare_order(request.json or {}, request.headers.get('Idempotency-Key'))
+    if error:
+        return jsonify(error), 400
+    
+    result = writer.run(orders.place_orders, [submission])[0]
+    if not result['success']:
+        # Key reused for a different order, or the order couldn't be written (retry)
+        return jsonify(result), 409 if result.get('conflict') else 500
+    if not result.get('replayed'):
+        invalidate_trending()
+    
+    return jsonify(result)
+
+@app.route('/api/orders/batch', methods=['POST'])
+def create_orders_batch():
+    """Place many orders in one transaction (offline queue replay); one result per order"""
+    data = request.json or {}
+    submitted = data.get('orders')
+    if not isinstance(submitted, list):
+        return jsonify({'success': False, 'error': 'orders must be a list'}), 400
+    if len(submitted) > MAX_ORDER_BATCH:
+        return jsonify({'success': False,
+                        'error': f'at most {MAX_ORDER_BATCH} orders per batch'}), 400
+    
+    results = [None] * len(submitted)
+    submissions = []
+    positions = []
+    for index, order in enumerate(submitted):
+        submission, error = prepare_order(order)
+        if error:
+            results[index] = error
+        else:
+            submissions.append(submission)
+            positions.append(index)
+    
+    if submissions:
+        for index, result in zip(positions, writer.run(orders.place_orders, submissions)):
+            results[index] = result
+    
+    placed = sum(1 for result in results if result['success'] and not result.get('replayed'))
+    if placed:
+        invalidate_trending()
+    
+    # Echo the keys so the client can match results to its queue
+    for order, result in zip(submitted, results):
+        if isinstance(order, dict):
+            result['idempotency_key'] = order.get('idempotency_key')
+    return jsonify({'success': True, 'placed': placed, 'results': results})
+
+@app.route('/api/cart/quote', methods=['POST'])
+def quote_cart():
+    """Authoritative cart pricing: one cart, or {"carts": [...]} for a batch"""
     data = request.json
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    # Calculate points (1 point per $1 spent)
-    points_earned = int(data['total'])
-    
-    # Insert order
-    c.execute('''INSERT INTO orders (user_id, items, total, fulfilment, delivery_time, points_earned)
-                 VALUES (?, ?, ?, ?, ?, ?)''',
-              (data.get('user_id'), json.dumps(data['items']), data['total'],
-               data.get('fulfilment'), data.get('delivery_time'), points_earned))
-    order_id = c.lastrowid
-    
-    # Update user stats
-    if data.get('user_id'):
-        c.execute('SELECT last_order_date, current_streak FROM users WHERE id = ?', 
-                  (data['user_id'],))
-        user = c.fetchone()
-        
-        if user:
-            last_order = user[0]
-            current_streak = user[1]
-            
-            # Check streak
-            if last_order:
-                last_date = datetime.strptime(last_order, '%Y-%m-%d').date()
-                today = datetime.now().date()
-                days_diff = (today - last_date).days
-                
-                if days_diff == 1:  # Consecutive day
-                    current_streak += 1
-                elif days_diff > 1:  # Streak broken
-                    current_streak = 1
-            else:
-                current_streak = 1
-            
-            c.execute('''UPDATE users SET 
-                         loyalty_points = loyalty_points + ?,
-                         current_streak = ?,
-                         longest_streak = MAX(longest_streak, ?),
-                         last_order_date = date('now'),
-                         total_orders = total_orders + 1
-                         WHERE id = ?''',
-                      (points_earned, current_streak, current_streak, data['user_id']))
-    
-    conn.commit()
-    conn.close()
-    
-    return jsonify({
-        'success': True,
-        'order_id': order_id,
-        'points_earned': points_earned
-    })
+    try:
+        if isinstance(data, dict) and 'carts' in data:
+            return jsonify({'quotes': price_book.quote_batch(data['carts'])})
+        if not isinstance(data, dict):
+            raise QuoteError('cart must be an object')
+        return jsonify(price_book.quote(data, free_delivery_allowed(data)))
+    except QuoteError as e:
+        return jsonify({'error': str(e)}), 400
+
+def load_trending(columns=product_views.COLUMNS):
+    """Products ordered most in the last 7 days, from the daily counters"""
+    with pool.connection() as conn:
+        c = conn.cursor()
+        c.execute(order_items.trending_sql(product_views.select_list(columns)))
+        trending = [dict(row) for row in c.fetchall()]
+    return {'trending': trending}
+
+# Trending only changes when an order lands (or the 7-day window moves on)
+trending_caches = {
+    view: VersionedCache(f'trending:{view}', lambda columns=columns: load_trending(columns), max_age=600)
+    for view, columns in product_views.VIEWS.items()
+}
+
+def invalidate_trending():
+    for cache in trending_caches.values():
+        cache.invalidate()
 
 @app.route('/api/trending', methods=['GET'])
 def get_trending():
     """Get trending products based on recent orders"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    
-    # Get products ordered most in last 7 days
-    c.execute('''SELECT p.*, COUNT(*) as order_count
-                 FROM products p
-                 JOIN orders o ON json_extract(o.items, '$') LIKE '%"id":' || p.id || '%'
-                 WHERE o.created_at > datetime('now', '-7 days')
-                 GROUP BY p.id
-                 ORDER BY order_count DESC
-                 LIMIT 10''')
-    trending = [dict(row) for row in c.fetchall()]
-    
-    conn.close()
-    return jsonify({'trending': trending})
+    try:
+        view, columns = product_views.resolve(request.args)
+    except ViewError as e:
+        return jsonify({'error': str(e)}), 400
+    if view is None:
+        return jsonify(load_trending(columns))
+    return snapshot_response(trending_caches[view].get())
 
 @app.route('/api/favorites', methods=['POST'])
 def add_favorite():
     """Add product to favorites"""
     data = request.json
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute('INSERT OR IGNORE INTO favorites (user_id, product_id) VALUES (?, ?)',
-              (data['user_id'], data['product_id']))
-    conn.commit()
-    conn.close()
+    writer.run(lambda c: c.execute('INSERT OR IGNORE INTO favorites (user_id, product_id) VALUES (?, ?)',
+                                   (data['user_id'], data['product_id'])))
     
     return jsonify({'success': True})
 
 @app.route('/api/favorites/<int:user_id>/<int:product_id>', methods=['DELETE'])
 def remove_favorite(user_id, product_id):
     """Remove product from favorites"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute('DELETE FROM favorites WHERE user_id = ? AND product_id = ?',
-              (user_id, product_id))
-    conn.commit()
-    conn.close()
+    writer.run(lambda c: c.execute('DELETE FROM favorites WHERE user_id = ? AND product_id = ?',
+                                   (user_id, product_id)))
     
     return jsonify({'success': True})
 
 # Admin route for bulk price updates
 @app.route('/api/admin/bulk-update', methods=['POST'])
-def bulk_update():
-    """Bulk update products (admin only)"""
-    data = request.json
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    for product in data['products']:
-        c.execute('UPDATE products SET price = ?, stock = ? WHERE id = ?',
-                  (product['price'], product.get('stock', 999), product['id']))
+def bulk_update_prices():
+    """Bulk update product prices and stock (admin only)"""
+    data = request.json or {}
+    try:
+        rows = bulk_update.validate(data.get('products', []), bulk_update.PRICE_STOCK_FIELDS)
+    except bulk_update.BulkValidationError as e:
+        return jsonify({'success': False, 'error': str(e), 'errors': e.errors}), 400
     
-    conn.commit()
-    conn.close()
+    summary = writer.run(bulk_update.apply, rows, bulk_update.PRICE_STOCK_FIELDS)
+    if summary['updated_count']:
+        invalidate_catalog()
+        publish_bulk_changes(summary)
     
-    return jsonify({'success': True, 'updated': len(data['products'])})
+    return jsonify(dict(summary, success=True, updated=summary['updated_count']))
+
+# Sales reports (admin only): name -> function(cursor, start, end, args)
+REPORTS = {
+    'summary': lambda c, start, end, args: reports.summary(c, start, end, args.get('group', 'day')),
+    'products': lambda c, start, end, args: reports.products(
+        c, start, end, args.get('sort', 'revenue'),
+        min(max(args.get('limit', 20, type=int), 1), 200), args.get('category')),
+    'categories': lambda c, start, end, args: reports.categories(c, start, end),
+    'heatmap': lambda c, start, end, args: reports.heatmap(c, start, end),
+}
+
+@app.route('/api/admin/reports/<name>', methods=['GET'])
+def sales_report(name):
+    """Sales over ?from=..?to= (YYYY-MM-DD, inclusive) from the daily rollups (admin only)"""
+    report = REPORTS.get(name)
+    if report is None:
+        return jsonify({'error': f"Unknown report '{name}' (use {', '.join(REPORTS)})"}), 404
+    try:
+        start, end = reports.parse_range(request.args)
+        return jsonify(report(get_db().cursor(), start, end, request.args))
+    except ReportError as e:
+        return jsonify({'error': str(e)}), 400
+
+def response_caches():
+    return (list(catalog_caches.values()) + list(trending_caches.values())
+            + list(specials_caches.values()) + [settings_cache, price_changes_cache])
+
+@app.route('/api/admin/db-stats', methods=['GET'])
+def db_stats():
+    """Connection pool and response cache metrics (admin only)"""
+    stats = pool.get_stats()
+    stats['events'] = bus.get_stats()
+    stats['caches'] = {cache.name: cache.get_stats() for cache in response_caches()}
+    stats['price_book'] = price_book.get_stats()
+    stats['search'] = product_search.get_stats()
+    stats['assets'] = asset_store.get_stats()
+    stats['writer'] = writer.get_stats()
+    stats['admission'] = admission.get_stats()
+    stats['coherence'] = coherence.get_stats()
+    stats['slow_queries'] = list(metrics.slow_queries)
+    return jsonify(stats)
+
+def collect_app_metrics():
+    """Pool, cache and writer figures for /api/metrics, read at scrape time"""
+    pool_stats = pool.get_stats()
+    yield ('glengala_db_pool_connections', 'gauge', 'Pooled connections by state',
+           [({'state': 'open'}, pool_stats['open']), ({'state': 'idle'}, pool_stats['idle']),
+            ({'state': 'limit'}, pool_stats['size'])])
+    yield ('glengala_db_pool_acquired_total', 'counter', 'Connections handed out',
+           [({}, pool_stats['acquired'])])
+    yield ('glengala_db_pool_timeouts_total', 'counter', 'Requests that gave up waiting for a connection',
+           [({}, pool_stats['timeouts'])])
+    
+    caches = [(cache.name, cache.get_stats()) for cache in response_caches()]
+    cache_lookups = [({'cache': name, 'result': 'hit'}, stats['hits']) for name, stats in caches]
+    cache_lookups += [({'cache': name, 'result': 'miss'}, stats['rebuilds']) for name, stats in caches]
+    search_stats = product_search.get_stats()
+    cache_lookups += [({'cache': 'search', 'result': 'hit'}, search_stats['hits']),
+                      ({'cache': 'search', 'result': 'miss'}, search_stats['misses'])]
+    price_stats = price_book.get_stats()
+    cache_lookups += [({'cache': 'price_book', 'result': 'hit'},
+                       max(0, price_stats['quotes'] - price_stats['rebuilds'])),
+                      ({'cache': 'price_book', 'result': 'miss'}, price_stats['rebuilds'])]
+    yield ('glengala_cache_lookups_total', 'counter', 'Cache lookups by result', cache_lookups)
+    
+    ratios = {}
+    for labels, value in cache_lookups:
+        hits, total = ratios.get(labels['cache'], (0, 0))
+        ratios[labels['cache']] = (hits + (value if labels['result'] == 'hit' else 0), total + value)
+    yield ('glengala_cache_hit_ratio', 'gauge', 'Share of lookups served from cache',
+           [({'cache': name}, round(hits / total, 4) if total else None)
+            for name, (hits, total) in sorted(ratios.items())])
+    
+    writer_stats = writer.get_stats()
+    yield ('glengala_writer_writes_total', 'counter', 'Writes committed by the writer thread',
+           [({'result': 'ok'}, writer_stats['writes']),
+            ({'result': 'failed'}, writer_stats['failed_writes']),
+            ({'result': 'rejected'}, writer_stats['rejected'])])
+    yield ('glengala_writer_batches_total', 'counter', 'Group commits', [({}, writer_stats['batches'])])
+    yield ('glengala_writer_pending', 'gauge', 'Writes waiting for the writer thread',
+           [({}, writer_stats['pending'])])
+    
+    event_stats = bus.get_stats()
+    yield ('glengala_sse_streams', 'gauge', 'Open live-update streams', [({}, event_stats['streams'])])
+    
+    admission_stats = admission.get_stats()
+    decisions = [({'class': name, 'result': 'admitted'}, count)
+                 for name, count in admission_stats['admitted'].items()]
+    decisions += [({'class': name, 'result': f'rejected_{reason}'}, count)
+                  for name, reasons in admission_stats['rejected'].items()
+                  for reason, count in sorted(reasons.items())]
+    yield ('glengala_admission_requests_total', 'counter', 'Admission decisions by request class',
+           decisions)
+    yield ('glengala_admission_queued_total', 'counter', 'Requests that had to wait for a slot',
+           [({'class': name}, count) for name, count in admission_stats['waited'].items()])
+    coherence_stats = coherence.get_stats()
+    yield ('glengala_coherence_checks_total', 'counter',
+           'Checks for other workers\' writes, and how many found a commit',
+           [({'result': 'unchanged'}, coherence_stats['checks'] - coherence_stats['reads']),
+            ({'result': 'changed'}, coherence_stats['reads'])])
+    yield ('glengala_coherence_invalidations_total', 'counter',
+           'Cache invalidations caused by other workers\' writes',
+           [({'topic': topic}, count) for topic, count in sorted(coherence_stats['handled'].items())])
+    yield ('glengala_admission_in_flight', 'gauge', 'Requests running by class',
+           [({'class': name}, count) for name, count in admission_stats['in_flight'].items()])
+
+metrics.register_collector(collect_app_metrics)
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text-format metrics (admin only)"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/admin/query-plans', methods=['GET'])
+def query_plan_check():
+    """EXPLAIN QUERY PLAN findings for the registered hot queries (admin only)"""
+    conn = get_db()
+    return jsonify({
+        'schema_version': migrations.schema_version(conn),
+        'findings': query_plans.check(conn)
+    })
 
 # Push Notification Routes
 
@@ -631,23 +1218,20 @@ def subscribe_push():
     subscription = data['subscription']
     user_id = data.get('user_id')
     
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
     try:
-        c.execute('''INSERT INTO push_subscriptions (user_id, endpoint, p256dh, auth)
-                     VALUES (?, ?, ?, ?)
-                     ON CONFLICT(endpoint) DO UPDATE SET
-                     user_id = excluded.user_id''',
-                  (user_id, 
-                   subscription['endpoint'],
-                   subscription['keys']['p256dh'],
-                   subscription['keys']['auth']))
-        conn.commit()
-        conn.close()
+        def subscribe(c):
+            c.execute('''INSERT INTO push_subscriptions (user_id, endpoint, p256dh, auth)
+                         VALUES (?, ?, ?, ?)
+                         ON CONFLICT(endpoint) DO UPDATE SET
+                         user_id = excluded.user_id''',
+                      (user_id, 
+                       subscription['endpoint'],
+                       subscription['keys']['p256dh'],
+                       subscription['keys']['auth']))
+        
+        writer.run(subscribe)
         return jsonify({'success': True, 'message': 'Subscribed to notifications'})
     except Exception as e:
-        conn.close()
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/unsubscribe', methods=['POST'])
@@ -656,78 +1240,187 @@ def unsubscribe_push():
     data = request.json
     endpoint = data['endpoint']
     
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute('DELETE FROM push_subscriptions WHERE endpoint = ?', (endpoint,))
-    conn.commit()
-    conn.close()
+    writer.run(lambda c: c.execute('DELETE FROM push_subscriptions WHERE endpoint = ?', (endpoint,)))
     
     return jsonify({'success': True, 'message': 'Unsubscribed from notifications'})
 
 @app.route('/api/send-price-notifications', methods=['POST'])
 def send_price_notifications():
-    """Manually send push notifications for all unnotified price changes (admin only)"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    
-    # Get all unnotified price changes
-    c.execute('''SELECT * FROM price_changes 
-                 WHERE notified = 0 
-                 ORDER BY changed_at DESC''')
-    changes = [dict(row) for row in c.fetchall()]
+    """Queue one push digest per subscriber for all unnotified price changes (admin only)"""
+    batch_id, changes, job_count = writer.run(push_dispatch.enqueue_price_digest)
     
-    if not changes:
-        conn.close()
+    if batch_id is None:
         return jsonify({
             'success': True,
             'message': 'No pending price changes to notify',
             'sent': 0
         })
     
-    # Get all subscriptions
-    c.execute('SELECT * FROM push_subscriptions')
-    subscriptions = [dict(row) for row in c.fetchall()]
-    
-    # Mark all changes as notified
-    c.execute('UPDATE price_changes SET notified = 1 WHERE notified = 0')
-    conn.commit()
-    conn.close()
-    
-    # Note: Actual push sending requires pywebpush library and VAPID keys
-    # TODO: Implement actual push notification sending
+    # Delivery happens in the background dispatcher, not in this request
+    dispatcher.start()
     
     return jsonify({
         'success': True,
-        'message': f'Sent {len(changes)} price update(s) to {len(subscriptions)} subscriber(s)',
+        'message': f'Queued {len(changes)} price update(s) for {job_count} subscriber(s)',
         'changes': changes,
-        'subscribers': len(subscriptions)
+        'subscribers': job_count,
+        'batch_id': batch_id
     })
 
+@app.route('/api/push/status', methods=['GET'])
+def push_status():
+    """Push dispatcher progress and throughput (admin only)"""
+    return jsonify(dispatcher.get_stats(get_db()))
+
+@app.route('/api/mock-push/<token>', methods=['POST'])
+def mock_push_receive(token):
+    """Local stand-in for a browser push service (PUSH_MOCK=1 or debug only)"""
+    if not (app.debug or os.environ.get('PUSH_MOCK')):
+        return jsonify({'error': 'Not found'}), 404
+    status = mock_push.receive(token, request.get_json(silent=True))
+    return jsonify({'status': status}), status
+
+@app.route('/api/mock-push', methods=['GET'])
+def mock_push_received():
+    """Pushes the mock service has accepted (PUSH_MOCK=1 or debug only)"""
+    if not (app.debug or os.environ.get('PUSH_MOCK')):
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify(mock_push.received)
+
+def utc_since(value):
+    """An ISO time from a client (UTC unless it says otherwise) as stored changed_at text"""
+    moment = datetime.fromisoformat(value.strip().replace('Z', '+00:00').replace(' ', 'T'))
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc)
+    return moment.strftime(SQLITE_TIME)
+
+def load_price_changes(since=None):
+    """Price changes after since (default: the last 7 days), newest first"""
+    if not since:
+        since = (datetime.now(timezone.utc) - timedelta(days=7)).strftime(SQLITE_TIME)
+    with pool.connection() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT pc.*, p.photo, p.category, p.unit
+                     FROM price_changes pc
+                     JOIN products p ON pc.product_id = p.id
+                     WHERE pc.changed_at > ?
+                     ORDER BY pc.changed_at DESC
+                     LIMIT 50''', (since,))
+        return [dict(row) for row in c.fetchall()]
+
+# The default 7-day window; price writes invalidate it with the catalog
+price_changes_cache = VersionedCache('price_changes', load_price_changes, max_age=60)
+
+# Writes made by other worker processes (coherence.py); this worker's own
+# writes invalidate directly
+def catalog_changed_elsewhere():
+    invalidate_catalog()
+    with pool.connection() as conn:
+        version = catalog_sync.current_version(conn.cursor())
+    # Live streams held by this worker hear about it too
+    bus.publish('catalog', {'version': version})
+
+def settings_changed_elsewhere():
+    settings_cache.invalidate()
+    bus.publish('settings', {'updated_at': datetime.now().isoformat()})
+
+coherence.subscribe('catalog', catalog_changed_elsewhere)
+coherence.subscribe('settings', settings_changed_elsewhere)
+coherence.subscribe('orders', invalidate_trending)
+
 @app.route('/api/price-changes', methods=['GET'])
 def get_price_changes():
     """Get recent price changes for in-app notifications"""
     # Get timestamp of last check (default to 7 days ago)
     since = request.args.get('since')
     if not since:
-        since = (datetime.now() - timedelta(days=7)).isoformat()
-    
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    
-    c.execute('''SELECT pc.*, p.photo, p.category, p.unit
-                 FROM price_changes pc
-                 JOIN products p ON pc.product_id = p.id
-                 WHERE pc.changed_at > ?
-                 ORDER BY pc.changed_at DESC
-                 LIMIT 50''', (since,))
-    
-    changes = [dict(row) for row in c.fetchall()]
-    conn.close()
-    
-    return jsonify(changes)
+        return snapshot_response(price_changes_cache.get())
+    try:
+        since = utc_since(since)
+    except ValueError:
+        return jsonify({'error': 'since must be an ISO date or time'}), 400
+    return jsonify(load_price_changes(since))
+
+# Catalog view the shop starts with (live-pricing.js catalogView)
+BOOTSTRAP_VIEW = 'list'
+# Inline the startup documents into shop.html, so first paint needs no API call
+INLINE_BOOTSTRAP = os.environ.get('INLINE_BOOTSTRAP', '1') != '0'
+
+_bootstrap_snapshots = {}
+_inline_pages = {}
+
+def bootstrap_snapshot(view):
+    """Catalog, settings, specials and price changes as one pre-encoded document.
+
+    Assembled from the cached fragments' bytes and only rebuilt when one of
+    them has changed; its tag is derived from theirs.
+    """
+    fragments = {
+        'catalog': catalog_caches[view].get(),
+        'price_changes': price_changes_cache.get(),
+        'settings': settings_cache.get(),
+        'specials': specials_caches[view].get(),
+    }
+    tag = combined_tag(*(fragments[name].tag for name in sorted(fragments)))
+    snapshot = _bootstrap_snapshots.get(view)
+    if snapshot is None or snapshot.tag != tag:
+        body = compose({name: fragment.body for name, fragment in fragments.items()})
+        snapshot = _bootstrap_snapshots[view] = Snapshot(None, tag, body=body, tag=tag)
+    return snapshot
+
+@app.route('/api/bootstrap', methods=['GET'])
+def bootstrap():
+    """Everything the shop loads on startup in one response (?view=, ?user_id=)"""
+    view = request.args.get('view', BOOTSTRAP_VIEW)
+    if view not in product_views.VIEWS:
+        return jsonify({'error': f"Unknown view '{view}' (use {', '.join(product_views.VIEWS)})"}), 400
+    shared = bootstrap_snapshot(view)
+    user_id = request.args.get('user_id', type=int)
+    if user_id is None:
+        return snapshot_response(shared)
+    
+    user_body = dumps(load_user_profile(get_db().cursor(), user_id, product_views.VIEWS[view]))
+    # "user" sorts after every shared key, so it goes last
+    body = shared.body[:-1] + b',"user":' + user_body + b'}'
+    return dynamic_response(body, combined_tag(shared.tag, user_body))
+
+def shop_page():
+    """shop.html with the startup documents inlined for bootstrap.js"""
+    page, page_tag = asset_store.page('shop.html')
+    shared = bootstrap_snapshot(BOOTSTRAP_VIEW)
+    tag = combined_tag(page_tag, shared.tag)
+    snapshot = _inline_pages.get('shop.html')
+    if snapshot is None or snapshot.tag != tag:
+        # Escaped so no string in the data can close the script element
+        data = shared.body.replace(b'<', b'\\u003c')
+        script = b'<script id="glengala-bootstrap" type="application/json">' + data + b'</script>\n'
+        body = page.replace(b'</head>', script + b'</head>', 1)
+        snapshot = _inline_pages['shop.html'] = Snapshot(None, tag, body=body, tag=tag)
+    return snapshot_response(snapshot, mimetype='text/html')
+
+@app.route('/api/stream', methods=['GET'])
+def event_stream():
+    """Server-Sent Events: live catalog, price and settings updates"""
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    last_id = int(last_id) if last_id and last_id.isdigit() else None
+    try:
+        if 'glengala.async_stream' in request.environ:
+            # Served by asgi.py: it sends the frames from its event loop
+            # instead of holding this thread for the life of the stream
+            request.environ['glengala.async_stream'] = bus.open(last_id)
+            stream = []
+        else:
+            stream = bus.stream(last_id)
+    except TooManyStreams:
+        # Clients fall back to polling
+        response = jsonify({'error': 'Too many live connections'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '60'
+        return response
+    return Response(stream, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
 @app.route('/api/mark-changes-seen', methods=['POST'])
 def mark_changes_seen():
@@ -744,15 +1437,27 @@ def mark_changes_seen():
         'message': f'Marked {len(change_ids)} changes as seen'
     })
 
-# Serve static files (for PythonAnywhere)
+# Serve static files (for PythonAnywhere) - built, hashed assets when
+# `python assets.py` has been run, otherwise the repo files themselves
 @app.route('/')
 def index():
-    return send_from_directory('../', 'shop.html')
+    return shop_page() if INLINE_BOOTSTRAP else asset_store.serve('shop.html')
 
 @app.route('/<path:filename>')
 def static_files(filename):
-    return send_from_directory('../', filename)
+    if filename == 'shop.html' and INLINE_BOOTSTRAP:
+        return shop_page()
+    return asset_store.serve(filename)
+
+# Resume pushes queued before a restart. Started here, once per process, as
+# WSGI servers never run __main__; servers that import the app and then fork
+# workers get a fresh dispatcher in each worker
+if push_dispatch.AUTOSTART:
+    dispatcher.start()
+    os.register_at_fork(after_in_child=dispatcher.restart_after_fork)
 
 if __name__ == '__main__':
     init_db()
+    # Threaded development server; `python asgi.py` serves the same routes
+    # from an event loop, so open streams and slow clients don't each hold a thread
     app.run(debug=True)
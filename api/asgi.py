@@ -0,0 +1,501 @@
+# Glengala Fresh - asyncio serving mode
+# The threaded server ties up one thread for every open connection, and that
+# includes live-update streams and slow mobile clients still sending their
+# request. This module serves the same Flask routes from an event loop instead:
+#
+#   * `app` is an ASGI application; in production run it under uvicorn
+#     (`uvicorn asgi:app`, in requirements.txt). Each request is run through the Flask app on a bounded
+#     thread pool - DB_THREADS threads, the connection pool's size by default -
+#     so SQLite work never blocks the loop, and responses are byte-for-byte the
+#     ones the threaded server sends.
+#   * /api/stream is the exception: Flask checks the stream limit and sends the
+#     headers, then the loop sends the frames. An open stream costs a socket
+#     and a coroutine, not a thread.
+#   * `python asgi.py` runs it on a small HTTP/1.1 server built on asyncio, for
+#     development and the connection benchmarks only. It accepts only simple
+#     Content-Length requests, and it is not hardened against hostile
+#     clients, so it warns when bound to anything but loopback.
+
+import argparse
+import asyncio
+import http
+import io
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from urllib.parse import unquote
+
+import db
+from app import app as flask_app, init_db
+from events import bus, HEARTBEAT_SECONDS, MAX_STREAM_SECONDS
+from push_dispatch import dispatcher
+
+# Threads running Flask (and so SQLite); more than the pool would only queue there
+DB_THREADS = int(os.environ.get('ASGI_DB_THREADS', db.POOL_SIZE))
+# Largest request body accepted (product image uploads are 5MB at most)
+MAX_BODY_BYTES = int(os.environ.get('ASGI_MAX_BODY_BYTES', 16 * 1024 * 1024))
+# Time a client gets to send a request, and to start the next on a kept-alive connection
+READ_TIMEOUT_SECONDS = float(os.environ.get('ASGI_READ_TIMEOUT', 30))
+# Largest request line plus headers
+MAX_HEADER_BYTES = 64 * 1024
+
+log = logging.getLogger('glengala.asgi')
+
+_executor = None
+_wakeups = {}
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix='glengala-db')
+    return _executor
+
+
+async def run_sync(func, *args):
+    """Run func on the database threads"""
+    return await asyncio.get_running_loop().run_in_executor(executor(), func, *args)
+
+
+# ---------------------------------------------------------------------------
+# ASGI application
+# ---------------------------------------------------------------------------
+
+class Wakeup:
+    """Wakes this loop's streams whenever the event bus publishes"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.future = loop.create_future()
+        bus.add_waker(self.wake)
+
+    def wake(self):
+        # Called on the publishing thread
+        self.loop.call_soon_threadsafe(self._fire)
+
+    def _fire(self):
+        future, self.future = self.future, self.loop.create_future()
+        future.set_result(None)
+
+    async def wait(self, timeout):
+        await asyncio.wait([self.future], timeout=timeout)
+
+
+def wakeup():
+    loop = asyncio.get_running_loop()
+    if loop not in _wakeups:
+        _wakeups[loop] = Wakeup(loop)
+    return _wakeups[loop]
+
+
+def wsgi_environ(scope, body):
+    """The WSGI environ werkzeug's own server would build for this request"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+        # Set to the starting event id by /api/stream (see event_stream)
+        'glengala.async_stream': None,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+            continue
+        key = 'HTTP_' + name
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def call_flask(environ):
+    """Run one request through the Flask app; returns (status, headers, body)"""
+    response = {}
+    chunks = []
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = headers
+        return chunks.append
+
+    result = flask_app(environ, start_response)
+    try:
+        chunks.extend(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], b''.join(chunks)
+
+
+def encode_headers(headers, skip=()):
+    return [(name.lower().encode('latin-1'), value.encode('latin-1'))
+            for name, value in headers if name.lower() not in skip]
+
+
+async def read_body(receive):
+    body = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body.append(message.get('body', b''))
+        size += len(body[-1])
+        if size > MAX_BODY_BYTES:
+            raise ValueError('Request body too large')
+        if not message.get('more_body'):
+            return b''.join(body)
+
+
+async def send_events(receive, send, last_id):
+    """Send /api/stream frames until the stream ends or the client goes away"""
+    async def disconnected():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def pump():
+        frames = bus.stream_async(last_id, wakeup().wait, HEARTBEAT_SECONDS, MAX_STREAM_SECONDS)
+        try:
+            async for frame in frames:
+                await send({'type': 'http.response.body', 'body': frame, 'more_body': True})
+        finally:
+            await frames.aclose()
+        await send({'type': 'http.response.body', 'body': b''})
+
+    # Whichever ends first cancels the other, so a closed tab frees its stream at once
+    tasks = [asyncio.ensure_future(pump()), asyncio.ensure_future(disconnected())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await run_sync(startup)
+            except Exception as e:
+                log.exception('Startup failed')
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await run_sync(shutdown)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+def startup():
+    init_db()
+    # Resume any pushes still queued from a previous run
+    dispatcher.start()
+
+
+def shutdown():
+    dispatcher.stop()
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return  # No websockets
+    try:
+        body = await read_body(receive)
+    except ValueError:
+        await send({'type': 'http.response.start', 'status': 413,
+                    'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': b'{"error":"Request body too large"}'})
+        return
+    if body is None:
+        return
+    environ = wsgi_environ(scope, body)
+    status, headers, content = await run_sync(call_flask, environ)
+    last_id = environ['glengala.async_stream']
+    if last_id is None:
+        await send({'type': 'http.response.start', 'status': status, 'headers': encode_headers(headers)})
+        await send({'type': 'http.response.body', 'body': content})
+        return
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': encode_headers(headers, skip=('content-length',))})
+    await send_events(receive, send, last_id)
+
+
+# ---------------------------------------------------------------------------
+# HTTP/1.1 server
+# ---------------------------------------------------------------------------
+
+class HTTPError(Exception):
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+
+class Connection:
+    """One client connection: parses requests and runs them through an ASGI app"""
+
+    def __init__(self, asgi_app, reader, writer):
+        self.app = asgi_app
+        self.reader = reader
+        self.writer = writer
+        self.server = writer.get_extra_info('sockname')[:2]
+        self.client = (writer.get_extra_info('peername') or ('', 0))[:2]
+        self.closed = False
+
+    async def run(self):
+        try:
+            while not self.closed:
+                try:
+                    request = await asyncio.wait_for(self.read_request(), READ_TIMEOUT_SECONDS)
+                except HTTPError as e:
+                    self.send_error(e.status)
+                    break
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                if request is None:
+                    break
+                scope, body, keep_alive = request
+                if not await self.respond(scope, body, keep_alive):
+                    break
+        except Exception:
+            log.exception('Connection failed')
+        finally:
+            self.writer.close()
+
+    async def read_request(self):
+        try:
+            head = await self.reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError as e:
+            if not e.partial.strip():
+                return None  # Closed between requests
+            raise
+        except asyncio.LimitOverrunError:
+            raise HTTPError(431)
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split(' ')
+        except ValueError:
+            raise HTTPError(400)
+        if version not in ('HTTP/1.0', 'HTTP/1.1'):
+            raise HTTPError(505)
+        headers = []
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, sep, value = line.partition(':')
+            if not sep or not name or name != name.strip():
+                raise HTTPError(400)
+            headers.append((name.lower(), value.strip()))
+        fields = dict(headers)
+        if 'transfer-encoding' in fields:
+            raise HTTPError(411)  # Clients here always send Content-Length
+        try:
+            length = int(fields.get('content-length', 0))
+        except ValueError:
+            raise HTTPError(400)
+        if length < 0:
+            raise HTTPError(400)
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413)
+        body = await self.reader.readexactly(length) if length else b''
+
+        path, _, query = target.partition('?')
+        connection = fields.get('connection', '').lower()
+        keep_alive = 'close' not in connection if version == 'HTTP/1.1' else 'keep-alive' in connection
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0', 'spec_version': '2.3'},
+            'http_version': version[5:],
+            'method': method.upper(),
+            'scheme': 'http',
+            'path': _unquote(path),
+            'raw_path': path.encode('latin-1'),
+            'query_string': query.encode('latin-1'),
+            'root_path': '',
+            'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+            'client': self.client,
+            'server': self.server,
+        }
+        return scope, body, keep_alive
+
+    async def respond(self, scope, body, keep_alive):
+        """Run the app for one request; returns whether the connection can be reused"""
+        state = {'started': False, 'chunked': False, 'done': False, 'received': False}
+        head_only = scope['method'] == 'HEAD'
+        chunked_ok = scope['http_version'] == '1.1'
+
+        async def receive():
+            if not state['received']:
+                state['received'] = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            # Only a streaming response asks again: wait for the client to leave
+            while not self.closed:
+                try:
+                    if not await self.reader.read(65536):
+                        break
+                except ConnectionError:
+                    break
+            self.closed = True
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if self.closed:
+                return
+            if message['type'] == 'http.response.start':
+                state['status'] = message['status']
+                state['headers'] = [(name.decode('latin-1'), value.decode('latin-1'))
+                                    for name, value in message.get('headers', [])]
+                return
+            data = message.get('body', b'')
+            more = message.get('more_body', False)
+            out = []
+            if not state['started']:
+                state['started'] = True
+                headers = state['headers']
+                names = {name.lower() for name, _ in headers}
+                if 'content-length' not in names:
+                    if not more:
+                        headers.append(('Content-Length', str(len(data))))
+                    elif chunked_ok:
+                        state['chunked'] = True
+                        headers.append(('Transfer-Encoding', 'chunked'))
+                    else:
+                        state['keep_alive'] = False  # Body ends when the connection does
+                out.append(self.head(state['status'], headers, state.get('keep_alive', keep_alive)))
+            if data and not head_only:
+                out.append(b'%x\r\n%s\r\n' % (len(data), data) if state['chunked'] else data)
+            if not more:
+                state['done'] = True
+                if state['chunked'] and not head_only:
+                    out.append(b'0\r\n\r\n')
+            self.writer.write(b''.join(out))
+            try:
+                await self.writer.drain()
+            except ConnectionError:
+                self.closed = True
+
+        try:
+            await self.app(scope, receive, send)
+        except Exception:
+            log.exception('Error handling %s %s', scope['method'], scope['path'])
+            if not state['started']:
+                self.send_error(500)
+            return False
+        if not state['started']:
+            self.send_error(500)
+            return False
+        return state['done'] and keep_alive and state.get('keep_alive', True) and not self.closed
+
+    def head(self, status, headers, keep_alive):
+        try:
+            reason = http.HTTPStatus(status).phrase
+        except ValueError:
+            reason = ''
+        lines = [f'HTTP/1.1 {status} {reason}', f'Date: {_http_date()}']
+        lines += [f'{name}: {value}' for name, value in headers]
+        if not keep_alive:
+            lines.append('Connection: close')
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    def send_error(self, status):
+        if self.closed:
+            return
+        body = f'{status} {http.HTTPStatus(status).phrase}\n'.encode()
+        self.writer.write(self.head(status, [('Content-Type', 'text/plain'),
+                                             ('Content-Length', str(len(body)))], False) + body)
+        self.closed = True
+
+
+def _unquote(path):
+    return unquote(path, errors='surrogateescape') if '%' in path else path
+
+
+_date = [0, '']
+
+
+def _http_date():
+    now = int(time.time())
+    if _date[0] != now:
+        _date[:] = [now, formatdate(now, usegmt=True)]
+    return _date[1]
+
+
+async def serve(asgi_app=app, host='127.0.0.1', port=5000, ready=None):
+    """Serve asgi_app until cancelled; ready(port) is called once listening"""
+    queue = asyncio.Queue()
+    started = asyncio.get_running_loop().create_future()
+
+    async def lifespan_receive():
+        return await queue.get()
+
+    async def lifespan_send(message):
+        if message['type'].startswith('lifespan.startup') and not started.done():
+            started.set_result(message['type'] == 'lifespan.startup.complete')
+
+    lifespan_task = asyncio.ensure_future(
+        asgi_app({'type': 'lifespan', 'asgi': {'version': '3.0'}}, lifespan_receive, lifespan_send))
+    await queue.put({'type': 'lifespan.startup'})
+    await asyncio.wait([started, lifespan_task], return_when=asyncio.FIRST_COMPLETED)
+    if not (started.done() and started.result()):
+        raise RuntimeError('Application startup failed')
+
+    async def handle(reader, writer):
+        await Connection(asgi_app, reader, writer).run()
+
+    server = await asyncio.start_server(handle, host, port, backlog=1024, limit=MAX_HEADER_BYTES)
+    port = server.sockets[0].getsockname()[1]
+    log.info('Serving on http://%s:%s with %s database threads', host, port, DB_THREADS)
+    if ready:
+        ready(port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await queue.put({'type': 'lifespan.shutdown'})
+        await asyncio.wait([lifespan_task], timeout=10)
+
+
+def main(argv=None):
+    global DB_THREADS
+    parser = argparse.ArgumentParser(prog='python asgi.py',
+                                     description='Development server (production: uvicorn asgi:app)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--db-threads', type=int, default=DB_THREADS)
+    args = parser.parse_args(argv)
+    DB_THREADS = args.db_threads
+    if args.host not in ('127.0.0.1', 'localhost', '::1'):
+        log.warning('python asgi.py is a development server; serve the internet '
+                    'through uvicorn asgi:app instead')
+    try:
+        asyncio.run(serve(app, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,451 @@
+# Glengala Fresh - Static asset pipeline
+# `python assets.py` builds ../dist: every script, stylesheet and image the
+# shop and admin pages reference is minified, content-hashed and written with
+# gzip/brotli copies; the pages and service worker are rewritten to use the
+# hashed names and asset-manifest.json records the result.
+# At runtime AssetStore serves from that manifest - hashed files are cached
+# forever, pages and the service worker revalidate against a strong ETag.
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import sys
+import threading
+from datetime import datetime
+from flask import Response, abort, request, send_from_directory
+from cache import GZIP_LEVEL, BROTLI_QUALITY, brotli, etag_matches
+
+SOURCE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BUILD_DIR = os.environ.get('STATIC_BUILD_DIR', os.path.join(SOURCE_DIR, 'dist'))
+MANIFEST_NAME = 'asset-manifest.json'
+
+PAGES = ['shop.html', 'admin.html']
+SERVICE_WORKER = 'service-worker.js'
+ASSET_TYPES = {'.js', '.css', '.json', '.png', '.jpg', '.jpeg', '.svg', '.ico', '.webp'}
+COMPRESSIBLE = {'.js', '.css', '.json', '.html', '.svg'}
+HASH_LENGTH = 10
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# Served straight from the repo when they are not in the manifest
+PUBLIC_TYPES = ASSET_TYPES | {'.html', '.webmanifest'}
+PRIVATE_DIRS = {'api', 'dist', 'outputs'}
+
+_PAGE_REF = re.compile(r'\b(src|href)="([^"]+)"')
+_CSS_URL = re.compile(r'''url\((['"]?)([^'")]+)\1\)''')
+_EXTERNAL = re.compile(r'^(?:[a-z]+:|//|#)', re.IGNORECASE)
+
+
+# --- Minification ----------------------------------------------------------
+
+_CSS_TOKEN = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|/\*.*?\*/''', re.DOTALL)
+_CSS_PUNCTUATION = re.compile(r'\s*([{};,])\s*')
+
+
+def _squeeze_css(segment):
+    segment = _CSS_PUNCTUATION.sub(r'\1', re.sub(r'\s+', ' ', segment))
+    return segment.replace(';}', '}')
+
+
+def minify_css(text):
+    """Drop comments and collapse whitespace, leaving strings alone"""
+    parts = []
+    segment = []
+    last = 0
+    for match in _CSS_TOKEN.finditer(text):
+        segment.append(text[last:match.start()])
+        if match.group(1):
+            parts.append(_squeeze_css(''.join(segment)))
+            parts.append(match.group(1))
+            segment = []
+        else:
+            segment.append(' ')
+        last = match.end()
+    segment.append(text[last:])
+    parts.append(_squeeze_css(''.join(segment)))
+    return ''.join(parts).strip()
+
+
+# Words after which a slash starts a regex rather than a division
+_REGEX_KEYWORDS = {'return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'new', 'delete',
+                   'void', 'throw', 'yield', 'await', 'instanceof'}
+_REGEX_AFTER = set('(,=:[!&|?{};+-*%<>~^')
+
+
+def minify_js(text):
+    """Strip comments, indentation and blank lines.
+
+    Conservative on purpose: line breaks are kept so automatic semicolon
+    insertion behaves exactly as before, and strings, template literals and
+    regex literals are copied verbatim.
+    """
+    out = []
+    i = 0
+    n = len(text)
+    last = ''        # last significant character written
+    word = ''        # last identifier written, for regex detection
+    braces = []      # brace depth of each open template ${ } expression
+    line_start = True
+    pending_space = False
+
+    def emit(chunk):
+        nonlocal line_start, pending_space
+        if pending_space and not line_start:
+            out.append(' ')
+        pending_space = False
+        line_start = False
+        out.append(chunk)
+
+    def newline():
+        nonlocal line_start, pending_space
+        pending_space = False
+        if not line_start:
+            out.append('\n')
+            line_start = True
+
+    def template(start):
+        """Copy a template literal from start (after the opening backtick)"""
+        j = start
+        while j < n:
+            ch = text[j]
+            if ch == '\\':
+                j += 2
+                continue
+            if ch == '`':
+                return j + 1, False
+            if ch == '$' and text.startswith('${', j):
+                return j + 2, True
+            j += 1
+        return n, False
+
+    while i < n:
+        ch = text[i]
+        if ch == '\n':
+            newline()
+            i += 1
+        elif ch in ' \t\r':
+            pending_space = True
+            i += 1
+        elif ch in '\'"':
+            j = i + 1
+            while j < n and text[j] != ch and text[j] != '\n':
+                j += 2 if text[j] == '\\' else 1
+            emit(text[i:j + 1])
+            i = j + 1
+            last, word = 'a', ''
+        elif ch == '`' or (ch == '}' and braces and braces[-1] == 0):
+            if ch == '}':
+                braces.pop()
+            end, opened = template(i + 1)
+            emit(text[i:end])
+            i = end
+            if opened:
+                braces.append(0)
+                last, word = '{', ''
+            else:
+                last, word = 'a', ''
+        elif ch == '/' and text.startswith('//', i):
+            while i < n and text[i] != '\n':
+                i += 1
+        elif ch == '/' and text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            end = n if end < 0 else end + 2
+            if '\n' in text[i:end]:
+                newline()
+            else:
+                pending_space = True
+            i = end
+        elif ch == '/' and (last in _REGEX_AFTER or last == '' or word in _REGEX_KEYWORDS):
+            j = i + 1
+            in_class = False
+            while j < n and text[j] != '\n':
+                c = text[j]
+                if c == '\\':
+                    j += 2
+                    continue
+                if c == '[':
+                    in_class = True
+                elif c == ']':
+                    in_class = False
+                elif c == '/' and not in_class:
+                    break
+                j += 1
+            j += 1
+            while j < n and (text[j].isalnum() or text[j] == '_'):
+                j += 1
+            emit(text[i:j])
+            i = j
+            last, word = 'a', ''
+        elif ch.isalnum() or ch in '_$':
+            j = i
+            while j < n and (text[j].isalnum() or text[j] in '_$'):
+                j += 1
+            emit(text[i:j])
+            word = text[i:j]
+            last = 'a'
+            i = j
+        else:
+            if braces:
+                if ch == '{':
+                    braces[-1] += 1
+                elif ch == '}':
+                    braces[-1] -= 1
+            emit(ch)
+            last, word = ch, ''
+            i += 1
+    return ''.join(out).strip() + '\n'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+# --- Build -----------------------------------------------------------------
+
+def _content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def _hashed_name(name, digest):
+    base, ext = os.path.splitext(name)
+    return f"{base.replace(' ', '-')}.{digest}{ext}"
+
+
+def _local_ref(ref):
+    """Repo-relative asset name for a page/stylesheet reference, or None"""
+    if _EXTERNAL.match(ref):
+        return None
+    name = ref.split('?', 1)[0].split('#', 1)[0].lstrip('/')
+    if os.path.splitext(name)[1].lower() not in ASSET_TYPES:
+        return None
+    if not os.path.isfile(os.path.join(SOURCE_DIR, name)):
+        return None
+    return name
+
+
+def _write(build_dir, name, data, compress):
+    """Write a file plus .gz/.br copies; returns the manifest size fields"""
+    path = os.path.join(build_dir, name)
+    with open(path, 'wb') as f:
+        f.write(data)
+    entry = {'bytes': len(data), 'gzip': None, 'br': None}
+    if compress:
+        gz = gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+        with open(path + '.gz', 'wb') as f:
+            f.write(gz)
+        entry['gzip'] = len(gz)
+        if brotli:
+            br = brotli.compress(data, quality=BROTLI_QUALITY)
+            with open(path + '.br', 'wb') as f:
+                f.write(br)
+            entry['br'] = len(br)
+    return entry
+
+
+def build(build_dir=BUILD_DIR, minify=True):
+    """Build every page's assets into build_dir and write the manifest"""
+    os.makedirs(build_dir, exist_ok=True)
+    pages = {}
+    for page in PAGES:
+        with open(os.path.join(SOURCE_DIR, page), encoding='utf-8') as f:
+            pages[page] = f.read()
+
+    # Stylesheets point at images, so hash leaves first and CSS after
+    names = sorted({name for html in pages.values()
+                    for _, ref in _PAGE_REF.findall(html)
+                    for name in [_local_ref(ref)] if name},
+                   key=lambda name: (name.endswith('.css'), name))
+    assets = {}
+    source_bytes = 0
+    for name in names:
+        with open(os.path.join(SOURCE_DIR, name), 'rb') as f:
+            data = f.read()
+        source_bytes += len(data)
+        ext = os.path.splitext(name)[1].lower()
+        if ext == '.css':
+            data = _CSS_URL.sub(lambda m: _rewrite_css_url(m, assets),
+                                data.decode('utf-8')).encode('utf-8')
+        if minify and ext in MINIFIERS:
+            data = MINIFIERS[ext](data.decode('utf-8')).encode('utf-8')
+        digest = _content_hash(data)
+        hashed = _hashed_name(name, digest)
+        entry = _write(build_dir, hashed, data, ext in COMPRESSIBLE)
+        entry.update(file=hashed, hash=digest)
+        assets[name] = entry
+
+    version = _content_hash(''.join(assets[name]['hash'] for name in sorted(assets)).encode())
+
+    def rewrite_ref(match):
+        attr, ref = match.groups()
+        name = _local_ref(ref)
+        if name not in assets:
+            return match.group(0)
+        return f'{attr}="{assets[name]["file"]}"'
+
+    documents = {}
+    for page, html in pages.items():
+        documents[page] = _PAGE_REF.sub(rewrite_ref, html).encode('utf-8')
+
+    # Precache the pages plus every hashed asset; the cache name follows the build
+    with open(os.path.join(SOURCE_DIR, SERVICE_WORKER), encoding='utf-8') as f:
+        worker = f.read()
+    precache = ['/' + page for page in PAGES] + sorted('/' + a['file'] for a in assets.values())
+    worker = re.sub(r"const STATIC_ASSETS = \[.*?\];",
+                    lambda m: 'const STATIC_ASSETS = ' + json.dumps(precache, indent=2) + ';',
+                    worker, count=1, flags=re.DOTALL)
+    worker = re.sub(r"const CACHE_NAME = '[^']*';",
+                    f"const CACHE_NAME = 'glengala-{version}';", worker, count=1)
+    documents[SERVICE_WORKER] = (minify_js(worker) if minify else worker).encode('utf-8')
+
+    documents_meta = {}
+    for name, data in documents.items():
+        entry = _write(build_dir, name, data, True)
+        entry.update(file=name, hash=_content_hash(data))
+        documents_meta[name] = entry
+
+    manifest = {
+        'version': version,
+        'built_at': datetime.now().isoformat(),
+        'source_bytes': source_bytes,
+        'assets': assets,
+        'pages': documents_meta,
+    }
+    with open(os.path.join(build_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def _rewrite_css_url(match, assets):
+    quote, ref = match.groups()
+    name = _local_ref(ref)
+    if name not in assets:
+        return match.group(0)
+    return f"url({quote}{assets[name]['file']}{quote})"
+
+
+# --- Serving ---------------------------------------------------------------
+
+class AssetStore:
+    """Serves built assets from the manifest, falling back to the repo files"""
+
+    def __init__(self, build_dir=BUILD_DIR, source_dir=SOURCE_DIR):
+        self.build_dir = build_dir
+        self.source_dir = source_dir
+        self._lock = threading.Lock()
+        self._manifest_mtime = None
+        self._routes = {}
+        self._bodies = {}
+        self._sources = {}
+        self.version = None
+
+    def _load(self):
+        """(Re)read the manifest if a build has replaced it"""
+        path = os.path.join(self.build_dir, MANIFEST_NAME)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = None
+        if mtime == self._manifest_mtime:
+            return
+        with self._lock:
+            if mtime == self._manifest_mtime:
+                return
+            routes = {}
+            version = None
+            if mtime is not None:
+                with open(path) as f:
+                    manifest = json.load(f)
+                version = manifest['version']
+                for name, entry in manifest['assets'].items():
+                    routes[entry['file']] = (entry, True)
+                    # Unhashed names still work (old pages, hand-written links)
+                    routes[name] = (entry, False)
+                for name, entry in manifest['pages'].items():
+                    routes[name] = (entry, False)
+            self._routes = routes
+            self._bodies = {}
+            self.version = version
+            self._manifest_mtime = mtime
+
+    def _body(self, filename):
+        body = self._bodies.get(filename)
+        if body is None:
+            with open(os.path.join(self.build_dir, filename), 'rb') as f:
+                body = f.read()
+            self._bodies[filename] = body
+        return body
+
+    def serve(self, name):
+        self._load()
+        route = self._routes.get(name)
+        if route is None:
+            return self._serve_source(name)
+        entry, immutable = route
+
+        if not immutable and etag_matches(request.headers.get('If-None-Match'), entry['hash']):
+            response = Response(status=304)
+            response.headers['ETag'] = f'"{entry["hash"]}"'
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+
+        filename = entry['file']
+        accept_encoding = (request.headers.get('Accept-Encoding') or '').lower()
+        encoding = None
+        if entry.get('br') and 'br' in accept_encoding:
+            encoding, suffix, tag = 'br', '.br', f'"{entry["hash"]}-br"'
+        elif entry.get('gzip') and 'gzip' in accept_encoding:
+            encoding, suffix, tag = 'gzip', '.gz', f'"{entry["hash"]}-gz"'
+        else:
+            suffix, tag = '', f'"{entry["hash"]}"'
+
+        mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        response = Response(self._body(filename + suffix), mimetype=mimetype)
+        response.headers['ETag'] = tag
+        response.headers['Cache-Control'] = IMMUTABLE if immutable else 'no-cache'
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if entry.get('gzip'):
+            response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+    def page(self, name):
+        """(body, tag) of a page as serve() would send it, for pages the app rewrites"""
+        self._load()
+        route = self._routes.get(name)
+        if route is not None:
+            entry = route[0]
+            return self._body(entry['file']), entry['hash']
+        # Unbuilt: the repo file, re-read when it changes
+        path = os.path.join(self.source_dir, name)
+        mtime = os.path.getmtime(path)
+        cached = self._sources.get(name)
+        if cached is None or cached[0] != mtime:
+            with open(path, 'rb') as f:
+                body = f.read()
+            cached = self._sources[name] = (mtime, body, _content_hash(body))
+        return cached[1], cached[2]
+
+    def _serve_source(self, name):
+        """Unbuilt files straight from the repo - public file types only"""
+        parts = name.split('/')
+        ext = os.path.splitext(name)[1].lower()
+        if (ext not in PUBLIC_TYPES or parts[0] in PRIVATE_DIRS
+                or any(part.startswith('.') for part in parts)):
+            abort(404)
+        return send_from_directory(self.source_dir, name)
+
+    def get_stats(self):
+        self._load()
+        return {'version': self.version, 'routes': len(self._routes), 'cached_bodies': len(self._bodies)}
+
+
+if __name__ == '__main__':
+    minify = '--no-minify' not in sys.argv
+    manifest = build(minify=minify)
+    built = sum(entry['bytes'] for entry in manifest['assets'].values())
+    compressed = sum(entry['br'] or entry['gzip'] or entry['bytes']
+                     for entry in manifest['assets'].values())
+    print(f"Built {len(manifest['assets'])} assets into {BUILD_DIR} (version {manifest['version']})")
+    print(f"  {manifest['source_bytes']} source bytes -> {built} minified -> {compressed} compressed")
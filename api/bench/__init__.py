@@ -0,0 +1,25 @@
+# Glengala Fresh - Benchmarks
+# python -m bench run      build a synthetic database and time every API route
+# python -m bench compare  compare two runs from the history file
+# python -m bench.checkout checkout write throughput (direct commits vs writer)
+# python -m bench.coherence  caches stay in step across N worker processes
+# python -m bench.connections  open connections: threaded server vs asgi.py
+#
+# Everything runs against a scratch database, never glengala.db: call
+# use_scratch_database() before anything imports app or db, because both read
+# DATABASE_PATH at import time.
+
+import os
+import tempfile
+
+
+def use_scratch_database(path=None):
+    """Point DATABASE_PATH/IMAGE_DIR at a scratch location; returns the db path"""
+    directory = os.path.dirname(os.path.abspath(path)) if path else tempfile.mkdtemp(prefix='glengala-bench-')
+    os.environ['DATABASE_PATH'] = path or os.path.join(directory, 'bench.db')
+    os.environ['IMAGE_DIR'] = os.path.join(directory, 'images')
+    # /api/mock-push/* answers outside debug mode
+    os.environ.setdefault('PUSH_MOCK', '1')
+    # One client stands in for many: per-client rate limits would throttle the run
+    os.environ.setdefault('ADMISSION_CONTROL', '0')
+    return os.environ['DATABASE_PATH']
@@ -0,0 +1,150 @@
+# Glengala Fresh - Benchmark command line (run from api/)
+# python -m bench run [--scale small|medium|large] [--products N ...] [--requests 200]
+#                     [--concurrency 1,8] [--transport client,server] [--only REGEX]
+#                     [--label TEXT] [--compare] [--no-history]
+# python -m bench compare [A] [B]     two history entries (default: the last two)
+# python -m bench list                the history file
+# python -m bench generate PATH       just build a synthetic database
+
+import argparse
+import os
+import re
+import sys
+import time
+
+import bench
+from bench import dataset, history
+
+
+def _ints(value):
+    return [int(part) for part in value.split(',') if part]
+
+
+def _scale_arguments(parser):
+    parser.add_argument('--scale', choices=sorted(dataset.SCALES), default='small')
+    for table in dataset.SCALES['small']:
+        parser.add_argument(f"--{table.replace('_', '-')}", dest=table, type=int,
+                            help=f'{table} rows (overrides --scale)')
+    parser.add_argument('--seed', type=int, default=1)
+
+
+def _counts(args):
+    return dataset.scale(args.scale, **{table: getattr(args, table) for table in dataset.SCALES['small']})
+
+
+def _generate(args, path=None):
+    if path and os.path.exists(path):
+        sys.exit(f'{path} already exists - the generator only fills a new database')
+    path = bench.use_scratch_database(path)
+    started = time.perf_counter()
+    counts = dataset.generate(_counts(args), seed=args.seed)
+    print(f'Generated {path} in {time.perf_counter() - started:.1f}s: '
+          + ', '.join(f'{count} {table}' for table, count in counts.items()))
+    return counts
+
+
+def cmd_generate(args):
+    _generate(args, args.path)
+    return 0
+
+
+def cmd_run(args):
+    counts = _generate(args, args.db)
+
+    # app is only importable once DATABASE_PATH points at the scratch database
+    import app
+    from bench import runner, scenarios
+
+    for method, rule in scenarios.uncovered(app.app):
+        print(f'warning: no scenario for {method} {rule}')
+    selected = [scenario for scenario in scenarios.SCENARIOS
+                if not args.only or re.search(args.only, scenario.name)]
+    ctx = scenarios.Context(counts, seed=args.seed)
+    results = runner.run(selected, ctx, transports=args.transport, concurrency=args.concurrency,
+                         requests=args.requests)
+
+    config = {'scale': counts, 'seed': args.seed, 'requests': args.requests,
+              'concurrency': args.concurrency, 'transports': args.transport, 'only': args.only}
+    run = history.entry(args.label, config, results)
+    if args.no_history:
+        return 0
+    runs = history.load(args.history)
+    index = history.append(run, args.history)
+    print(f'\nSaved as {history.describe(index, run)} in {args.history}')
+    if args.compare:
+        previous = [i for i, old in enumerate(runs) if old['config'].get('scale') == counts]
+        if not previous:
+            print('Nothing earlier at this scale to compare with')
+            return 0
+        before = runs[previous[-1]]
+        print(f'\nCompared with {history.describe(previous[-1], before)}')
+        regressions = history.report(before, run, history.compare(before, run), only_changes=True)
+        return 1 if regressions and args.fail_on_regression else 0
+    return 0
+
+
+def cmd_compare(args):
+    runs = history.load(args.history)
+    if len(runs) < 2 and args.before is None:
+        print('Need at least two runs in the history file')
+        return 1
+    before = runs[args.before if args.before is not None else -2]
+    after = runs[args.after if args.after is not None else -1]
+    print(f"{history.describe(runs.index(before), before)}  ->  {history.describe(runs.index(after), after)}")
+    regressions = history.report(before, after, history.compare(before, after),
+                                 only_changes=args.changes)
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+def cmd_list(args):
+    for index, run in enumerate(history.load(args.history)):
+        scale = run['config'].get('scale', {})
+        print(f"{history.describe(index, run)}  {scale.get('products')} products, "
+              f"{scale.get('orders')} orders, {','.join(run['config'].get('transports', []))}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench', description='Glengala API benchmarks')
+    parser.add_argument('--history', default=history.HISTORY_PATH, help='JSON history file')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='generate a dataset and time every route')
+    _scale_arguments(run)
+    run.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    run.add_argument('--concurrency', type=_ints, default=[1, 8], help='thread counts, e.g. 1,8,32')
+    run.add_argument('--transport', type=lambda value: value.split(','), default=['client', 'server'],
+                     help='client (Flask test client), server (threaded HTTP) or both')
+    run.add_argument('--only', help='regex on scenario names')
+    run.add_argument('--label', help='note stored with the run')
+    run.add_argument('--db', help='database path (default: a temporary directory)')
+    run.add_argument('--no-history', action='store_true', help="don't record the run")
+    run.add_argument('--compare', action='store_true', help='compare with the previous run at this scale')
+    run.add_argument('--fail-on-regression', action='store_true', help='exit 1 on a regression')
+    run.set_defaults(handler=cmd_run)
+
+    compare = commands.add_parser('compare', help='compare two recorded runs')
+    compare.add_argument('before', type=int, nargs='?')
+    compare.add_argument('after', type=int, nargs='?')
+    compare.add_argument('--changes', action='store_true', help='only rows that moved more than the threshold')
+    compare.add_argument('--fail-on-regression', action='store_true', help='exit 1 on a regression')
+    compare.set_defaults(handler=cmd_compare)
+
+    listing = commands.add_parser('list', help='show recorded runs')
+    listing.set_defaults(handler=cmd_list)
+
+    generate = commands.add_parser('generate', help='only build a synthetic database')
+    generate.add_argument('path')
+    _scale_arguments(generate)
+    generate.set_defaults(handler=cmd_generate)
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        unknown = set(args.transport) - {'client', 'server'}
+        if unknown:
+            parser.error(f"unknown transport {', '.join(sorted(unknown))}")
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
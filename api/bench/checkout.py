@@ -0,0 +1,115 @@
+# Glengala Fresh - Checkout write throughput
+# python -m bench.checkout [orders_per_level]  (from api/)
+# Places orders in a scratch database at 1, 10 and 50 concurrent checkouts,
+# once with every thread committing its own transaction (the old create_order
+# path) and once through the single writer, and prints orders/s, latency
+# percentiles and how many orders each group commit carried.
+
+import os
+import sys
+import threading
+import time
+
+import bench
+
+bench.use_scratch_database()
+
+import app  # noqa: E402  (needs DATABASE_PATH first)
+import orders  # noqa: E402
+from bench.runner import percentile  # noqa: E402
+from db import pool  # noqa: E402
+from writer import writer  # noqa: E402
+
+LEVELS = [1, 10, 50]
+USERS = 200
+
+
+def seed():
+    app.init_db()
+    with pool.connection() as conn:
+        conn.executemany('INSERT INTO users (name, phone) VALUES (?, ?)',
+                         [(f'Bench {i}', f'04{i:08d}') for i in range(USERS)])
+        conn.executemany('''INSERT INTO products (name, category, price, unit, active)
+                            VALUES (?, 'vegetables', ?, 'kg', 1)''',
+                         [(f'Bench product {i}', 1 + i % 9) for i in range(50)])
+        conn.commit()
+    app.invalidate_catalog()
+
+
+def quote_for(n):
+    cart = {'items': [{'id': 1 + (n + k) % 50, 'quantity': 1 + k} for k in range(3)]}
+    return app.price_book.quote(cart)
+
+
+def place_direct(user_id, quote):
+    # What create_order used to do: its own connection, its own commit
+    with pool.connection() as conn:
+        c = conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        try:
+            result = orders.place_order(c, user_id, quote)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return result
+
+
+def place_queued(user_id, quote):
+    return writer.run(orders.place_order, user_id, quote)
+
+
+def run_level(place, concurrency, total):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    per_thread = max(1, total // concurrency)
+    quotes = [quote_for(n) for n in range(per_thread * concurrency)]
+
+    def worker(index):
+        for n in range(per_thread):
+            position = index * per_thread + n
+            start = time.perf_counter()
+            try:
+                place(1 + position % USERS, quotes[position])
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        'orders': len(latencies),
+        'errors': len(errors),
+        'orders_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+    }
+
+
+def main(total):
+    seed()
+    print(f"{total} orders per run, database {os.environ['DATABASE_PATH']}")
+    print(f"{'mode':8} {'threads':>7} {'orders/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'errors':>6} {'batch':>6}")
+    for concurrency in LEVELS:
+        for mode, place in (('direct', place_direct), ('writer', place_queued)):
+            before = writer.get_stats()
+            result = run_level(place, concurrency, total)
+            after = writer.get_stats()
+            batches = after['batches'] - before['batches']
+            batch = round((after['writes'] - before['writes']) / batches, 1) if batches else '-'
+            print(f"{mode:8} {concurrency:>7} {result['orders_per_second']:>9} "
+                  f"{result['p50_ms']:>8} {result['p95_ms']:>8} {result['errors']:>6} {batch:>6}")
+    writer.stop()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,191 @@
+# Glengala Fresh - Multi-worker cache coherence check
+# python -m bench.coherence [--workers 4] [--seconds 10] [--readers 8]  (from api/)
+# Starts N app processes on one scratch database and, for the given time,
+# changes a product's price and the shop settings through them in turn while
+# reader threads fetch the cached catalog and settings from random workers.
+# A read sent after a write was acknowledged must show that write or a later
+# one; once the writes stop, every worker must serve the same ETags.
+# Exits non-zero on any stale read or disagreement.
+
+import argparse
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+import bench
+
+PRODUCT_ID = 1
+WRITE_PAUSE_SECONDS = 0.02
+DOCUMENTS = ['/api/products?view=list', '/api/settings', '/api/bootstrap']
+
+
+def serve():
+    """One worker: the app on a free local port, printed for the parent"""
+    from werkzeug.serving import make_server
+
+    import app
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    print(server.server_port, flush=True)
+    server.serve_forever()
+
+
+def seed():
+    import app
+    from db import pool
+
+    app.init_db()
+    with pool.connection() as conn:
+        conn.executemany('''INSERT INTO products (name, category, price, unit, active)
+                            VALUES (?, 'vegetables', ?, 'kg', 1)''',
+                         [(f'Coherence product {i}', 1 + i % 9) for i in range(20)])
+        conn.commit()
+
+
+def start_workers(count):
+    env = dict(os.environ, ADMISSION_CONTROL='0', LOG_LEVEL='WARNING')
+    workers = []
+    for _ in range(count):
+        process = subprocess.Popen([sys.executable, '-m', 'bench.coherence', 'serve'], env=env,
+                                   cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                   stdout=subprocess.PIPE, text=True)
+        port = int(process.stdout.readline())
+        workers.append((process, f'http://127.0.0.1:{port}'))
+    return workers
+
+
+def call(base, path, body=None, method=None):
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(base + path, data=data, method=method,
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return response.headers.get('ETag'), json.loads(response.read())
+
+
+class Topic:
+    """One value written through the workers in turn, and the latest acknowledged"""
+
+    def __init__(self, name, write, read):
+        self.name = name
+        self.write = write
+        self.read = read
+        self.acked = 0
+        self.writes = 0
+        self.reads = 0
+        self.stale = []
+        self.lock = threading.Lock()
+
+
+def write_price(base, n):
+    call(base, f'/api/products/{PRODUCT_ID}', {
+        'name': f'Coherence product {PRODUCT_ID - 1}', 'category': 'vegetables',
+        'price': round(1 + n / 100, 2), 'unit': 'kg', 'active': 1}, method='PUT')
+
+
+def read_price(base):
+    _, catalog = call(base, '/api/products?view=list')
+    product = next(p for p in catalog['products'] if p['id'] == PRODUCT_ID)
+    return round((product['price'] - 1) * 100)
+
+
+def write_settings(base, n):
+    call(base, '/api/settings', {'shopName': f'Coherence {n}'})
+
+
+def read_settings(base):
+    _, settings = call(base, '/api/settings')
+    name = settings.get('shopName') or ''
+    return int(name.split()[-1]) if name.startswith('Coherence ') else 0
+
+
+def writer_loop(topic, workers, stop):
+    n = 0
+    while not stop.is_set():
+        n += 1
+        topic.write(workers[n % len(workers)], n)
+        with topic.lock:
+            topic.acked = n
+            topic.writes += 1
+        time.sleep(WRITE_PAUSE_SECONDS)
+
+
+def reader_loop(topics, workers, stop, seed):
+    rnd = random.Random(seed)
+    while not stop.is_set():
+        topic = rnd.choice(topics)
+        index = rnd.randrange(len(workers))
+        with topic.lock:
+            expected = topic.acked
+        seen = topic.read(workers[index])
+        with topic.lock:
+            topic.reads += 1
+            if seen < expected:
+                topic.stale.append((index, expected - seen))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench.coherence')
+    parser.add_argument('command', nargs='?', default='run', choices=['run', 'serve'])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--readers', type=int, default=8)
+    args = parser.parse_args(argv)
+    if args.command == 'serve':
+        serve()
+        return 0
+
+    path = bench.use_scratch_database()
+    seed()
+    processes = start_workers(args.workers)
+    workers = [base for _, base in processes]
+    print(f'{args.workers} workers, {args.readers} readers, {args.seconds:g}s, database {path}')
+    try:
+        topics = [Topic('catalog', write_price, read_price),
+                  Topic('settings', write_settings, read_settings)]
+        stop = threading.Event()
+        threads = [threading.Thread(target=writer_loop, args=(topic, workers, stop)) for topic in topics]
+        threads += [threading.Thread(target=reader_loop, args=(topics, workers, stop, i))
+                    for i in range(args.readers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        failed = False
+        print(f"{'topic':10} {'writes':>7} {'reads':>7} {'stale':>6} {'max lag':>8}")
+        for topic in topics:
+            lag = max((behind for _, behind in topic.stale), default=0)
+            print(f'{topic.name:10} {topic.writes:>7} {topic.reads:>7} {len(topic.stale):>6} {lag:>8}')
+            failed = failed or bool(topic.stale)
+
+        # Every worker ends up serving the same documents
+        for document in DOCUMENTS:
+            tags = {call(base, document)[0] for base in workers}
+            if len(tags) != 1:
+                print(f'Workers disagree on {document}: {sorted(tags)}')
+                failed = True
+
+        print(f"{'worker':>6} {'checks':>7} {'changed':>8} {'invalidated':>12}")
+        for index, base in enumerate(workers):
+            stats = call(base, '/api/admin/db-stats')[1]['coherence']
+            handled = ', '.join(f'{name} {count}' for name, count in sorted(stats['handled'].items()))
+            print(f"{index:>6} {stats['checks']:>7} {stats['reads']:>8}   {handled or '-'}")
+        print('FAILED' if failed else 'OK: every read after a write saw it, on every worker')
+        return 1 if failed else 0
+    finally:
+        for process, _ in processes:
+            process.terminate()
+        for process, _ in processes:
+            process.wait()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
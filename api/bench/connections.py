@@ -0,0 +1,180 @@
+# Glengala Fresh - Open-connection capacity: threaded server vs asyncio
+# python -m bench.connections [--streams 500] [--slow 200] [--hold 3]  (from api/)
+# Starts the app under werkzeug's threaded server and under asgi.py, one at a
+# time on one scratch database. For each, opens --streams live-update streams
+# and --slow clients that send half a request and stall, like a phone on a bad
+# connection. While they're held open it times /api/settings from a fresh client,
+# and reads the server's thread count and resident memory from /proc.
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import bench
+
+MODES = ['threaded', 'asgi']
+# Connections opened at once (werkzeug listens with a backlog of 128)
+BATCH = 100
+CONNECT_TIMEOUT_SECONDS = 10
+SAMPLES = 50
+
+
+def serve(mode):
+    """One server: the app on a free local port, printed for the parent"""
+    if mode == 'asgi':
+        import asgi
+        asyncio.run(asgi.serve(ready=lambda port: print(port, flush=True)))
+        return
+    from werkzeug.serving import make_server
+
+    import app
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    print(server.server_port, flush=True)
+    server.serve_forever()
+
+
+def start_server(mode, connections):
+    env = dict(os.environ, ADMISSION_CONTROL='0', LOG_LEVEL='WARNING',
+               SSE_MAX_STREAMS=str(connections + 10))
+    process = subprocess.Popen([sys.executable, '-m', 'bench.connections', 'serve', '--mode', mode],
+                               env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               stdout=subprocess.PIPE, text=True)
+    return process, int(process.stdout.readline())
+
+
+def process_status(pid):
+    """(threads, resident KB) from /proc"""
+    fields = {}
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            fields[name] = value.split()
+    return int(fields['Threads'][0]), int(fields['VmRSS'][0])
+
+
+async def open_stream(port):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(b'GET /api/stream HTTP/1.1\r\nHost: localhost\r\nAccept: text/event-stream\r\n\r\n')
+    # Held open once the hello frame arrives
+    await reader.readuntil(b'event: hello')
+    return writer
+
+
+async def open_slow(port):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(b'GET /api/settings HTTP/1.1\r\nHost: localhost\r\nUser-Agent: slow')
+    await writer.drain()
+    return writer
+
+
+async def open_all(opener, port, count):
+    """Open count connections in batches; returns (writers, failures)"""
+    writers, failed = [], 0
+    for start in range(0, count, BATCH):
+        batch = [asyncio.wait_for(opener(port), CONNECT_TIMEOUT_SECONDS)
+                 for _ in range(min(BATCH, count - start))]
+        for result in await asyncio.gather(*batch, return_exceptions=True):
+            if isinstance(result, BaseException):
+                failed += 1
+            else:
+                writers.append(result)
+    return writers, failed
+
+
+async def fetch(port, path):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'.encode())
+    head = await reader.readuntil(b'\r\n\r\n')
+    if not head.startswith(b'HTTP/1.1 200'):
+        raise RuntimeError(head[:80])
+    # Done at the last byte of the body, not when the server gets round to closing
+    length = next(int(line.split(b':')[1]) for line in head.split(b'\r\n')
+                  if line.lower().startswith(b'content-length:'))
+    await reader.readexactly(length)
+    writer.close()
+
+
+async def latency(port, samples=SAMPLES):
+    """/api/settings times in ms, one fresh connection each"""
+    times = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        await fetch(port, '/api/settings')
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+async def measure(mode, pid, port, streams, slow, hold):
+    await latency(port, 5)
+    threads_before, rss_before = process_status(pid)
+    idle = await latency(port)
+
+    stream_writers, stream_failed = await open_all(open_stream, port, streams)
+    slow_writers, slow_failed = await open_all(open_slow, port, slow)
+    await asyncio.sleep(hold)
+    threads, rss = process_status(pid)
+    loaded = await latency(port)
+
+    for writer in stream_writers + slow_writers:
+        writer.close()
+    held = len(stream_writers) + len(slow_writers)
+    return {
+        'mode': mode,
+        'streams': len(stream_writers), 'streams_failed': stream_failed,
+        'slow': len(slow_writers), 'slow_failed': slow_failed,
+        'threads': threads - threads_before,
+        'rss_mb': rss / 1024,
+        'kb_per_connection': (rss - rss_before) / held if held else 0,
+        'idle_p50': statistics.median(idle),
+        'loaded_p50': statistics.median(loaded),
+        'loaded_p95': statistics.quantiles(loaded, n=20)[-1],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench.connections')
+    parser.add_argument('command', nargs='?', default='run', choices=['run', 'serve'])
+    parser.add_argument('--mode', choices=MODES, default='threaded')
+    parser.add_argument('--streams', type=int, default=500, help='live-update streams to hold open')
+    parser.add_argument('--slow', type=int, default=200, help='clients stalled mid-request')
+    parser.add_argument('--hold', type=float, default=3, help='seconds to hold them before measuring')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args(argv)
+    if args.command == 'serve':
+        serve(args.mode)
+        return 0
+
+    path = bench.use_scratch_database()
+    import app
+    app.init_db()
+    print(f'{args.streams} streams, {args.slow} slow clients, database {path}')
+    results = []
+    for mode in MODES:
+        process, port = start_server(mode, args.streams + args.slow)
+        try:
+            results.append(asyncio.run(measure(mode, process.pid, port, args.streams, args.slow, args.hold)))
+        finally:
+            process.terminate()
+            process.wait()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"{'mode':9} {'streams':>8} {'slow':>6} {'failed':>7} {'+threads':>9} {'RSS MB':>7} "
+          f"{'KB/conn':>8} {'idle p50':>9} {'p50 ms':>7} {'p95 ms':>7}")
+    for r in results:
+        print(f"{r['mode']:9} {r['streams']:>8} {r['slow']:>6} {r['streams_failed'] + r['slow_failed']:>7} "
+              f"{r['threads']:>9} {r['rss_mb']:>7.1f} {r['kb_per_connection']:>8.1f} "
+              f"{r['idle_p50']:>9.2f} {r['loaded_p50']:>7.2f} {r['loaded_p95']:>7.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+# Glengala Fresh - Synthetic benchmark dataset
+# Fills a scratch database with a shop's worth of products, customers, order
+# history, price changes, favourites and push subscriptions. The same scale
+# and seed always give the same rows, so runs against different versions of
+# the code are timing the same data.
+
+import json
+import random
+from datetime import datetime, timedelta
+
+SCALES = {
+    'small': {'products': 150, 'users': 500, 'orders': 2000, 'price_changes': 300,
+              'favorites': 1000, 'subscriptions': 50},
+    'medium': {'products': 600, 'users': 5000, 'orders': 30000, 'price_changes': 3000,
+               'favorites': 10000, 'subscriptions': 500},
+    'large': {'products': 2000, 'users': 50000, 'orders': 300000, 'price_changes': 20000,
+              'favorites': 100000, 'subscriptions': 5000},
+}
+
+CATEGORIES = ['vegetables', 'fruits', 'herbs', 'juices', 'nuts', 'pantry']
+UNITS = [('kg', 6), ('each', 3), ('bunch', 2), ('hundredg', 1), ('halfkg', 1)]
+PRODUCE = ['Apple', 'Avocado', 'Banana', 'Beetroot', 'Broccoli', 'Cabbage', 'Capsicum',
+           'Carrot', 'Cauliflower', 'Celery', 'Cherry', 'Chilli', 'Coriander', 'Cucumber',
+           'Eggplant', 'Garlic', 'Ginger', 'Grape', 'Kale', 'Kiwi', 'Leek', 'Lemon',
+           'Lettuce', 'Lime', 'Mandarin', 'Mango', 'Mint', 'Mushroom', 'Onion', 'Orange',
+           'Parsley', 'Pear', 'Peach', 'Plum', 'Potato', 'Pumpkin', 'Radish', 'Spinach',
+           'Strawberry', 'Sweet Potato', 'Tomato', 'Watermelon', 'Zucchini', 'Almond',
+           'Cashew', 'Walnut', 'Basil', 'Fennel', 'Asparagus', 'Blueberry']
+VARIETIES = ['', 'Red', 'Green', 'Golden', 'Baby', 'Organic', 'Dutch', 'Royal', 'Lebanese',
+             'Roma', 'Pink Lady', 'Kent', 'Desiree', 'Kipfler', 'Heirloom', 'Wild']
+POSTCODES = ['3020', '3022', '3021', '3023']
+# Orders are spread over this many days before today
+ORDER_HISTORY_DAYS = 45
+
+
+def scale(name='small', **overrides):
+    """Row counts for a named scale, with per-table overrides (None = keep)"""
+    counts = dict(SCALES[name])
+    counts.update({table: count for table, count in overrides.items() if count is not None})
+    return counts
+
+
+def _products(rnd, count):
+    units, weights = zip(*UNITS)
+    rows = []
+    for i in range(count):
+        variety = VARIETIES[(i // len(PRODUCE)) % len(VARIETIES)]
+        name = f'{variety} {PRODUCE[i % len(PRODUCE)]}'.strip()
+        if i >= len(PRODUCE) * len(VARIETIES):
+            name = f'{name} {i // (len(PRODUCE) * len(VARIETIES)) + 1}'
+        price = round(rnd.uniform(0.5, 15), 2)
+        unit = rnd.choices(units, weights)[0]
+        special = rnd.random() < 0.1
+        rows.append((name, CATEGORIES[i % len(CATEGORIES)], price, unit,
+                     0 if rnd.random() < 0.05 else 1,
+                     1 if i % 25 == 0 else 0, i % 25,
+                     1 if special else 0,
+                     round(price * 1.7, 2) if special else 0,
+                     2 if special else 0,
+                     unit if special else '',
+                     1 if rnd.random() < 0.1 else 0,
+                     1 if 'Organic' in name else 0,
+                     rnd.randint(0, 500)))
+    return rows
+
+
+def _orders(rnd, count, products, user_count):
+    now = datetime.utcnow()
+    rows = []
+    for _ in range(count):
+        lines = []
+        for product_id in rnd.sample(products, min(len(products), rnd.randint(1, 8))):
+            quantity = rnd.randint(1, 5)
+            lines.append({'id': product_id, 'quantity': quantity,
+                          'total': round(quantity * rnd.uniform(0.5, 15), 2)})
+        total = round(sum(line['total'] for line in lines), 2)
+        created_at = now - timedelta(seconds=rnd.randint(0, ORDER_HISTORY_DAYS * 86400))
+        user_id = rnd.randint(1, user_count) if user_count and rnd.random() < 0.8 else None
+        rows.append((user_id, json.dumps(lines), total, rnd.choice(['pickup', 'delivery']),
+                     'completed', int(total), created_at.strftime('%Y-%m-%d %H:%M:%S')))
+    return rows
+
+
+def generate(counts, seed=1):
+    """Create the schema in DATABASE_PATH and fill it; returns the row counts.
+
+    Call bench.use_scratch_database() first - this imports app.
+    """
+    import achievements
+    import app
+    import catalog_sync
+    import order_items
+    import reports
+    from db import pool
+
+    rnd = random.Random(seed)
+    app.init_db()
+    with pool.connection() as conn:
+        c = conn.cursor()
+        c.executemany('''INSERT INTO products
+                         (name, category, price, unit, active, mostPopular, popularOrder,
+                          hasSpecial, specialPrice, specialQuantity, specialUnit, isPremium,
+                          isOrganic, stock)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                      _products(rnd, counts['products']))
+        c.execute('SELECT id, name, price FROM products ORDER BY id')
+        products = c.fetchall()
+        product_ids = [row[0] for row in products]
+        catalog_sync.record_changes(c, product_ids)
+
+        users = counts['users']
+        c.executemany('''INSERT INTO users (name, phone, address, postcode, loyalty_points,
+                                            current_streak, longest_streak, total_orders)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                      [(f'Customer {i}', f'04{i:08d}', f'{i} Bench Street', rnd.choice(POSTCODES),
+                        rnd.randint(0, 2000), rnd.randint(0, 5), rnd.randint(0, 20),
+                        rnd.randint(0, 100)) for i in range(users)])
+
+        c.executemany('''INSERT INTO orders (user_id, items, total, fulfilment, status,
+                                             points_earned, created_at)
+                         VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                      _orders(rnd, counts['orders'], product_ids, users))
+
+        changes = []
+        now = datetime.utcnow()
+        for _ in range(counts['price_changes']):
+            product_id, name, price = rnd.choice(products)
+            changed_at = now - timedelta(seconds=rnd.randint(0, 14 * 86400))
+            changes.append((product_id, name, round(price * rnd.uniform(0.8, 1.25), 2), price,
+                            changed_at.strftime('%Y-%m-%d %H:%M:%S'), 1))
+        c.executemany('''INSERT INTO price_changes (product_id, product_name, old_price, new_price,
+                                                    changed_at, notified)
+                         VALUES (?, ?, ?, ?, ?, ?)''', changes)
+
+        if users:
+            favorites = {(rnd.randint(1, users), rnd.choice(product_ids))
+                         for _ in range(counts['favorites'])}
+            c.executemany('INSERT INTO favorites (user_id, product_id) VALUES (?, ?)',
+                          sorted(favorites))
+
+        # Endpoints on the discard port: deliveries fail fast instead of leaving the machine
+        c.executemany('''INSERT INTO push_subscriptions (user_id, endpoint, p256dh, auth)
+                         VALUES (?, ?, 'bench-key', 'bench-auth')''',
+                      [(rnd.randint(1, users) if users else None,
+                        f'http://127.0.0.1:9/api/mock-push/bench-{i}')
+                       for i in range(counts['subscriptions'])])
+
+        c.executemany('''INSERT INTO daily_specials (product_id, discount_percent, special_date)
+                         VALUES (?, ?, date('now', 'localtime'))''',
+                      [(product_id, rnd.choice([10, 15, 20, 25]))
+                       for product_id in rnd.sample(product_ids, min(8, len(product_ids)))])
+        conn.commit()
+
+        # Line items, trending counters, customer stats and sales rollups, exactly as
+        # startup builds them
+        order_items.backfill(conn)
+        achievements.backfill(conn)
+        reports.backfill(conn)
+        c.execute('ANALYZE')
+        conn.commit()
+    app.invalidate_catalog()
+    return counts
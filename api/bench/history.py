@@ -0,0 +1,105 @@
+# Glengala Fresh - Benchmark history
+# Every run is appended to a JSON file with the git revision, machine and
+# dataset it ran with. compare() lines two runs up route by route so a
+# change can be shown to help (or caught making things worse).
+
+import json
+import os
+import platform
+import subprocess
+import time
+
+HISTORY_PATH = os.environ.get('BENCH_HISTORY',
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history.json'))
+# A latency/throughput change smaller than this is noise, not a regression
+REGRESSION_THRESHOLD = 0.10
+
+
+def load(path=HISTORY_PATH):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def append(entry, path=HISTORY_PATH):
+    runs = load(path)
+    runs.append(entry)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(runs, f, indent=1)
+    os.replace(tmp, path)
+    return len(runs) - 1
+
+
+def git_revision():
+    """{'commit', 'dirty'} for the working tree, or None outside git"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=here,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=here,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return {'commit': commit, 'dirty': bool(status.strip())}
+
+
+def machine():
+    return {'python': platform.python_version(), 'platform': platform.platform(),
+            'cpus': os.cpu_count()}
+
+
+def entry(label, config, results):
+    return {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'label': label, 'git': git_revision(),
+            'machine': machine(), 'config': config, 'results': results}
+
+
+def describe(index, run):
+    git = run.get('git') or {}
+    revision = git.get('commit', '?') + ('+' if git.get('dirty') else '')
+    label = f" {run['label']}" if run.get('label') else ''
+    return f"#{index} {run['time']} {revision}{label}"
+
+
+def _change(before, after):
+    if not before or after is None:
+        return None
+    return (after - before) / before
+
+
+def compare(before, after, threshold=REGRESSION_THRESHOLD):
+    """Rows of (transport, threads, scenario, metric, before, after, change, regressed)"""
+    rows = []
+    for transport, levels in after['results'].items():
+        for level, scenarios in levels.items():
+            old_scenarios = before['results'].get(transport, {}).get(level, {})
+            for name, stats in scenarios.items():
+                old = old_scenarios.get(name)
+                if not old:
+                    continue
+                for metric, higher_is_better in (('rps', True), ('p50_ms', False), ('p95_ms', False),
+                                                 ('p99_ms', False)):
+                    change = _change(old.get(metric), stats.get(metric))
+                    if change is None:
+                        continue
+                    worse = -change if higher_is_better else change
+                    rows.append((transport, level, name, metric, old[metric], stats[metric],
+                                 change, worse > threshold))
+    return rows
+
+
+def report(before, after, rows, out=print, only_changes=False):
+    if before['config'].get('scale') != after['config'].get('scale'):
+        out('warning: the runs used different dataset sizes')
+    if before.get('machine') != after.get('machine'):
+        out('warning: the runs were on different machines')
+    out(f"{'':8} {'threads':>7} {'scenario':22} {'metric':7} {'before':>9} {'after':>9} {'change':>8}")
+    for transport, level, name, metric, old, new, change, regressed in rows:
+        if only_changes and abs(change) <= REGRESSION_THRESHOLD:
+            continue
+        flag = '  REGRESSION' if regressed else ''
+        out(f'{transport:8} {level:>7} {name:22} {metric:7} {old:>9} {new:>9} {change:>+8.1%}{flag}')
+    regressions = sum(1 for row in rows if row[-1])
+    out(f'{regressions} regression(s) over {REGRESSION_THRESHOLD:.0%}')
+    return regressions
@@ -0,0 +1,250 @@
+# Glengala Fresh - Benchmark runner
+# Drives scenarios through one of two transports: Flask's test client (the app
+# in-process, no sockets - isolates our own code) or a real threaded werkzeug
+# server on a local port (adds HTTP parsing, sockets and thread handoff). Each
+# scenario is run with N threads sharing the request count, and reported as
+# throughput plus latency percentiles.
+
+import http.client
+import json
+import logging
+import threading
+import time
+
+from bench.scenarios import SkipScenario
+
+# Share of each scenario's requests run untimed first (cache fills, pool connections)
+WARMUP_FRACTION = 0.05
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an unsorted list"""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def format_row(name, stats):
+    cells = [stats['rps'], stats['p50_ms'], stats['p95_ms'], stats['p99_ms']]
+    cells = ['-' if cell is None else cell for cell in cells]
+    return (f"  {name:22} {cells[0]:>9} {cells[1]:>8} {cells[2]:>8} {cells[3]:>8} "
+            f"{stats['errors']:>6}")
+
+
+class ClientSession:
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+
+    def request(self, method, call, stream=False):
+        """(status, headers, body)"""
+        response = self.client.open(call.path, method=method, json=call.json,
+                                    headers=call.headers, buffered=not stream)
+        if stream:
+            body = next(response.iter_encoded(), b'')
+            response.close()
+        else:
+            body = response.get_data()
+        return response.status_code, response.headers, body
+
+    def close(self):
+        pass
+
+
+class ClientTransport:
+    name = 'client'
+
+    def __init__(self, flask_app):
+        self.app = flask_app
+
+    def session(self):
+        return ClientSession(self.app)
+
+    def close(self):
+        pass
+
+
+class ServerSession:
+    """One keep-alive connection per thread, reopened if the server drops it"""
+
+    def __init__(self, port):
+        self.port = port
+        self.conn = None
+
+    def _send(self, conn, method, call):
+        headers = dict(call.headers or {})
+        body = None
+        if call.json is not None:
+            body = json.dumps(call.json).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        conn.request(method, call.path, body=body, headers=headers)
+        return conn.getresponse()
+
+    def request(self, method, call, stream=False):
+        if stream:
+            conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+            try:
+                response = self._send(conn, method, call)
+                body = b''
+                while b'\n\n' not in body:
+                    chunk = response.read1(4096)
+                    if not chunk:
+                        break
+                    body += chunk
+                return response.status, response.headers, body
+            finally:
+                conn.close()
+
+        for attempt in (1, 2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+            try:
+                response = self._send(self.conn, method, call)
+                body = response.read()
+                if response.will_close:
+                    self.close()
+                return response.status, response.headers, body
+            except (http.client.RemoteDisconnected, ConnectionError, http.client.CannotSendRequest):
+                self.close()
+                if attempt == 2:
+                    raise
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+class ServerTransport:
+    name = 'server'
+
+    def __init__(self, flask_app):
+        from werkzeug.serving import make_server
+        # One log line per request would swamp the report
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        self.server = make_server('127.0.0.1', 0, flask_app, threaded=True)
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, name='bench-server', daemon=True)
+        self.thread.start()
+
+    def session(self):
+        return ServerSession(self.port)
+
+    def close(self):
+        self.server.shutdown()
+        self.thread.join(5)
+
+
+TRANSPORTS = {'client': ClientTransport, 'server': ServerTransport}
+
+
+def run_scenario(transport, scenario, ctx, requests, concurrency):
+    """Time one scenario; returns a stats dict"""
+    if scenario.max_requests:
+        requests = min(requests, scenario.max_requests)
+    concurrency = max(1, min(concurrency, requests))
+    per_thread = max(1, requests // concurrency)
+    warmup = int(per_thread * concurrency * WARMUP_FRACTION)
+
+    setup = transport.session()
+    try:
+        if scenario.prepare:
+            scenario.prepare(ctx, setup, per_thread * concurrency + warmup)
+        for _ in range(warmup):
+            setup.request(scenario.method, scenario.build(ctx), scenario.stream)
+    finally:
+        setup.close()
+
+    latencies = []
+    statuses = {}
+    failures = []
+    sizes = []
+    lock = threading.Lock()
+    start_line = threading.Barrier(concurrency + 1)
+
+    def worker():
+        session = transport.session()
+        own_latencies = []
+        own_statuses = {}
+        own_bytes = 0
+        calls = [scenario.build(ctx) for _ in range(per_thread)]
+        start_line.wait()
+        try:
+            for call in calls:
+                started = time.perf_counter()
+                try:
+                    status, _, body = session.request(scenario.method, call, scenario.stream)
+                except Exception as e:
+                    with lock:
+                        failures.append(f'{type(e).__name__}: {e}')
+                    continue
+                own_latencies.append(time.perf_counter() - started)
+                own_statuses[status] = own_statuses.get(status, 0) + 1
+                own_bytes += len(body)
+        finally:
+            session.close()
+        with lock:
+            latencies.extend(own_latencies)
+            for status, count in own_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+            sizes.append(own_bytes)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    start_line.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    unexpected = sum(count for status, count in statuses.items() if status not in scenario.expect)
+    done = len(latencies)
+    return {
+        'requests': done,
+        'concurrency': concurrency,
+        'errors': unexpected + len(failures),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'seconds': round(elapsed, 4),
+        'rps': round(done / elapsed, 1) if elapsed else None,
+        'mean_ms': round(sum(latencies) / done * 1000, 3) if done else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3) if done else None,
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3) if done else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3) if done else None,
+        'max_ms': round(max(latencies) * 1000, 3) if done else None,
+        'bytes': round(sum(sizes) / done) if done else 0,
+        'failure': failures[0] if failures else None,
+    }
+
+
+def run(scenarios, ctx, transports=('client', 'server'), concurrency=(1, 8), requests=200,
+        report=print):
+    """{transport: {concurrency: {scenario: stats}}} for every combination"""
+    import app
+    from push_dispatch import dispatcher
+
+    # Per-write info logs would interleave with the report
+    app_log = logging.getLogger('glengala')
+    log_level = app_log.level
+    app_log.setLevel(logging.WARNING)
+    results = {}
+    for name in transports:
+        transport = TRANSPORTS[name](app.app)
+        try:
+            for level in concurrency:
+                level_results = results.setdefault(name, {}).setdefault(str(level), {})
+                report(f'\n{name}, {level} thread(s)')
+                report(f"  {'scenario':22} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+                       f"{'errors':>6}")
+                for scenario in scenarios:
+                    try:
+                        stats = run_scenario(transport, scenario, ctx, requests, level)
+                    except SkipScenario as e:
+                        report(f'  {scenario.name:22} skipped: {e}')
+                        continue
+                    level_results[scenario.name] = stats
+                    report(format_row(scenario.name, stats))
+        finally:
+            transport.close()
+    # send-price-notifications starts the push dispatcher; don't leave it retrying
+    dispatcher.stop()
+    app_log.setLevel(log_level)
+    return results
@@ -0,0 +1,299 @@
+# Glengala Fresh - Benchmark scenarios, one or more per API route
+# A scenario builds one request at a time (path, JSON body, headers) from the
+# synthetic dataset; prepare() runs untimed beforehand to create whatever the
+# timed requests consume (throwaway products to delete, stored images, ETags).
+# `python -m bench run` warns about any route in app.py without a scenario.
+
+import base64
+import io
+import itertools
+import random
+import threading
+from collections import namedtuple
+from datetime import date, timedelta
+from urllib.parse import quote
+
+Call = namedtuple('Call', 'path json headers')
+Call.__new__.__defaults__ = (None, None)
+
+SEARCH_TERMS = ['tom', 'potato', 'brocoli', 'app', 'organic carrot', 'mango', 'swet potato',
+                'red', 'lem', 'bana', 'herbs', 'kale']
+
+
+class SkipScenario(Exception):
+    """The scenario can't run here (missing optional dependency)"""
+
+
+class Context:
+    """Dataset facts shared by every scenario in a run"""
+
+    def __init__(self, counts, seed=1):
+        import catalog_sync
+        from db import pool
+
+        self.counts = counts
+        self.seed = seed
+        self._local = threading.local()
+        self._unique = itertools.count(1)
+        self.etags = {}
+        self.pending = {}
+        with pool.connection() as conn:
+            c = conn.cursor()
+            c.execute('''SELECT id, name, category, price, unit FROM products
+                         WHERE active = 1 ORDER BY id''')
+            self.products = [dict(row) for row in c.fetchall()]
+            self.catalog_version = catalog_sync.current_version(c)
+        self.product_ids = [product['id'] for product in self.products]
+
+    def random(self):
+        rnd = getattr(self._local, 'random', None)
+        if rnd is None:
+            rnd = self._local.random = random.Random(f'{self.seed}-{threading.get_ident()}')
+        return rnd
+
+    def unique(self):
+        return next(self._unique)
+
+    def product(self):
+        return self.random().choice(self.products)
+
+    def product_id(self):
+        return self.random().choice(self.product_ids)
+
+    def user_id(self):
+        return self.random().randint(1, max(1, self.counts['users']))
+
+    def cart(self, lines=4):
+        rnd = self.random()
+        return {'items': [{'id': product_id, 'quantity': rnd.randint(1, 4)}
+                          for product_id in rnd.sample(self.product_ids, min(lines, len(self.product_ids)))],
+                'user_id': self.user_id(),
+                'fulfilment': 'delivery',
+                'postcode': '3020'}
+
+    def take(self, name):
+        """Next prepared item for a scenario (thread-safe list pop)"""
+        return self.pending[name].pop()
+
+
+class Scenario:
+    def __init__(self, name, method, rule, build, expect=(200,), prepare=None,
+                 max_requests=None, stream=False):
+        self.name = name
+        self.method = method
+        self.rule = rule
+        self.build = build
+        self.expect = expect
+        self.prepare = prepare
+        self.max_requests = max_requests
+        # Time to the first event, then hang up (SSE never ends by itself)
+        self.stream = stream
+
+
+def _png(seed):
+    try:
+        from PIL import Image
+    except ImportError:
+        raise SkipScenario('Pillow is not installed')
+    colour = (seed * 37 % 256, seed * 91 % 256, seed * 53 % 256)
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 480), colour).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def _data_url(seed):
+    return 'data:image/png;base64,' + base64.b64encode(_png(seed)).decode('ascii')
+
+
+def _prepare_etag(path):
+    def prepare(ctx, session, count):
+        status, headers, _ = session.request('GET', Call(path))
+        ctx.etags[path] = headers.get('ETag')
+    return prepare
+
+
+def _prepare_throwaway_products(ctx, session, count):
+    from db import pool
+    with pool.connection() as conn:
+        c = conn.cursor()
+        ids = []
+        for n in range(count):
+            c.execute('''INSERT INTO products (name, category, price, unit, active)
+                         VALUES (?, 'vegetables', 1, 'kg', 1)''', (f'Bench throwaway {n}',))
+            ids.append(c.lastrowid)
+        conn.commit()
+    ctx.pending['product delete'] = ids
+
+
+def _prepare_images(ctx, session, count):
+    ctx.pending['image upload'] = [_data_url(ctx.unique()) for _ in range(count)]
+
+
+def _prepare_stored_image(ctx, session, count):
+    import images
+    ctx.stored_image = images.store_image(_png(0)).rsplit('/', 1)[1]
+
+
+def _prepare_subscriptions(ctx, session, count):
+    endpoints = []
+    for _ in range(count):
+        endpoint = f'http://127.0.0.1:9/api/mock-push/unsubscribe-{ctx.unique()}'
+        session.request('POST', Call('/api/subscribe', {
+            'subscription': {'endpoint': endpoint, 'keys': {'p256dh': 'k', 'auth': 'a'}}}))
+        endpoints.append(endpoint)
+    ctx.pending['unsubscribe'] = endpoints
+
+
+def _prepare_favorites(ctx, session, count):
+    pairs = [(ctx.user_id(), ctx.product_id()) for _ in range(count)]
+    from db import pool
+    with pool.connection() as conn:
+        conn.executemany('INSERT OR IGNORE INTO favorites (user_id, product_id) VALUES (?, ?)', pairs)
+        conn.commit()
+    ctx.pending['favorite remove'] = pairs
+
+
+def _product_update(ctx):
+    product = dict(ctx.product())
+    product['price'] = round(product['price'] * ctx.random().uniform(0.9, 1.1), 2) or 0.5
+    return Call(f"/api/products/{product['id']}", product)
+
+
+def _bulk_rows(ctx, fields, count=20):
+    rnd = ctx.random()
+    rows = []
+    for product in rnd.sample(ctx.products, min(count, len(ctx.products))):
+        row = {'id': product['id'], 'price': round(product['price'] * rnd.uniform(0.9, 1.1), 2) or 0.5}
+        if 'stock' in fields:
+            row['stock'] = rnd.randint(0, 500)
+        rows.append(row)
+    return rows
+
+
+def _order(ctx, keyed=False):
+    order = ctx.cart()
+    if keyed:
+        order['idempotency_key'] = f'bench-{ctx.seed}-{ctx.unique()}-{ctx.random().random()}'
+    return order
+
+
+def _year_ago():
+    return (date.today() - timedelta(days=364)).isoformat()
+
+
+def _settings(ctx):
+    return Call('/api/settings', {'shop_name': 'Glengala Fresh', 'primary_color': '#2FA44F',
+                                  'shopHeader': {'backgroundType': 'default',
+                                                 'shopName': 'Glengala Fresh'},
+                                  'revision': ctx.unique()})
+
+
+SCENARIOS = [
+    # Catalog reads
+    Scenario('products list', 'GET', '/api/products', lambda ctx: Call('/api/products?view=list')),
+    Scenario('products admin', 'GET', '/api/products', lambda ctx: Call('/api/products?view=admin')),
+    Scenario('products fields', 'GET', '/api/products',
+             lambda ctx: Call('/api/products?fields=id,name,price,unit')),
+    Scenario('products 304', 'GET', '/api/products',
+             lambda ctx: Call('/api/products?view=list',
+                              headers={'If-None-Match': ctx.etags['/api/products?view=list']}),
+             expect=(304,), prepare=_prepare_etag('/api/products?view=list')),
+    Scenario('product changes', 'GET', '/api/products/changes',
+             lambda ctx: Call(f'/api/products/changes?view=list&since={max(0, ctx.catalog_version - 20)}')),
+    Scenario('search', 'GET', '/api/search',
+             lambda ctx: Call(f'/api/search?q={quote(ctx.random().choice(SEARCH_TERMS))}')),
+    Scenario('product', 'GET', '/api/products/<int:product_id>',
+             lambda ctx: Call(f'/api/products/{ctx.product_id()}')),
+    Scenario('daily specials', 'GET', '/api/daily-specials', lambda ctx: Call('/api/daily-specials')),
+    Scenario('trending', 'GET', '/api/trending', lambda ctx: Call('/api/trending')),
+    Scenario('price changes', 'GET', '/api/price-changes', lambda ctx: Call('/api/price-changes')),
+    Scenario('settings', 'GET', '/api/settings', lambda ctx: Call('/api/settings')),
+    Scenario('user', 'GET', '/api/user/<int:user_id>', lambda ctx: Call(f'/api/user/{ctx.user_id()}')),
+    Scenario('image', 'GET', '/api/images/<name>', lambda ctx: Call(f'/api/images/{ctx.stored_image}'),
+             prepare=_prepare_stored_image),
+    Scenario('shop page', 'GET', '/', lambda ctx: Call('/')),
+    Scenario('bootstrap', 'GET', '/api/bootstrap', lambda ctx: Call('/api/bootstrap')),
+    Scenario('bootstrap user', 'GET', '/api/bootstrap',
+             lambda ctx: Call(f'/api/bootstrap?user_id={ctx.user_id()}')),
+    Scenario('static file', 'GET', '/<path:filename>', lambda ctx: Call('/shop-styles.css')),
+    Scenario('stream', 'GET', '/api/stream', lambda ctx: Call('/api/stream'),
+             max_requests=50, stream=True),
+
+    # Pricing
+    Scenario('quote', 'POST', '/api/cart/quote', lambda ctx: Call('/api/cart/quote', ctx.cart())),
+    Scenario('quote batch', 'POST', '/api/cart/quote',
+             lambda ctx: Call('/api/cart/quote', {'carts': [ctx.cart() for _ in range(20)]})),
+
+    # Customer writes
+    Scenario('register', 'POST', '/api/user/register',
+             lambda ctx: Call('/api/user/register', {'name': 'Bench customer',
+                                                     'phone': f'05{ctx.unique():08d}',
+                                                     'postcode': '3020'})),
+    Scenario('order', 'POST', '/api/order', lambda ctx: Call('/api/order', _order(ctx))),
+    Scenario('achievements seen', 'POST', '/api/user/<int:user_id>/achievements/seen',
+             lambda ctx: Call(f'/api/user/{ctx.user_id()}/achievements/seen', {})),
+    Scenario('orders batch', 'POST', '/api/orders/batch',
+             lambda ctx: Call('/api/orders/batch', {'orders': [_order(ctx, keyed=True) for _ in range(10)]})),
+    Scenario('favorite add', 'POST', '/api/favorites',
+             lambda ctx: Call('/api/favorites', {'user_id': ctx.user_id(), 'product_id': ctx.product_id()})),
+    Scenario('favorite remove', 'DELETE', '/api/favorites/<int:user_id>/<int:product_id>',
+             lambda ctx: Call('/api/favorites/%d/%d' % ctx.take('favorite remove')),
+             prepare=_prepare_favorites),
+    Scenario('subscribe', 'POST', '/api/subscribe',
+             lambda ctx: Call('/api/subscribe', {
+                 'user_id': ctx.user_id(),
+                 'subscription': {'endpoint': f'http://127.0.0.1:9/api/mock-push/new-{ctx.unique()}',
+                                  'keys': {'p256dh': 'bench-key', 'auth': 'bench-auth'}}})),
+    Scenario('unsubscribe', 'POST', '/api/unsubscribe',
+             lambda ctx: Call('/api/unsubscribe', {'endpoint': ctx.take('unsubscribe')}),
+             prepare=_prepare_subscriptions),
+    Scenario('mark seen', 'POST', '/api/mark-changes-seen',
+             lambda ctx: Call('/api/mark-changes-seen', {'change_ids': [1, 2, 3]})),
+
+    # Admin
+    Scenario('settings save', 'POST', '/api/settings', _settings),
+    Scenario('product update', 'PUT', '/api/products/<int:product_id>', _product_update),
+    Scenario('product create', 'POST', '/api/products',
+             lambda ctx: Call('/api/products', {'name': f'Bench product {ctx.unique()}',
+                                                'category': 'vegetables', 'price': 2.5, 'unit': 'kg'})),
+    Scenario('product delete', 'DELETE', '/api/products/<int:product_id>',
+             lambda ctx: Call(f"/api/products/{ctx.take('product delete')}"),
+             prepare=_prepare_throwaway_products),
+    Scenario('products bulk', 'POST', '/api/products/bulk',
+             lambda ctx: Call('/api/products/bulk', {'products': _bulk_rows(ctx, ['price'])})),
+    Scenario('admin bulk update', 'POST', '/api/admin/bulk-update',
+             lambda ctx: Call('/api/admin/bulk-update', {'products': _bulk_rows(ctx, ['price', 'stock'])})),
+    Scenario('admin import', 'POST', '/api/admin/import',
+             lambda ctx: Call('/api/admin/import?format=json', _bulk_rows(ctx, ['price', 'stock'], 200))),
+    Scenario('image upload', 'POST', '/api/images',
+             lambda ctx: Call('/api/images', {'photo': ctx.take('image upload')}),
+             prepare=_prepare_images, max_requests=200),
+    Scenario('price notifications', 'POST', '/api/send-price-notifications',
+             lambda ctx: Call('/api/send-price-notifications')),
+    Scenario('push status', 'GET', '/api/push/status', lambda ctx: Call('/api/push/status')),
+    Scenario('mock push', 'POST', '/api/mock-push/<token>',
+             lambda ctx: Call(f'/api/mock-push/bench-{ctx.unique()}', {'title': 'Bench'}), expect=(201,)),
+    Scenario('mock push log', 'GET', '/api/mock-push', lambda ctx: Call('/api/mock-push')),
+    Scenario('metrics', 'GET', '/api/metrics', lambda ctx: Call('/api/metrics')),
+    Scenario('db stats', 'GET', '/api/admin/db-stats', lambda ctx: Call('/api/admin/db-stats')),
+    Scenario('query plans', 'GET', '/api/admin/query-plans', lambda ctx: Call('/api/admin/query-plans')),
+    Scenario('report summary', 'GET', '/api/admin/reports/<name>',
+             lambda ctx: Call(f'/api/admin/reports/summary?from={_year_ago()}&group=week')),
+    Scenario('report products', 'GET', '/api/admin/reports/<name>',
+             lambda ctx: Call(f'/api/admin/reports/products?from={_year_ago()}')),
+    Scenario('report heatmap', 'GET', '/api/admin/reports/<name>',
+             lambda ctx: Call(f'/api/admin/reports/heatmap?from={_year_ago()}')),
+]
+
+
+def uncovered(flask_app, scenarios=SCENARIOS):
+    """(method, rule) pairs in the app that no scenario exercises"""
+    covered = {(scenario.method, scenario.rule) for scenario in scenarios}
+    missing = []
+    for rule in flask_app.url_map.iter_rules():
+        if rule.endpoint == 'static':
+            continue
+        for method in sorted(rule.methods - {'HEAD', 'OPTIONS'}):
+            if (method, rule.rule) not in covered:
+                missing.append((method, rule.rule))
+    return missing
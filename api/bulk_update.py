@@ -0,0 +1,145 @@
+# Glengala Fresh - Set-based bulk product updates
+# Validates a whole payload first, diffs it against the catalog in one read,
+# then writes only the changed rows with executemany in a single transaction,
+# logging price_changes and catalog versions in the same pass.
+
+from datetime import datetime, timezone
+import catalog_sync
+import images
+from images import ImageError
+
+# Editable columns and how to normalise incoming values for comparison
+FIELD_TYPES = {
+    'name': 'text',
+    'category': 'text',
+    'price': 'real',
+    'unit': 'text',
+    'active': 'flag',
+    'photo': 'text',
+    'hasSpecial': 'flag',
+    'specialPrice': 'real',
+    'specialQuantity': 'int',
+    'specialUnit': 'text',
+    'isPremium': 'flag',
+    'isOrganic': 'flag',
+    'stock': 'int',
+    'mostPopular': 'flag',
+    'popularOrder': 'int',
+}
+
+# /api/products/bulk may change every editable column
+CATALOG_FIELDS = list(FIELD_TYPES)
+# /api/admin/bulk-update only touches price and stock
+PRICE_STOCK_FIELDS = ['price', 'stock']
+
+REQUIRED_NON_NULL = {'name', 'category', 'price', 'unit'}
+
+
+class BulkValidationError(ValueError):
+    """Payload rejected before anything was written"""
+
+    def __init__(self, errors):
+        super().__init__(f'{len(errors)} invalid product(s)')
+        self.errors = errors
+
+
+def normalise(field, value):
+    kind = FIELD_TYPES[field]
+    if value is None:
+        if field in REQUIRED_NON_NULL:
+            raise ValueError(f'{field} is required')
+        return None
+    if kind == 'flag':
+        return 1 if value and value not in ('0', 'false') else 0
+    if kind == 'real':
+        return float(value)
+    if kind == 'int':
+        return int(float(value))
+    if field == 'photo':
+        return images.normalize_photo(str(value))
+    return str(value)
+
+
+def validate(products, fields):
+    """{id: {field: value}} for the whole payload, or raise BulkValidationError.
+
+    Only keys present in a row are updated; absent keys keep their current value.
+    """
+    if not isinstance(products, list):
+        raise BulkValidationError([{'index': None, 'error': 'products must be a list'}])
+    rows = {}
+    errors = []
+    for index, product in enumerate(products):
+        if not isinstance(product, dict):
+            errors.append({'index': index, 'error': 'product must be an object'})
+            continue
+        try:
+            product_id = int(product.get('id'))
+        except (TypeError, ValueError):
+            errors.append({'index': index, 'error': 'id is required'})
+            continue
+        values = {}
+        for field in fields:
+            if field not in product:
+                continue
+            try:
+                values[field] = normalise(field, product[field])
+            except (TypeError, ValueError, ImageError) as e:
+                errors.append({'index': index, 'id': product_id, 'field': field, 'error': str(e)})
+        # Later duplicates of the same id win, like sequential UPDATEs did
+        rows.setdefault(product_id, {}).update(values)
+    if errors:
+        raise BulkValidationError(errors)
+    return rows
+
+
+def apply(c, rows, fields):
+    """Diff rows against the catalog and write the changes; returns a summary.
+
+    Runs on the writer thread, so the diff is read under the write lock.
+    """
+    columns = ['id', 'name'] + [field for field in fields if field != 'name']
+    c.execute(f"SELECT {', '.join(columns)} FROM products")
+    current = {row['id']: dict(row) for row in c.fetchall()}
+
+    changes = []
+    missing = []
+    updates = []
+    price_changes = []
+    # UTC, like the column's CURRENT_TIMESTAMP default
+    now = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    for product_id, values in rows.items():
+        existing = current.get(product_id)
+        if existing is None:
+            missing.append(product_id)
+            continue
+        diff = {field: [existing[field], value]
+                for field, value in values.items() if existing[field] != value}
+        if not diff:
+            continue
+        merged = dict(existing, **values)
+        updates.append(tuple(merged[field] for field in fields) + (product_id,))
+        changes.append({'id': product_id, 'name': existing['name'], 'fields': diff})
+        # Same rule as update_product: only real changes from a known price
+        if 'price' in diff and existing['price'] and merged['price']:
+            price_changes.append((product_id, existing['name'], existing['price'],
+                                  merged['price'], now))
+
+    if updates:
+        assignments = ', '.join(f'{field} = ?' for field in fields)
+        c.executemany(f'''UPDATE products SET {assignments}, updated_at = CURRENT_TIMESTAMP
+                          WHERE id = ?''', updates)
+    if price_changes:
+        c.executemany('''INSERT INTO price_changes
+                         (product_id, product_name, old_price, new_price, changed_at, notified)
+                         VALUES (?, ?, ?, ?, ?, 0)''', price_changes)
+    version = catalog_sync.record_changes(c, [change['id'] for change in changes])
+
+    return {
+        'updated_count': len(changes),
+        'unchanged_count': len(rows) - len(changes) - len(missing),
+        'missing': missing,
+        'price_changes': len(price_changes),
+        'version': version,
+        'changes': changes,
+    }
@@ -0,0 +1,185 @@
+# Glengala Fresh - Pre-serialised response cache
+# Holds JSON documents as ready-to-send bytes (plain, gzip and brotli) with a
+# strong ETag, rebuilt only when a write path invalidates them.
+
+import gzip
+import hashlib
+import json
+import threading
+import time
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # listed in requirements.txt; without it only gzip is served
+    brotli = None
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+# Per-request documents aren't kept, so they get quicker settings
+DYNAMIC_GZIP_LEVEL = 5
+DYNAMIC_BROTLI_QUALITY = 4
+
+
+def dumps(payload):
+    """Serialise exactly like Flask's jsonify (sorted keys, compact, ASCII)"""
+    return json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def compose(parts):
+    """A JSON object's bytes from {key: already-serialised value}, keys sorted like dumps"""
+    return b'{' + b','.join(dumps(key) + b':' + body for key, body in sorted(parts.items())) + b'}'
+
+
+def combined_tag(*parts):
+    """One strong tag for a document assembled from tagged (or raw) parts"""
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()[:20]
+
+
+def etag_matches(if_none_match, tag):
+    """True if an If-None-Match header names tag (any encoding)"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        candidate = candidate.strip('"')
+        # Encoded variants carry a -gz / -br suffix on the same tag
+        if candidate.split('-', 1)[0] == tag:
+            return True
+    return False
+
+
+class Snapshot:
+    """One immutable, pre-encoded version of a JSON document"""
+
+    def __init__(self, payload, version, body=None, tag=None):
+        self.payload = payload
+        self.version = version
+        # body/tag: a document assembled elsewhere (payload may then be None)
+        self.body = body if body is not None else dumps(payload)
+        self.tag = tag or hashlib.sha1(self.body).hexdigest()[:20]
+        self.etag = f'"{self.tag}"'
+        self.gzip = gzip.compress(self.body, compresslevel=GZIP_LEVEL)
+        self.br = brotli.compress(self.body, quality=BROTLI_QUALITY) if brotli else None
+        self.built_at = time.time()
+
+    def matches(self, if_none_match):
+        """True if an If-None-Match header names this snapshot (any encoding)"""
+        return etag_matches(if_none_match, self.tag)
+
+    def encoded(self, accept_encoding):
+        """Pick the best pre-compressed body for the client"""
+        accept_encoding = (accept_encoding or '').lower()
+        if self.br is not None and 'br' in accept_encoding:
+            return self.br, 'br', f'"{self.tag}-br"'
+        if 'gzip' in accept_encoding:
+            return self.gzip, 'gzip', f'"{self.tag}-gz"'
+        return self.body, None, self.etag
+
+
+def snapshot_response(snapshot, mimetype='application/json'):
+    """Serve a snapshot for the current request, answering 304 when unchanged"""
+    if snapshot.matches(request.headers.get('If-None-Match')):
+        response = Response(status=304)
+        response.headers['ETag'] = snapshot.etag
+    else:
+        body, encoding, etag = snapshot.encoded(request.headers.get('Accept-Encoding'))
+        response = Response(body, mimetype=mimetype)
+        response.headers['ETag'] = etag
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    # Always revalidate - a 304 costs no database work
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+def dynamic_response(body, tag, mimetype='application/json'):
+    """Serve a one-off document like snapshot_response, compressing only what is sent"""
+    if etag_matches(request.headers.get('If-None-Match'), tag):
+        response = Response(status=304)
+        response.headers['ETag'] = f'"{tag}"'
+    else:
+        accept_encoding = (request.headers.get('Accept-Encoding') or '').lower()
+        etag = f'"{tag}"'
+        encoding = None
+        if brotli is not None and 'br' in accept_encoding:
+            body, encoding, etag = brotli.compress(body, quality=DYNAMIC_BROTLI_QUALITY), 'br', f'"{tag}-br"'
+        elif 'gzip' in accept_encoding:
+            body, encoding, etag = gzip.compress(body, compresslevel=DYNAMIC_GZIP_LEVEL), 'gzip', f'"{tag}-gz"'
+        response = Response(body, mimetype=mimetype)
+        response.headers['ETag'] = etag
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+class VersionedCache:
+    """Process-level cache of one document, invalidated by a version counter.
+
+    `loader` builds the payload from the database. A rebuild only happens on
+    the first read after `invalidate()` (or once `max_age` seconds have passed,
+    for documents that also change with the clock); a write landing
+    mid-rebuild bumps the version again, so the stale result is never kept.
+    Writes made by other worker processes arrive through coherence.py.
+    """
+
+    def __init__(self, name, loader, max_age=None):
+        self.name = name
+        self.loader = loader
+        self.max_age = max_age
+        self.version = 0
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self.stats = {'hits': 0, 'rebuilds': 0, 'invalidations': 0}
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self.stats['invalidations'] += 1
+
+    def _fresh(self, snapshot):
+        if snapshot is None or snapshot.version != self.version:
+            return False
+        return self.max_age is None or time.time() - snapshot.built_at < self.max_age
+
+    def get(self):
+        snapshot = self._snapshot
+        if self._fresh(snapshot):
+            self.stats['hits'] += 1
+            return snapshot
+        # Single-flight rebuild: concurrent readers wait for one loader call
+        with self._build_lock:
+            snapshot = self._snapshot
+            if self._fresh(snapshot):
+                self.stats['hits'] += 1
+                return snapshot
+            version = self.version
+            snapshot = Snapshot(self.loader(), version)
+            self.stats['rebuilds'] += 1
+            if version == self.version:
+                self._snapshot = snapshot
+        return snapshot
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['version'] = self.version
+        lookups = stats['hits'] + stats['rebuilds']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        snapshot = self._snapshot
+        if snapshot is not None:
+            stats['bytes'] = len(snapshot.body)
+            stats['gzip_bytes'] = len(snapshot.gzip)
+            stats['br_bytes'] = len(snapshot.br) if snapshot.br is not None else None
+        return stats
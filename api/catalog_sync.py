@@ -0,0 +1,83 @@
+# Glengala Fresh - Catalog delta sync
+# Every product write appends to catalog_changes in the same transaction, so the
+# largest change id doubles as a monotonically increasing catalog version.
+# It also moves the 'catalog' coherence topic, so other workers drop their
+# cached catalog.
+
+from coherence import coherence
+
+# Keep this many change rows; clients further behind get a full snapshot
+RETAIN_CHANGES = 5000
+# More changed products than this and a full snapshot is cheaper anyway
+MAX_DELTA_PRODUCTS = 100
+
+
+def create_schema(c):
+    """Create the change log table (called from init_db)"""
+    c.execute('''CREATE TABLE IF NOT EXISTS catalog_changes
+                 (version INTEGER PRIMARY KEY AUTOINCREMENT,
+                  product_id INTEGER NOT NULL,
+                  changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+
+def record_changes(c, product_ids):
+    """Log product ids as changed; call inside the write's transaction"""
+    if not product_ids:
+        # Nothing changed: keep the version, and every worker's caches and ETags
+        return current_version(c)
+    c.executemany('INSERT INTO catalog_changes (product_id) VALUES (?)',
+                  [(product_id,) for product_id in product_ids])
+    version = current_version(c)
+    # Rowid range delete - cheap enough to run on every write
+    c.execute('DELETE FROM catalog_changes WHERE version <= ?',
+              (version - RETAIN_CHANGES,))
+    coherence.bump(c, 'catalog')
+    return version
+
+
+def current_version(c):
+    c.execute('SELECT MAX(version) FROM catalog_changes')
+    return c.fetchone()[0] or 0
+
+
+def changed_at(c, version):
+    """Local time of the change that made version (None before the first change)"""
+    c.execute('''SELECT strftime('%Y-%m-%dT%H:%M:%S', changed_at, 'localtime')
+                 FROM catalog_changes WHERE version = ?''', (version,))
+    row = c.fetchone()
+    return row[0] if row else None
+
+
+def changes_since(c, since, columns=None):
+    """Products upserted/deleted after `since`, or None if a full resync is needed"""
+    version = current_version(c)
+    if since > version:
+        # Client saw a different database (restore/reset) - start again
+        return None
+    if since == version:
+        return {'version': version, 'since': since, 'upserted': [], 'deleted': []}
+
+    c.execute('SELECT MIN(version) FROM catalog_changes')
+    oldest = c.fetchone()[0]
+    if oldest is None or since < oldest - 1:
+        return None
+
+    c.execute('''SELECT DISTINCT product_id FROM catalog_changes
+                 WHERE version > ? AND version <= ?''', (since, version))
+    changed_ids = [row[0] for row in c.fetchall()]
+    if len(changed_ids) > MAX_DELTA_PRODUCTS:
+        return None
+
+    placeholders = ','.join('?' * len(changed_ids))
+    selected = ', '.join(columns) if columns else '*'
+    c.execute(f'SELECT active AS _active, {selected} FROM products WHERE id IN ({placeholders})',
+              changed_ids)
+    rows = {}
+    for row in c.fetchall():
+        product = dict(row)
+        rows[product['id']] = (product.pop('_active'), product)
+
+    upserted = [rows[pid][1] for pid in changed_ids if pid in rows and rows[pid][0]]
+    # Deleted and deactivated products both drop out of the shop catalog
+    deleted = [pid for pid in changed_ids if pid not in rows or not rows[pid][0]]
+    return {'version': version, 'since': since, 'upserted': upserted, 'deleted': deleted}
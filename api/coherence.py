@@ -0,0 +1,155 @@
+# Glengala Fresh - Cache coherence across worker processes
+# Each worker keeps its own catalog, settings and price caches, so a write
+# handled by one worker has to reach the others. Writes that change a cached
+# document bump a topic in cache_generations, in the write's own transaction,
+# with a stamp no other process can produce. Every worker checks
+# PRAGMA data_version (a counter SQLite moves whenever another connection
+# commits - a few microseconds, no I/O) before each request and once a second
+# in the background; only when it has moved are the stamps read, and topics
+# whose stamp changed somewhere else have their handlers run.
+#
+# The worker that made the write invalidates its own caches right away, as it
+# always has; its stamps are remembered so the check doesn't do it twice.
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import db
+
+# Background check interval: the longest a worker with no requests (but open
+# live-update streams) takes to notice another worker's write
+POLL_SECONDS = float(os.environ.get('COHERENCE_POLL_SECONDS', 1))
+# Own stamps remembered until the check sees them (older ones were rolled back)
+MAX_CLAIMED = 1000
+
+log = logging.getLogger('glengala.coherence')
+
+
+def create_schema(c):
+    """Create the topic table (called from init_db)"""
+    c.execute('''CREATE TABLE IF NOT EXISTS cache_generations
+                 (topic TEXT PRIMARY KEY,
+                  generation INTEGER NOT NULL DEFAULT 0,
+                  stamp TEXT NOT NULL,
+                  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP) WITHOUT ROWID''')
+
+
+class Coherence:
+    def __init__(self, path=None, poll_seconds=POLL_SECONDS):
+        self.path = path
+        self.poll_seconds = poll_seconds
+        self._handlers = {}
+        # topic -> last stamp seen (None until the first read)
+        self._known = None
+        self._claimed = OrderedDict()
+        self._claim_lock = threading.Lock()
+        self._check_lock = threading.Lock()
+        self._conn = None
+        self._data_version = None
+        self._thread = None
+        # Reset in a forked worker: its own connection, thread and stamps
+        self._pid = None
+        self._prefix = None
+        self._sequence = 0
+        self.stats = {'checks': 0, 'reads': 0, 'bumps': 0, 'handled': {}, 'handler_errors': 0}
+
+    def subscribe(self, topic, handler):
+        """Run handler() when another process changes topic"""
+        self._handlers.setdefault(topic, []).append(handler)
+
+    def _own_process(self):
+        pid = os.getpid()
+        if pid != self._pid:
+            self._pid = pid
+            self._prefix = f'{pid}-{uuid.uuid4().hex[:12]}'
+            self._conn = None
+            self._thread = None
+            self._data_version = None
+            self._claimed.clear()
+
+    def bump(self, c, *topics):
+        """Mark topics changed; call inside the write's transaction"""
+        with self._claim_lock:
+            self._own_process()
+            stamps = []
+            for topic in topics:
+                self._sequence += 1
+                stamps.append((topic, f'{self._prefix}:{self._sequence}'))
+                self._claimed[stamps[-1][1]] = topic
+            while len(self._claimed) > MAX_CLAIMED:
+                self._claimed.popitem(last=False)
+            self.stats['bumps'] += len(topics)
+        c.executemany('''INSERT INTO cache_generations (topic, generation, stamp) VALUES (?, 1, ?)
+                         ON CONFLICT(topic) DO UPDATE SET generation = generation + 1,
+                         stamp = excluded.stamp, updated_at = CURRENT_TIMESTAMP''', stamps)
+
+    def _connection(self):
+        if self._conn is None:
+            # Never writes, so every commit it sees in data_version is someone else's
+            self._conn = sqlite3.connect(self.path or db.DB_PATH, check_same_thread=False,
+                                         isolation_level=None)
+        return self._conn
+
+    def check(self):
+        """Run handlers for topics other processes have changed since the last check"""
+        with self._check_lock:
+            self._own_process()
+            if self._thread is None and self.poll_seconds:
+                self._thread = threading.Thread(target=self._poll, name='cache-coherence', daemon=True)
+                self._thread.start()
+            self.stats['checks'] += 1
+            conn = self._connection()
+            data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+            if data_version == self._data_version:
+                return []
+            self._data_version = data_version
+            self.stats['reads'] += 1
+            try:
+                stamps = dict(conn.execute('SELECT topic, stamp FROM cache_generations'))
+            except sqlite3.OperationalError:
+                return []  # Table not created yet
+            if self._known is None:
+                # Caches are built from what is there now
+                self._known = stamps
+                return []
+            changed = []
+            for topic, stamp in stamps.items():
+                if self._known.get(topic) == stamp:
+                    continue
+                self._known[topic] = stamp
+                with self._claim_lock:
+                    own = self._claimed.pop(stamp, None) is not None
+                if not own:
+                    changed.append(topic)
+        for topic in changed:
+            self.stats['handled'][topic] = self.stats['handled'].get(topic, 0) + 1
+            for handler in self._handlers.get(topic, []):
+                try:
+                    handler()
+                except Exception:
+                    self.stats['handler_errors'] += 1
+                    log.exception('Handler for %s changes failed', topic)
+        return changed
+
+    def _poll(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(self.poll_seconds)
+            try:
+                self.check()
+            except Exception:
+                log.exception('Coherence check failed')
+
+    def get_stats(self):
+        stats = dict(self.stats, handled=dict(self.stats['handled']))
+        stats['topics'] = dict(self._known or {})
+        stats['claimed'] = len(self._claimed)
+        return stats
+
+
+coherence = Coherence()
@@ -0,0 +1,307 @@
+# Glengala Fresh - Database connection layer
+# Shared SQLite connection pool: connections are opened once, tuned with
+# WAL + PRAGMAs, and handed out to request threads instead of reconnecting.
+# Connections time every statement for the metrics module (SQL_TIMING=0 to
+# open plain sqlite3 connections instead).
+
+import sqlite3
+import threading
+import time
+import os
+from contextlib import contextmanager
+from queue import LifoQueue, Empty
+from flask import g
+import metrics
+
+# Database path
+DB_PATH = os.environ.get('DATABASE_PATH', os.path.join(os.path.dirname(__file__), 'glengala.db'))
+
+# Pool tuning (override through the environment on PythonAnywhere)
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+CACHE_SIZE_KB = int(os.environ.get('DB_CACHE_SIZE_KB', 16384))
+MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', 64 * 1024 * 1024))
+BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000))
+SQL_TIMING = os.environ.get('SQL_TIMING', '1') != '0'
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that reports each statement's execute + fetch time to metrics.
+
+    Rows read by iterating the cursor directly aren't timed; fetchall(),
+    fetchone() and fetchmany() are.
+    """
+
+    _sql = None
+    _params = ()
+    _elapsed = 0.0
+    _flagged = False
+
+    def _executed(self, sql, params, started):
+        elapsed = time.perf_counter() - started
+        self._sql, self._params, self._elapsed = sql, params, elapsed
+        metrics.record_sql(sql, elapsed)
+        self._flagged = metrics.check_slow(self.connection, sql, params, elapsed)
+
+    def _fetched(self, started):
+        if self._sql is None:
+            return
+        elapsed = time.perf_counter() - started
+        self._elapsed += elapsed
+        metrics.record_sql(self._sql, elapsed, executed=False)
+        if not self._flagged:
+            self._flagged = metrics.check_slow(self.connection, self._sql, self._params, self._elapsed)
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        except sqlite3.OperationalError as e:
+            if 'locked' in str(e):
+                metrics.record_lock_error()
+            raise
+        finally:
+            self._executed(sql, parameters, started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._executed(sql, None, started)
+
+    def executescript(self, sql_script):
+        started = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            self._executed(sql_script, None, started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._fetched(started)
+
+    def fetchmany(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(*args, **kwargs)
+        finally:
+            self._fetched(started)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._fetched(started)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors (and execute shortcuts) are TimedCursors"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def configure_connection(conn):
+    """Apply the per-connection PRAGMAs every pooled connection needs"""
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    c.execute('PRAGMA synchronous = NORMAL')
+    c.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KB}')
+    c.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+    c.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    c.execute('PRAGMA temp_store = MEMORY')
+    c.close()
+    return conn
+
+
+def connect(path=None):
+    """Open a tuned connection outside the pool (scripts, background threads)"""
+    conn = sqlite3.connect(path or DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000,
+                           check_same_thread=False,
+                           factory=TimedConnection if SQL_TIMING else sqlite3.Connection)
+    return configure_connection(conn)
+
+
+class ConnectionPool:
+    """Bounded pool of reusable SQLite connections.
+
+    A connection belongs to one thread at a time: it is acquired at the start
+    of a request and released in the Flask teardown hook, where any open
+    transaction is rolled back before it goes back on the idle stack.
+    """
+
+    def __init__(self, path, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._idle = LifoQueue()
+        self._lock = threading.Lock()
+        self._open = 0
+        self._wal_checked = False
+        self.stats = {
+            'acquired': 0,
+            'hits': 0,
+            'misses': 0,
+            'waits': 0,
+            'wait_time_ms': 0.0,
+            'max_wait_ms': 0.0,
+            'timeouts': 0,
+            'released': 0,
+            'rollbacks': 0,
+            'discarded': 0,
+        }
+
+    def _new_connection(self):
+        conn = connect(self.path)
+        if not self._wal_checked:
+            # journal_mode is persistent in the file, so only the first
+            # connection needs to switch it
+            conn.execute('PRAGMA journal_mode = WAL')
+            self._wal_checked = True
+        return conn
+
+    def acquire(self):
+        """Get an idle connection, opening a new one while under the size limit"""
+        try:
+            conn = self._idle.get_nowait()
+            with self._lock:
+                self.stats['acquired'] += 1
+                self.stats['hits'] += 1
+            return conn
+        except Empty:
+            pass
+
+        with self._lock:
+            can_open = self._open < self.size
+            if can_open:
+                self._open += 1
+        if can_open:
+            try:
+                conn = self._new_connection()
+            except Exception:
+                with self._lock:
+                    self._open -= 1
+                raise
+            with self._lock:
+                self.stats['acquired'] += 1
+                self.stats['misses'] += 1
+            return conn
+
+        # Pool exhausted - wait for another request to hand one back
+        started = time.perf_counter()
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except Empty:
+            with self._lock:
+                self.stats['timeouts'] += 1
+            raise sqlite3.OperationalError('Timed out waiting for a database connection')
+        waited_ms = (time.perf_counter() - started) * 1000
+        metrics.pool_wait_seconds.observe(waited_ms / 1000)
+        with self._lock:
+            self.stats['acquired'] += 1
+            self.stats['hits'] += 1
+            self.stats['waits'] += 1
+            self.stats['wait_time_ms'] += waited_ms
+            self.stats['max_wait_ms'] = max(self.stats['max_wait_ms'], waited_ms)
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool, discarding it if it is unusable"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+                with self._lock:
+                    self.stats['rollbacks'] += 1
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        with self._lock:
+            self.stats['released'] += 1
+        self._idle.put(conn)
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._open -= 1
+            self.stats['discarded'] += 1
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a with-block"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        """Close every idle connection (used on shutdown and in tests)"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except Empty:
+                break
+            self._discard(conn)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['open'] = self._open
+            stats['size'] = self.size
+        stats['idle'] = self._idle.qsize()
+        stats['hit_ratio'] = round(stats['hits'] / stats['acquired'], 4) if stats['acquired'] else 0.0
+        stats['wait_time_ms'] = round(stats['wait_time_ms'], 3)
+        stats['max_wait_ms'] = round(stats['max_wait_ms'], 3)
+        return stats
+
+
+pool = ConnectionPool(DB_PATH)
+
+
+def configure(path):
+    """Point the pool and new connections at another database file.
+
+    For scripts that choose the file after import (importer.py --db): modules
+    that did `from db import pool` share the same object, so it is retargeted
+    in place. Call before any connection is handed out.
+    """
+    global DB_PATH
+    DB_PATH = path
+    pool.close_all()
+    pool.path = path
+    pool._wal_checked = False
+
+
+def get_db():
+    """Connection for the current Flask request (released on teardown)"""
+    if 'db' not in g:
+        g.db = pool.acquire()
+    return g.db
+
+
+def close_db(exc=None):
+    """Flask teardown hook - hand the request's connection back to the pool"""
+    conn = g.pop('db', None)
+    if conn is not None:
+        pool.release(conn)
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
@@ -0,0 +1,132 @@
+# Glengala Fresh - In-process event bus for Server-Sent Events
+# Publishing encodes an event once into a shared ring buffer and wakes every
+# waiting stream with one notify_all - there is no per-subscriber queue or
+# dispatcher thread, so fan-out cost doesn't grow with open tabs. Streams
+# served by asgi.py wait on their event loop instead of a thread; each loop
+# registers one waker that publish() calls.
+
+import json
+import os
+import threading
+import time
+from collections import deque
+
+HISTORY = 500
+HEARTBEAT_SECONDS = 15
+# Streams end after this long; EventSource reconnects with Last-Event-ID,
+# which keeps worker threads from being pinned forever
+MAX_STREAM_SECONDS = int(os.environ.get('SSE_MAX_STREAM_SECONDS', 600))
+MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', 200))
+RETRY_MS = 5000
+
+
+class TooManyStreams(Exception):
+    """Stream limit reached - clients should fall back to polling"""
+
+
+class EventBus:
+    def __init__(self, history=HISTORY):
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=history)
+        self._last_id = 0
+        self._wakers = []
+        self.streams = 0
+        self.stats = {'published': 0, 'streams_opened': 0, 'streams_rejected': 0, 'resyncs': 0}
+
+    def publish(self, event_type, data):
+        """Queue an event for every connected stream"""
+        with self._cond:
+            self._last_id += 1
+            frame = (f'id: {self._last_id}\nevent: {event_type}\n'
+                     f'data: {json.dumps(data, separators=(",", ":"))}\n\n').encode('utf-8')
+            self._events.append((self._last_id, frame))
+            self.stats['published'] += 1
+            self._cond.notify_all()
+            event_id = self._last_id
+        for waker in self._wakers:
+            waker()
+        return event_id
+
+    def add_waker(self, waker):
+        """Call waker() (from the publishing thread) after every event"""
+        self._wakers.append(waker)
+
+    def _frames_after(self, last_id):
+        """Frames newer than last_id, or None if they fell out of the buffer"""
+        if last_id >= self._last_id:
+            return []
+        if not self._events or self._events[0][0] > last_id + 1:
+            return None
+        return [frame for event_id, frame in self._events if event_id > last_id]
+
+    def open(self, last_id=None):
+        """Admit one more stream; returns the event id it starts after"""
+        with self._cond:
+            if self.streams >= MAX_STREAMS:
+                self.stats['streams_rejected'] += 1
+                raise TooManyStreams()
+            self.stats['streams_opened'] += 1
+            if last_id is None or last_id > self._last_id:
+                last_id = self._last_id
+        return last_id
+
+    def stream(self, last_id=None, heartbeat=HEARTBEAT_SECONDS, max_seconds=MAX_STREAM_SECONDS):
+        """Generator of SSE frames for one client"""
+        return self._run(self.open(last_id), heartbeat, max_seconds)
+
+    def _hello(self, last_id):
+        return f'retry: {RETRY_MS}\nid: {last_id}\nevent: hello\ndata: {{}}\n\n'.encode('utf-8')
+
+    def _next(self, last_id):
+        """(frames to send, newest id) - call with the lock held"""
+        frames = self._frames_after(last_id)
+        newest = self._last_id
+        if frames is None:
+            # Missed events - tell the client to refetch everything
+            self.stats['resyncs'] += 1
+            frames = [f'id: {newest}\nevent: resync\ndata: {{}}\n\n'.encode('utf-8')]
+        return (b''.join(frames) if frames else b': ping\n\n'), newest
+
+    def _run(self, last_id, heartbeat, max_seconds):
+        deadline = time.monotonic() + max_seconds
+        with self._cond:
+            self.streams += 1
+        try:
+            yield self._hello(last_id)
+            while time.monotonic() < deadline:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._last_id > last_id, timeout=heartbeat)
+                    frame, last_id = self._next(last_id)
+                yield frame
+        finally:
+            with self._cond:
+                self.streams -= 1
+
+    async def stream_async(self, last_id, wait, heartbeat=HEARTBEAT_SECONDS,
+                           max_seconds=MAX_STREAM_SECONDS):
+        """stream() for an event loop: wait(timeout) is a coroutine that returns
+        once a waker has fired or timeout has passed"""
+        deadline = time.monotonic() + max_seconds
+        with self._cond:
+            self.streams += 1
+        try:
+            yield self._hello(last_id)
+            while time.monotonic() < deadline:
+                if self._last_id <= last_id:
+                    await wait(heartbeat)
+                with self._cond:
+                    frame, last_id = self._next(last_id)
+                yield frame
+        finally:
+            with self._cond:
+                self.streams -= 1
+
+    def get_stats(self):
+        with self._cond:
+            stats = dict(self.stats)
+            stats['streams'] = self.streams
+            stats['last_event_id'] = self._last_id
+        return stats
+
+
+bus = EventBus()
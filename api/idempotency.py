@@ -0,0 +1,75 @@
+# Glengala Fresh - Idempotency keys for order submission
+# Clients (and the service worker's offline queue) send a key with every order.
+# The first request to use a key stores its response; a retry with the same
+# key gets that response back instead of placing the order again. Keys expire
+# after a TTL so the table stays small.
+
+import hashlib
+import json
+import os
+import time
+
+TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_HOURS', 72)) * 3600
+MAX_KEY_LENGTH = 100
+# Expired keys are swept at most this often (range delete on created_at)
+EVICT_INTERVAL_SECONDS = 300
+
+_last_evicted = 0.0
+
+
+class IdempotencyError(ValueError):
+    """Key is malformed or was already used for a different request"""
+
+
+def create_schema(c):
+    """Create the key table (called from init_db)"""
+    c.execute('''CREATE TABLE IF NOT EXISTS idempotency_keys
+                 (key TEXT PRIMARY KEY,
+                  fingerprint TEXT NOT NULL,
+                  response TEXT NOT NULL,
+                  created_at REAL NOT NULL)''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created ON idempotency_keys (created_at)')
+
+
+def normalize_key(key):
+    """A usable key or None; raises IdempotencyError for junk"""
+    if key is None or key == '':
+        return None
+    if not isinstance(key, str) or len(key) > MAX_KEY_LENGTH or not key.isprintable():
+        raise IdempotencyError(f'idempotency key must be a string of at most {MAX_KEY_LENGTH} characters')
+    return key
+
+
+def fingerprint(payload):
+    """Stable hash of what a key was used for"""
+    body = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(body.encode('utf-8')).hexdigest()
+
+
+def lookup(c, key, request_fingerprint):
+    """The stored response for key, or None if it hasn't been used"""
+    c.execute('SELECT fingerprint, response, created_at FROM idempotency_keys WHERE key = ?', (key,))
+    row = c.fetchone()
+    if row is None or row[2] < time.time() - TTL_SECONDS:
+        return None
+    if row[0] != request_fingerprint:
+        raise IdempotencyError('idempotency key was already used for a different order')
+    return json.loads(row[1])
+
+
+def remember(c, key, request_fingerprint, response):
+    # REPLACE: an expired row for the same key may not have been swept yet
+    c.execute('''INSERT OR REPLACE INTO idempotency_keys (key, fingerprint, response, created_at)
+                 VALUES (?, ?, ?, ?)''',
+              (key, request_fingerprint, json.dumps(response), time.time()))
+
+
+def evict_expired(c, force=False):
+    """Delete expired keys (throttled unless force); returns rows removed"""
+    global _last_evicted
+    now = time.time()
+    if not force and now - _last_evicted < EVICT_INTERVAL_SECONDS:
+        return 0
+    _last_evicted = now
+    c.execute('DELETE FROM idempotency_keys WHERE created_at < ?', (now - TTL_SECONDS,))
+    return c.rowcount
@@ -0,0 +1,174 @@
+# Glengala Fresh - Product image store
+# Photos are decoded once, stored on disk under their content hash with a
+# full-size and thumbnail variant, and served with immutable cache headers.
+# Products only keep the short URL (e.g. /api/images/3f9c...e1.jpg).
+
+import base64
+import hashlib
+import io
+import logging
+import os
+import re
+import sys
+import catalog_sync
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional - without it originals are stored as-is
+    Image = None
+
+IMAGE_DIR = os.environ.get('IMAGE_DIR', os.path.join(os.path.dirname(__file__), 'images'))
+URL_PREFIX = '/api/images/'
+MAX_UPLOAD_BYTES = 5 * 1024 * 1024
+
+# Variant name -> longest edge in pixels
+VARIANTS = {'full': 800, 'thumb': 200}
+JPEG_QUALITY = 82
+
+_DATA_URL = re.compile(r'^data:(image/[\w.+-]+)?(;base64)?,', re.IGNORECASE)
+_MAGIC = [
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+]
+_NAME = re.compile(r'^[0-9a-f]{32}(-thumb)?\.(jpg|png|gif|webp)$')
+
+log = logging.getLogger('glengala.images')
+
+
+class ImageError(ValueError):
+    """Upload is not an image we can store"""
+
+
+def _sniff(data):
+    for magic, ext in _MAGIC:
+        if data.startswith(magic):
+            return ext
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def _resize(data, max_edge):
+    """Re-encode as a JPEG no larger than max_edge on its longest side"""
+    img = Image.open(io.BytesIO(data))
+    img = ImageOps.exif_transpose(img)
+    if img.mode not in ('RGB', 'L'):
+        # Flatten transparency onto white - produce shots have light backgrounds
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.convert('RGBA').split()[-1])
+        img = background
+    img.thumbnail((max_edge, max_edge))
+    out = io.BytesIO()
+    img.save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def _path(name):
+    # Two-level fan-out keeps directories small as the range grows
+    return os.path.join(IMAGE_DIR, name[:2], name)
+
+
+def _write(name, data):
+    path = _path(name)
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def store_image(data):
+    """Store raw image bytes and return the product photo URL"""
+    if not data:
+        raise ImageError('Empty image')
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise ImageError('Image too large (max 5MB)')
+    ext = _sniff(data)
+    if not ext:
+        raise ImageError('Unsupported image format')
+
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    if Image is not None:
+        ext = 'jpg'
+        full_name = f'{digest}.{ext}'
+        if not os.path.exists(_path(full_name)):
+            try:
+                _write(f'{digest}-thumb.{ext}', _resize(data, VARIANTS['thumb']))
+                _write(full_name, _resize(data, VARIANTS['full']))
+            except (OSError, Image.DecompressionBombError) as e:
+                raise ImageError(f'Could not decode image: {e}')
+    else:
+        full_name = f'{digest}.{ext}'
+        _write(f'{digest}-thumb.{ext}', data)
+        _write(full_name, data)
+    return URL_PREFIX + full_name
+
+
+def decode_data_url(value):
+    """Bytes from a data: URL, or None if value is not one"""
+    match = _DATA_URL.match(value or '')
+    if not match:
+        return None
+    payload = value[match.end():]
+    try:
+        return base64.b64decode(payload, validate=False)
+    except (ValueError, TypeError):
+        raise ImageError('Invalid base64 image data')
+
+
+def normalize_photo(value):
+    """Turn an inline base64 photo into a stored image URL; pass URLs through"""
+    data = decode_data_url(value)
+    if data is None:
+        return value
+    return store_image(data)
+
+
+def image_path(name):
+    """Filesystem path for a served image name, or None if it isn't one of ours"""
+    if not _NAME.match(name):
+        return None
+    path = _path(name)
+    return path if os.path.exists(path) else None
+
+
+def thumb_url(url):
+    """Thumbnail URL for a stored photo URL"""
+    if url and url.startswith(URL_PREFIX):
+        base, ext = url.rsplit('.', 1)
+        return f'{base}-thumb.{ext}'
+    return url
+
+
+def migrate_base64_photos(conn):
+    """Move inline data: URL photos into the image store (idempotent)"""
+    c = conn.cursor()
+    catalog_sync.create_schema(c)
+    c.execute("SELECT id, photo FROM products WHERE photo LIKE 'data:%'")
+    rows = c.fetchall()
+    migrated = []
+    for product_id, photo in rows:
+        try:
+            migrated.append((normalize_photo(photo), product_id))
+        except ImageError as e:
+            log.warning('Skipping photo for product %s: %s', product_id, e)
+    if migrated:
+        c.executemany('UPDATE products SET photo = ? WHERE id = ?', migrated)
+        # Delta-sync clients still hold the inline photos
+        catalog_sync.record_changes(c, [product_id for _, product_id in migrated])
+        conn.commit()
+    return [product_id for _, product_id in migrated]
+
+
+if __name__ == '__main__':
+    import sqlite3
+    db_path = sys.argv[1] if len(sys.argv) > 1 else os.environ.get(
+        'DATABASE_PATH', os.path.join(os.path.dirname(__file__), 'glengala.db'))
+    conn = sqlite3.connect(db_path)
+    moved = migrate_base64_photos(conn)
+    conn.close()
+    print(f"✅ Moved {len(moved)} product photo(s) into {IMAGE_DIR}")
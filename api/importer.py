@@ -0,0 +1,469 @@
+# Glengala Fresh - Catalog importer
+# One loader for products-data.js, the admin panel's CSV and JSON exports and
+# NDJSON supplier price lists. Rows are read one at a time and normalised with
+# the bulk-update rules. The whole file is then diffed against the catalog in
+# one read and written with executemany in a single transaction. Only the
+# columns a file carries are touched, and nothing is deleted: products that
+# are missing from the file keep their current values.
+#
+# python importer.py FILE [--format js|csv|json|ndjson] [--dry-run] [--strict] [--db PATH]
+
+import csv
+import json
+import os
+import re
+import sys
+from contextlib import nullcontext
+from datetime import datetime, timezone
+import bulk_update
+import catalog_sync
+import search
+from images import ImageError
+
+FORMATS = {'.js': 'js', '.csv': 'csv', '.json': 'json', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+# Errors and diff lines kept in a summary (the counts are always complete)
+MAX_REPORTED = 50
+# Imports that index more products than this rebuild the search index once
+# instead of letting its triggers fire per row
+REINDEX_ROWS = 5000
+# Indexed by product_search (see search.py)
+_SEARCH_FIELDS = {'name', 'category', 'active'}
+
+# Header spellings accepted for each column: admin.js exportToCSV writes
+# "ID,Name,Category,Price,Unit,Active,Photo"; anything matching a column
+# name (any case, with or without spaces/underscores) works too
+_HEADERS = {re.sub(r'[\s_]', '', field.lower()): field for field in ['id'] + list(bulk_update.FIELD_TYPES)}
+
+
+class ImportFileError(ValueError):
+    """The file can't be read as a product list at all"""
+
+
+# --- products-data.js -------------------------------------------------------
+
+_TOKEN = re.compile(r'''
+    (?P<space>\s+|//[^\n]*|/\*.*?\*/)
+  | (?P<string>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*'|`(?:[^`\\$]|\\.|\$(?!\{))*`)
+  | (?P<number>-?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<ident>[A-Za-z_$][\w$]*)
+  | (?P<punct>[{}\[\]:,;=()])
+''', re.VERBOSE | re.DOTALL)
+
+_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', 'v': '\v', '0': '\0'}
+_ESCAPE = re.compile(r'\\(u\{[0-9a-fA-F]+\}|u[0-9a-fA-F]{4}|x[0-9a-fA-F]{2}|\r\n|[\s\S])')
+_LITERALS = {'true': True, 'false': False, 'null': None, 'undefined': None}
+
+
+def _unescape(match):
+    escape = match.group(1)
+    if escape[0] in 'ux' and len(escape) > 1:
+        return chr(int(escape.strip('u{}x'), 16))
+    if escape in ('\n', '\r\n', '\r'):
+        # Line continuation
+        return ''
+    return _ESCAPES.get(escape, escape)
+
+
+def tokenize(text):
+    """(kind, value, offset) tokens of a JavaScript source, comments dropped"""
+    position = 0
+    length = len(text)
+    while position < length:
+        match = _TOKEN.match(text, position)
+        if match is None:
+            raise ImportFileError(f'unexpected {text[position]!r} at offset {position}')
+        kind = match.lastgroup
+        if kind != 'space':
+            value = match.group()
+            if kind == 'string':
+                value = _ESCAPE.sub(_unescape, value[1:-1])
+            elif kind == 'number':
+                value = float(value) if any(ch in value for ch in '.eE') else int(value)
+            yield kind, value, position
+        position = match.end()
+
+
+class _Parser:
+    """Recursive descent over JS literals: objects, arrays, strings, numbers"""
+
+    def __init__(self, tokens):
+        self._tokens = tokens
+        self._peeked = None
+
+    def peek(self):
+        if self._peeked is None:
+            self._peeked = next(self._tokens, ('end', None, -1))
+        return self._peeked
+
+    def take(self, expected=None):
+        token = self.peek()
+        self._peeked = None
+        if expected is not None and token[1] != expected:
+            raise ImportFileError(f'expected {expected!r} at offset {token[2]}, found {token[1]!r}')
+        return token
+
+    def value(self):
+        kind, value, offset = self.take()
+        if kind in ('string', 'number'):
+            return value
+        if kind == 'ident' and value in _LITERALS:
+            return _LITERALS[value]
+        if value == '{':
+            result = {}
+            while self.peek()[1] != '}':
+                key_kind, key, key_offset = self.take()
+                if key_kind not in ('ident', 'string', 'number'):
+                    raise ImportFileError(f'bad object key {key!r} at offset {key_offset}')
+                self.take(':')
+                result[str(key)] = self.value()
+                if self.peek()[1] != ',':
+                    break
+                self.take(',')
+            self.take('}')
+            return result
+        if value == '[':
+            return list(self.items())
+        raise ImportFileError(f'unexpected {value!r} at offset {offset}')
+
+    def items(self):
+        """Elements of an array whose '[' was just taken, one at a time"""
+        while self.peek()[1] != ']':
+            yield self.value()
+            if self.peek()[1] != ',':
+                break
+            self.take(',')
+        self.take(']')
+
+
+def iter_js(text, variable='products'):
+    """Elements of `let|const|var <variable> = [...]` in a JS source"""
+    parser = _Parser(tokenize(text))
+    while True:
+        kind, value, _ = parser.take()
+        if kind == 'end':
+            raise ImportFileError(f'no "{variable} = [" array found')
+        if kind == 'ident' and value == variable and parser.peek()[1] == '=':
+            parser.take('=')
+            parser.take('[')
+            yield from parser.items()
+            return
+
+
+# --- Readers ----------------------------------------------------------------
+
+def detect_format(name):
+    fmt = FORMATS.get(os.path.splitext(name or '')[1].lower())
+    if fmt is None:
+        raise ImportFileError(f'unknown file type {name!r}; give its format')
+    return fmt
+
+
+def records(stream, fmt):
+    """(position, raw product dict) pairs from a text stream in the given format"""
+    if fmt == 'js':
+        for index, item in enumerate(iter_js(stream.read())):
+            yield f'item {index + 1}', item
+    elif fmt == 'json':
+        # admin.js exportToJSON: a pretty-printed array of product objects
+        data = json.load(stream)
+        if isinstance(data, dict):
+            data = data.get('products')
+        if not isinstance(data, list):
+            raise ImportFileError('JSON file must hold an array of products')
+        for index, item in enumerate(data):
+            yield f'item {index + 1}', item
+    elif fmt == 'ndjson':
+        for number, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    yield f'line {number}', json.loads(line)
+                except ValueError as e:
+                    yield f'line {number}', ImportFileError(f'bad JSON: {e}')
+    elif fmt == 'csv':
+        reader = csv.reader(stream)
+        header = next(reader, None)
+        if not header:
+            return
+        fields = [_HEADERS.get(re.sub(r'[\s_]', '', name.lower().lstrip('\ufeff'))) for name in header]
+        if 'id' not in fields and 'name' not in fields:
+            raise ImportFileError('CSV needs an ID or Name column')
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            item = {}
+            for field, cell in zip(fields, row):
+                if field is None:
+                    continue
+                # Blank cells leave a column as it is, except optional text
+                # (an exported product with no photo really has none)
+                if cell == '' and (field in ('id', *bulk_update.REQUIRED_NON_NULL)
+                                   or bulk_update.FIELD_TYPES[field] != 'text'):
+                    continue
+                item[field] = cell
+            yield f'line {reader.line_num}', item
+    else:
+        raise ImportFileError(f'unknown format {fmt!r}')
+
+
+def normalise(items, errors):
+    """(position, id or None, {field: value}) for valid rows; problems go to errors"""
+    for position, item in items:
+        if isinstance(item, Exception):
+            errors.append({'at': position, 'error': str(item)})
+            continue
+        if not isinstance(item, dict):
+            errors.append({'at': position, 'error': 'product must be an object'})
+            continue
+        product_id = item.get('id')
+        if product_id in (None, ''):
+            product_id = None
+        else:
+            try:
+                product_id = int(float(product_id))
+            except (TypeError, ValueError):
+                errors.append({'at': position, 'error': f'bad id {product_id!r}'})
+                continue
+        values = {}
+        try:
+            for field, value in item.items():
+                if field not in bulk_update.FIELD_TYPES:
+                    continue
+                if bulk_update.FIELD_TYPES[field] == 'flag' and isinstance(value, str):
+                    # CSV cells: TRUE/False/yes as well as the exports' true/false
+                    value = value.strip().lower() not in ('', '0', 'false', 'no')
+                values[field] = bulk_update.normalise(field, value)
+        except (TypeError, ValueError, ImageError) as e:
+            errors.append({'at': position, 'id': product_id, 'field': field, 'error': str(e)})
+            continue
+        if product_id is None and not values.get('name'):
+            errors.append({'at': position, 'error': 'row needs an id or a name'})
+            continue
+        yield position, product_id, values
+
+
+# --- Apply ------------------------------------------------------------------
+
+def apply(c, entries, dry_run=False):
+    """Diff normalised rows against the catalog and write them; returns a summary.
+
+    Call inside a write transaction (or on the writer thread). Rows with an id
+    update that product or create it with that id; rows without one match an
+    existing product by name (case-insensitive), or are created.
+    """
+    fields = list(bulk_update.FIELD_TYPES)
+    c.execute(f"SELECT id, {', '.join(fields)} FROM products")
+    current = {row[0]: dict(zip(fields, row[1:])) for row in c.fetchall()}
+    by_name = {}
+    for product_id, product in current.items():
+        key = (product['name'] or '').strip().lower()
+        # Ambiguous names can't be matched
+        by_name[key] = None if key in by_name else product_id
+
+    # Merge the file first: a later row for the same product wins
+    pending = {}
+    errors = []
+    rows = 0
+    for position, product_id, values in entries:
+        rows += 1
+        if product_id is None:
+            name_key = values['name'].strip().lower()
+            product_id = by_name.get(name_key)
+            if product_id is None and name_key in by_name:
+                errors.append({'at': position,
+                               'error': f"{values['name']!r} matches several products; give its id"})
+                continue
+            key = product_id if product_id is not None else ('new', name_key)
+        else:
+            key = product_id
+        pending.setdefault(key, {'position': position, 'values': {}})['values'].update(values)
+
+    inserts = {}
+    updates = {}
+    price_changes = []
+    diff = []
+    inserted = updated = unchanged = 0
+    # UTC, like the column's CURRENT_TIMESTAMP default
+    now = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    for key, entry in pending.items():
+        values = entry['values']
+        existing = current.get(key) if not isinstance(key, tuple) else None
+        if existing is None:
+            missing = bulk_update.REQUIRED_NON_NULL - set(values)
+            if missing:
+                errors.append({'at': entry['position'], 'id': None if isinstance(key, tuple) else key,
+                               'error': f"new product needs {', '.join(sorted(missing))}"})
+                continue
+            columns = tuple(sorted(values))
+            if not isinstance(key, tuple):
+                columns = ('id',) + columns
+                values = dict(values, id=key)
+            inserts.setdefault(columns, []).append(tuple(values[column] for column in columns))
+            inserted += 1
+            if len(diff) < MAX_REPORTED:
+                diff.append({'action': 'insert', 'id': values.get('id'), 'name': values['name'],
+                             'fields': {field: [None, value] for field, value in values.items()
+                                        if field != 'id'}})
+            continue
+        changed = {field: [existing[field], value]
+                   for field, value in values.items() if existing[field] != value}
+        if not changed:
+            unchanged += 1
+            continue
+        columns = tuple(sorted(changed))
+        updates.setdefault(columns, []).append(tuple(values[column] for column in columns) + (key,))
+        updated += 1
+        if len(diff) < MAX_REPORTED:
+            diff.append({'action': 'update', 'id': key, 'name': existing['name'], 'fields': changed})
+        # Same rule as update_product: only real changes from a known price
+        if 'price' in changed and existing['price'] and values['price']:
+            price_changes.append((key, existing['name'], existing['price'], values['price'], now))
+
+    summary = {
+        'dry_run': dry_run,
+        'rows': rows,
+        'inserted': inserted,
+        'updated': updated,
+        'unchanged': unchanged,
+        'price_changes': len(price_changes),
+        'invalid': len(errors),
+        'errors': errors[:MAX_REPORTED],
+        'diff': diff,
+        'ids': [],
+        'version': None,
+    }
+    if dry_run or not (inserts or updates):
+        return summary
+
+    reindexed = sum(len(params) for params in inserts.values()) + sum(
+        len(params) for columns, params in updates.items() if _SEARCH_FIELDS & set(columns))
+    with search.deferred_index(c) if reindexed > REINDEX_ROWS else nullcontext():
+        changed_ids = _write(c, inserts, updates)
+    if price_changes:
+        c.executemany('''INSERT INTO price_changes
+                         (product_id, product_name, old_price, new_price, changed_at, notified)
+                         VALUES (?, ?, ?, ?, ?, 0)''', price_changes)
+    summary['ids'] = changed_ids
+    summary['version'] = catalog_sync.record_changes(c, changed_ids)
+    return summary
+
+
+def _write(c, inserts, updates):
+    """Run the grouped statements; returns every product id written"""
+    changed_ids = []
+    for columns, params in updates.items():
+        assignments = ', '.join(f'{column} = ?' for column in columns)
+        c.executemany(f'UPDATE products SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+                      params)
+        changed_ids.extend(row[-1] for row in params)
+    # Rows with ids first, so SQLite numbers the rest above all of them
+    for columns, params in sorted(inserts.items(), key=lambda item: item[0][0] != 'id'):
+        placeholders = ', '.join('?' for _ in columns)
+        sql = f"INSERT INTO products ({', '.join(columns)}) VALUES ({placeholders})"
+        if columns[0] == 'id':
+            c.executemany(sql, params)
+            changed_ids.extend(row[0] for row in params)
+            continue
+        c.execute('SELECT COALESCE(MAX(id), 0) FROM products')
+        last_id = c.fetchone()[0]
+        c.executemany(sql, params)
+        c.execute('SELECT id FROM products WHERE id > ?', (last_id,))
+        changed_ids.extend(row[0] for row in c.fetchall())
+    return changed_ids
+
+
+def import_stream(c, stream, fmt, dry_run=False, strict=False):
+    """Read, normalise and apply a whole file; returns apply()'s summary.
+
+    strict: any invalid row rejects the import before anything is written.
+    """
+    errors = []
+    entries = normalise(records(stream, fmt), errors)
+    if strict:
+        entries = list(entries)
+        if errors:
+            return {'dry_run': dry_run, 'rows': len(entries) + len(errors), 'inserted': 0,
+                    'updated': 0, 'unchanged': 0, 'price_changes': 0, 'invalid': len(errors),
+                    'errors': errors[:MAX_REPORTED], 'diff': [], 'ids': [], 'version': None,
+                    'rejected': True}
+    return add_errors(apply(c, entries, dry_run), errors)
+
+
+def add_errors(summary, errors):
+    """Count rows normalise() skipped into apply()'s summary"""
+    summary['rows'] += len(errors)
+    summary['invalid'] += len(errors)
+    summary['errors'] = (errors + summary['errors'])[:MAX_REPORTED]
+    return summary
+
+
+def print_summary(summary, out=print):
+    for change in summary['diff']:
+        fields = ', '.join(f'{field} {old!r} -> {new!r}' if change['action'] == 'update'
+                           else f'{field}={new!r}'
+                           for field, (old, new) in change['fields'].items())
+        out(f"  {change['action']:6} #{change['id'] if change['id'] is not None else 'new'} "
+            f"{change['name']}: {fields}")
+    if summary['inserted'] + summary['updated'] > len(summary['diff']):
+        out(f"  ... and {summary['inserted'] + summary['updated'] - len(summary['diff'])} more")
+    for error in summary['errors']:
+        out(f"  skipped {error['at']}: {error['error']}")
+    verb = 'Would import' if summary['dry_run'] else 'Imported'
+    if summary.get('rejected'):
+        verb = 'Rejected (strict)'
+    out(f"{verb} {summary['rows']} rows: {summary['inserted']} new, {summary['updated']} changed, "
+        f"{summary['unchanged']} unchanged, {summary['invalid']} invalid, "
+        f"{summary['price_changes']} price change(s)")
+
+
+def main(argv):
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Import products into the Glengala database')
+    parser.add_argument('file', help='products-data.js, a CSV/JSON export or an NDJSON price list')
+    parser.add_argument('--format', choices=sorted(set(FORMATS.values())))
+    parser.add_argument('--dry-run', action='store_true', help='show what would change, write nothing')
+    parser.add_argument('--strict', action='store_true', help='reject the file if any row is invalid')
+    parser.add_argument('--db', help='database path (default: DATABASE_PATH or api/glengala.db)')
+    args = parser.parse_args(argv)
+    # db and metrics read their environment when this module is imported,
+    # so the overrides are applied to them directly
+    import db
+    import metrics
+    import push_dispatch
+    # Pushes are the web app's job, not an import's
+    push_dispatch.AUTOSTART = False
+    if args.db:
+        db.configure(args.db)
+    # Every statement of a big import is "slow"; don't log each one
+    if 'SLOW_QUERY_MS' not in os.environ:
+        metrics.SLOW_QUERY_MS = 0
+    # The app owns the schema
+    import app
+    from db import pool
+
+    fmt = args.format or detect_format(args.file)
+    app.init_db()
+    started = time.perf_counter()
+    with pool.connection() as conn, open(args.file, encoding='utf-8-sig', newline='') as stream:
+        c = conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        try:
+            summary = import_stream(c, stream, fmt, dry_run=args.dry_run, strict=args.strict)
+        except Exception:
+            conn.rollback()
+            raise
+        if args.dry_run or summary.get('rejected'):
+            conn.rollback()
+        else:
+            conn.commit()
+    print_summary(summary)
+    print(f'Done in {time.perf_counter() - started:.2f}s')
+    return 1 if summary.get('rejected') else 0
+
+
+if __name__ == '__main__':
+    try:
+        sys.exit(main(sys.argv[1:]))
+    except ImportFileError as e:
+        sys.exit(f'Import failed: {e}')
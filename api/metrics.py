@@ -0,0 +1,278 @@
+# Glengala Fresh - Request, SQL and cache metrics
+# Every request is timed per route, every SQL statement is counted and timed
+# against the request it ran for (including writes done for it on the writer
+# thread), and statements slower than SLOW_QUERY_MS are logged with their
+# query plan. render() produces the Prometheus text format for /api/metrics.
+#
+# Counters and histograms are plain Python numbers behind one lock per
+# metric family; everything else (pool, caches, writer) is read from the
+# existing get_stats() methods at scrape time rather than counted twice.
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+# Statements slower than this are logged with their plan (0 turns it off)
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+# The same statement is logged at most once per interval
+SLOW_QUERY_LOG_INTERVAL = 60
+# Recent slow statements kept for /api/admin/db-stats
+SLOW_QUERY_KEEP = 50
+
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+STATEMENT_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+# Statements EXPLAIN QUERY PLAN can describe
+_EXPLAINABLE = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH'}
+
+log = logging.getLogger('glengala.sql')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels=()):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, labels=()):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labels)
+        # labels -> [bucket counts..., +Inf count, sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((labels, list(values)) for labels, values in self._series.items())
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), values):
+                cumulative += count
+                le = f'le="{_number(float(bound))}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(round(values[-1], 6))}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+requests_total = Counter('glengala_http_requests_total', 'Requests by route and status',
+                         ('method', 'route', 'status'))
+request_seconds = Histogram('glengala_http_request_duration_seconds', 'Time to build the response',
+                            REQUEST_BUCKETS, ('method', 'route'))
+request_statements = Histogram('glengala_http_request_sql_statements', 'SQL statements per request',
+                               STATEMENT_COUNT_BUCKETS, ('method', 'route'))
+sql_seconds_total = Counter('glengala_sql_seconds_total', 'Time spent in SQLite per route',
+                            ('route',))
+sql_statements_total = Counter('glengala_sql_statements_total', 'SQL statements per route', ('route',))
+sql_seconds = Histogram('glengala_sql_statement_duration_seconds', 'SQL statement execution time',
+                        SQL_BUCKETS, ('verb',))
+slow_queries_total = Counter('glengala_sql_slow_statements_total',
+                             f'Statements slower than {SLOW_QUERY_MS:g} ms', ('route',))
+lock_errors_total = Counter('glengala_db_locked_errors_total', '"database is locked" errors', ('route',))
+pool_wait_seconds = Histogram('glengala_db_pool_wait_seconds',
+                              'Time a request waited for a pooled connection', WAIT_BUCKETS)
+writer_queue_seconds = Histogram('glengala_writer_queue_wait_seconds',
+                                 'Time a write waited for the writer thread', WAIT_BUCKETS)
+writer_lock_seconds = Histogram('glengala_writer_lock_wait_seconds',
+                                'Time the writer waited for the SQLite write lock (BEGIN IMMEDIATE)',
+                                WAIT_BUCKETS)
+
+FAMILIES = [requests_total, request_seconds, request_statements, sql_seconds_total,
+            sql_statements_total, sql_seconds, slow_queries_total, lock_errors_total,
+            pool_wait_seconds, writer_queue_seconds, writer_lock_seconds]
+
+# Callables returning (name, type, help, [(labels dict, value), ...]) at scrape time
+_collectors = []
+
+slow_queries = deque(maxlen=SLOW_QUERY_KEEP)
+_slow_logged = {}
+_slow_lock = threading.Lock()
+
+_local = threading.local()
+
+
+class RequestStats:
+    """What one request has cost so far"""
+    __slots__ = ('method', 'route', 'started', 'elapsed', 'statements', 'sql_seconds')
+
+    def __init__(self, method, route):
+        self.method = method
+        self.route = route
+        self.started = time.perf_counter()
+        self.elapsed = None
+        self.statements = 0
+        self.sql_seconds = 0.0
+
+
+def begin_request(method, route):
+    stats = _local.stats = RequestStats(method, route)
+    return stats
+
+
+def current():
+    """The RequestStats SQL on this thread is charged to (None outside requests)"""
+    return getattr(_local, 'stats', None)
+
+
+def end_request(status):
+    """Record the current request; returns its RequestStats (or None)"""
+    stats = current()
+    if stats is None:
+        return None
+    _local.stats = None
+    stats.elapsed = time.perf_counter() - stats.started
+    requests_total.inc((stats.method, stats.route, str(status)))
+    request_seconds.observe(stats.elapsed, (stats.method, stats.route))
+    request_statements.observe(stats.statements, (stats.method, stats.route))
+    return stats
+
+
+@contextmanager
+def attributed(stats):
+    """Charge SQL run in this block (on another thread) to stats' request"""
+    previous = getattr(_local, 'stats', None)
+    _local.stats = stats
+    try:
+        yield
+    finally:
+        _local.stats = previous
+
+
+def _route():
+    stats = current()
+    return stats.route if stats is not None else 'background'
+
+
+def _verb(sql):
+    word = sql.lstrip().split(None, 1)
+    return word[0].upper() if word else ''
+
+
+def record_sql(sql, seconds, executed=True):
+    """Count and time one statement (executed=False: more time fetching its rows)"""
+    stats = current()
+    route = stats.route if stats is not None else 'background'
+    if stats is not None:
+        stats.sql_seconds += seconds
+        if executed:
+            stats.statements += 1
+    if executed:
+        sql_statements_total.inc((route,))
+        sql_seconds.observe(seconds, (_verb(sql),))
+    sql_seconds_total.inc((route,), seconds)
+
+
+def record_lock_error():
+    lock_errors_total.inc((_route(),))
+
+
+def check_slow(conn, sql, params, seconds):
+    """Log sql with its plan if it took longer than SLOW_QUERY_MS; True if it did"""
+    if not SLOW_QUERY_MS or seconds * 1000 < SLOW_QUERY_MS:
+        return False
+    route = _route()
+    slow_queries_total.inc((route,))
+    now = time.monotonic()
+    with _slow_lock:
+        if now - _slow_logged.get(sql, -SLOW_QUERY_LOG_INTERVAL) < SLOW_QUERY_LOG_INTERVAL:
+            return True
+        _slow_logged[sql] = now
+        if len(_slow_logged) > 1000:
+            _slow_logged.clear()
+    plan = explain(conn, sql, params)
+    slow_queries.append({'at': time.time(), 'route': route, 'ms': round(seconds * 1000, 2),
+                         'sql': ' '.join(sql.split()), 'plan': plan})
+    log.warning('Slow query (%.1f ms, %s): %s | plan: %s', seconds * 1000, route,
+                ' '.join(sql.split()), '; '.join(plan) or '-')
+    return True
+
+
+def explain(conn, sql, params):
+    """EXPLAIN QUERY PLAN lines for sql, without recording them as statements"""
+    if _verb(sql) not in _EXPLAINABLE or not isinstance(params, (tuple, list, dict)):
+        return []
+    try:
+        # The base class method: the plan lookup itself isn't a timed statement
+        cursor = sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql, params)
+        return [row[3] for row in cursor.fetchall()]
+    except Exception as e:
+        return [f'(no plan: {e})']
+
+
+def register_collector(collector):
+    """Add a scrape-time source of samples (see _collectors)"""
+    _collectors.append(collector)
+
+
+def render():
+    """Everything, in the Prometheus text exposition format"""
+    lines = []
+    for family in FAMILIES:
+        lines.extend(family.render())
+    for collector in _collectors:
+        for name, kind, help_text, samples in collector():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                if value is None:
+                    continue
+                label_text = _labels(labels.keys(), labels.values())
+                lines.append(f'{name}{label_text} {_number(value)}')
+    return '\n'.join(lines) + '\n'
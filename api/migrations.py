@@ -0,0 +1,85 @@
+# Glengala Fresh - Versioned schema migrations
+# Each migration runs once, in order, tracked in PRAGMA user_version.
+
+import logging
+
+log = logging.getLogger('glengala.migrations')
+
+
+def _hot_query_indexes(c):
+    """Indexes for the lookups get_user, specials, price changes and orders do"""
+    # add_favorite's INSERT OR IGNORE relies on this being unique; drop any
+    # duplicates collected while it wasn't
+    c.execute('''DELETE FROM favorites WHERE id NOT IN
+                 (SELECT MIN(id) FROM favorites GROUP BY user_id, product_id)''')
+    c.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_favorites_user_product
+                 ON favorites (user_id, product_id)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_challenges_user_active
+                 ON challenges (user_id, completed, expires_at)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_daily_specials_date
+                 ON daily_specials (special_date, active)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_price_changes_changed_at
+                 ON price_changes (changed_at)''')
+    # Only the pending rows are ever looked up by notified
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_price_changes_pending
+                 ON price_changes (notified) WHERE notified = 0''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders (created_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders (user_id)')
+
+
+def _settings_version(c):
+    """A counter bumped by every settings save, so each worker can tell its copy is stale"""
+    c.execute('PRAGMA table_info(settings)')
+    if 'version' not in {row[1] for row in c.fetchall()}:
+        c.execute('ALTER TABLE settings ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+
+
+def _order_free_delivery(c):
+    """Which orders spent a free delivery reward (see achievements.free_deliveries_left)"""
+    c.execute('PRAGMA table_info(orders)')
+    if 'free_delivery' not in {row[1] for row in c.fetchall()}:
+        c.execute('ALTER TABLE orders ADD COLUMN free_delivery INTEGER NOT NULL DEFAULT 0')
+
+
+def _price_changes_utc(c):
+    """Rows written with datetime.now().isoformat() (server local time) to UTC"""
+    c.execute('''UPDATE price_changes SET changed_at = datetime(changed_at, 'utc')
+                 WHERE changed_at LIKE '%T%' ''')
+
+
+# (version, description, function) - append only, never renumber
+MIGRATIONS = [
+    (1, 'indexes for hot queries', _hot_query_indexes),
+    (2, 'settings version counter', _settings_version),
+    (3, 'free delivery rewards spent by orders', _order_free_delivery),
+    (4, 'price change times in UTC', _price_changes_utc),
+]
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    """Apply pending migrations, each in its own transaction"""
+    applied = []
+    current = schema_version(conn)
+    for version, description, migration in MIGRATIONS:
+        if version <= current:
+            continue
+        c = conn.cursor()
+        try:
+            c.execute('BEGIN IMMEDIATE')
+            migration(c)
+            # PRAGMA can't take parameters; version is our own int
+            c.execute(f'PRAGMA user_version = {int(version)}')
+            c.execute('COMMIT')
+        except Exception:
+            c.execute('ROLLBACK')
+            raise
+        log.info('Applied migration %s: %s', version, description)
+        applied.append(version)
+    if applied:
+        conn.execute('ANALYZE')
+        conn.commit()
+    return applied
@@ -0,0 +1,115 @@
+# Glengala Fresh - Normalised order line items and trending counters
+# create_order writes one order_items row per cart line and bumps a per-product
+# daily counter, so trending is a small indexed sum instead of a
+# products x orders LIKE scan over the items JSON.
+
+import json
+
+# Days of counters kept for trending (the window itself is 7 days)
+RETAIN_DAYS = 35
+
+
+def create_schema(c):
+    """Create line item and counter tables (called from init_db)"""
+    c.execute('''CREATE TABLE IF NOT EXISTS order_items
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  order_id INTEGER NOT NULL,
+                  product_id INTEGER,
+                  name TEXT,
+                  quantity REAL DEFAULT 0,
+                  line_total REAL DEFAULT 0,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  FOREIGN KEY (order_id) REFERENCES orders (id),
+                  FOREIGN KEY (product_id) REFERENCES products (id))''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items (order_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_order_items_product ON order_items (product_id, created_at)')
+
+    # Orders per product per (UTC) day
+    c.execute('''CREATE TABLE IF NOT EXISTS product_order_counts
+                 (product_id INTEGER NOT NULL,
+                  day DATE NOT NULL,
+                  order_count INTEGER DEFAULT 0,
+                  quantity REAL DEFAULT 0,
+                  PRIMARY KEY (product_id, day))''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_product_order_counts_day ON product_order_counts (day)')
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def parse_items(items):
+    """(product_id, name, quantity, line_total) tuples from a cart items list"""
+    lines = []
+    for item in items or []:
+        if not isinstance(item, dict):
+            continue
+        product_id = _to_int(item.get('id', item.get('product_id')))
+        lines.append((product_id, item.get('name'), _to_float(item.get('quantity')),
+                      _to_float(item.get('total'))))
+    return lines
+
+
+def record_order(c, order_id, items, created_at=None):
+    """Write line items and bump trending counters; call inside the order's transaction"""
+    lines = parse_items(items)
+    if not lines:
+        return
+    if created_at is None:
+        c.execute("SELECT datetime('now')")
+        created_at = c.fetchone()[0]
+    c.executemany('''INSERT INTO order_items (order_id, product_id, name, quantity, line_total, created_at)
+                     VALUES (?, ?, ?, ?, ?, ?)''',
+                  [(order_id, product_id, name, quantity, line_total, created_at)
+                   for product_id, name, quantity, line_total in lines])
+
+    # One order counts once per product, however many lines it has
+    per_product = {}
+    for product_id, _, quantity, _ in lines:
+        if product_id is not None:
+            per_product[product_id] = per_product.get(product_id, 0) + quantity
+    c.executemany('''INSERT INTO product_order_counts (product_id, day, order_count, quantity)
+                     VALUES (?, date(?), 1, ?)
+                     ON CONFLICT(product_id, day) DO UPDATE SET
+                     order_count = order_count + 1,
+                     quantity = quantity + excluded.quantity''',
+                  [(product_id, created_at, quantity) for product_id, quantity in per_product.items()])
+
+
+def backfill(conn):
+    """Populate order_items/counters from orders.items JSON (idempotent)"""
+    c = conn.cursor()
+    c.execute('''SELECT o.id, o.items, o.created_at FROM orders o
+                 WHERE NOT EXISTS (SELECT 1 FROM order_items oi WHERE oi.order_id = o.id)''')
+    rows = c.fetchall()
+    for order_id, items_json, created_at in rows:
+        try:
+            items = json.loads(items_json)
+        except (TypeError, ValueError):
+            continue
+        record_order(c, order_id, items, created_at)
+    c.execute("DELETE FROM product_order_counts WHERE day < date('now', ?)",
+              (f'-{RETAIN_DAYS} days',))
+    conn.commit()
+    return len(rows)
+
+
+def trending_sql(select_columns, days=7, limit=10):
+    """Trending query over the daily counters for a product column projection"""
+    return f'''SELECT {select_columns}, SUM(t.order_count) as order_count
+               FROM product_order_counts t
+               JOIN products p ON p.id = t.product_id
+               WHERE t.day > date('now', '-{int(days)} days')
+               GROUP BY p.id
+               ORDER BY order_count DESC
+               LIMIT {int(limit)}'''
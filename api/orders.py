@@ -0,0 +1,125 @@
+# Glengala Fresh - Order placement
+# place_order runs on the writer thread: the order row, its line items, the
+# sales rollups and the customer's points, streak and achievement counters are
+# written in the same transaction, and the streak maths is a single UPDATE so concurrent orders
+# can't lose an increment.
+# place_orders adds idempotency keys on top, for retries and offline replays.
+
+import json
+import logging
+import sqlite3
+import achievements
+import quote as quotes
+from coherence import coherence
+import idempotency
+from idempotency import IdempotencyError
+import order_items
+import reports
+
+log = logging.getLogger('glengala.orders')
+
+# An order yesterday continues the streak, one today leaves it alone and
+# anything older (or none at all) starts again at 1
+STREAK = '''CASE
+    WHEN last_order_date IS NULL THEN 1
+    WHEN last_order_date = date('now', '-1 day') THEN current_streak + 1
+    WHEN last_order_date < date('now', '-1 day') THEN 1
+    ELSE current_streak END'''
+
+USER_UPDATE = f'''UPDATE users SET
+    loyalty_points = loyalty_points + ?,
+    current_streak = {STREAK},
+    longest_streak = MAX(longest_streak, {STREAK}),
+    last_order_date = date('now'),
+    total_orders = total_orders + 1
+    WHERE id = ?'''
+
+
+def points_for(total):
+    """1 point per $1 spent"""
+    return int(total)
+
+
+def place_order(c, user_id, quote, fulfilment=None, delivery_time=None):
+    """Write a priced order; returns (order_id, points_earned, achievements unlocked)"""
+    points = points_for(quote['total'])
+    c.execute('''INSERT INTO orders (user_id, items, total, fulfilment, delivery_time, points_earned,
+                                     free_delivery)
+                 VALUES (?, ?, ?, ?, ?, ?, ?)''',
+              (user_id, json.dumps(quote['items']), quote['total'],
+               fulfilment, delivery_time, points, int(bool(quote.get('free_delivery')))))
+    order_id = c.lastrowid
+
+    # Normalised line items + trending counters
+    order_items.record_order(c, order_id, quote['items'])
+    reports.record_order(c, order_id, quote['total'], quote['items'], fulfilment)
+    # Other workers' trending lists
+    coherence.bump(c, 'orders')
+
+    unlocked = []
+    if user_id:
+        c.execute(USER_UPDATE, (points, user_id))
+        # No such customer: nothing to count against
+        if c.rowcount:
+            unlocked = achievements.record_order(c, user_id, quote['total'], quote['items'])
+    return order_id, points, unlocked
+
+
+def request_fingerprint(data):
+    """What an idempotency key is bound to: who ordered what, and how"""
+    items = [(item.get('id', item.get('product_id')), item.get('quantity'))
+             for item in data.get('items') or [] if isinstance(item, dict)]
+    parts = [data.get('user_id'), items, data.get('fulfilment'),
+             data.get('postcode'), data.get('delivery_time')]
+    # Only when claimed, so keys stored before the reward existed still match
+    if data.get('free_delivery'):
+        parts.append('free_delivery')
+    return idempotency.fingerprint(parts)
+
+
+def place_orders(c, submissions):
+    """Place already-priced orders in one transaction, honouring idempotency keys.
+
+    Each submission is a dict with key, fingerprint, user_id, quote,
+    fulfilment and delivery_time; returns one result dict per submission.
+    Each order has its own savepoint, so one that can't be written is rolled
+    back and reported (retry=True) without taking the others with it.
+    """
+    results = []
+    for submission in submissions:
+        c.execute('SAVEPOINT place_order')
+        try:
+            result = _place_one(c, submission)
+        except sqlite3.Error as e:
+            c.execute('ROLLBACK TO place_order')
+            log.warning('Order for user %s not saved: %s', submission.get('user_id'), e)
+            result = {'success': False, 'retry': True, 'error': 'Order could not be saved'}
+        c.execute('RELEASE place_order')
+        results.append(result)
+    idempotency.evict_expired(c)
+    return results
+
+
+def _place_one(c, submission):
+    key = submission.get('key')
+    if key:
+        try:
+            stored = idempotency.lookup(c, key, submission['fingerprint'])
+        except IdempotencyError as e:
+            return {'success': False, 'conflict': True, 'error': str(e)}
+        if stored is not None:
+            return dict(stored, replayed=True)
+    quote = submission['quote']
+    user_id = submission.get('user_id')
+    # Checked again under the write lock: another order may have used the last one
+    if quote.get('free_delivery') and not (user_id and achievements.free_deliveries_left(c, user_id)):
+        quote = quotes.charge_waived_fee(quote)
+    order_id, points, unlocked = place_order(c, user_id, quote,
+                                             submission.get('fulfilment'),
+                                             submission.get('delivery_time'))
+    result = {'success': True, 'order_id': order_id, 'total': quote['total'],
+              'free_delivery': quote.get('free_delivery', False),
+              'points_earned': points, 'achievements': unlocked}
+    if key:
+        idempotency.remember(c, key, submission['fingerprint'], result)
+    return result
@@ -0,0 +1,52 @@
+# Glengala Fresh - Product column projection
+# Catalog routes accept ?view=list|detail|admin or ?fields=a,b,c and only
+# SELECT / serialise those columns instead of p.*.
+
+# Every products column, in table order
+COLUMNS = ['id', 'name', 'category', 'price', 'unit', 'active', 'mostPopular',
+           'popularOrder', 'photo', 'hasSpecial', 'specialPrice', 'specialQuantity',
+           'specialUnit', 'isPremium', 'isOrganic', 'stock', 'trending', 'updated_at']
+
+# What the shop grid renders (and filters on)
+LIST_COLUMNS = ['id', 'name', 'category', 'price', 'unit', 'active', 'photo',
+                'hasSpecial', 'specialPrice', 'specialQuantity', 'specialUnit', 'stock']
+
+VIEWS = {
+    'list': LIST_COLUMNS,
+    'detail': LIST_COLUMNS + ['isPremium', 'isOrganic', 'updated_at'],
+    'admin': COLUMNS,
+}
+
+DEFAULT_VIEW = 'admin'
+
+
+class ViewError(ValueError):
+    """Unknown view name or field"""
+
+
+def resolve(args, default=DEFAULT_VIEW):
+    """(cache key, columns) for a request's view/fields query parameters.
+
+    The cache key is the view name, or None for an ad-hoc field list.
+    """
+    fields = args.get('fields')
+    if fields:
+        requested = [f.strip() for f in fields.split(',') if f.strip()]
+        unknown = [f for f in requested if f not in COLUMNS]
+        if unknown:
+            raise ViewError(f"Unknown field(s): {', '.join(unknown)}")
+        # id is always needed to key products on the client
+        columns = [c for c in COLUMNS if c == 'id' or c in requested]
+        return None, columns
+
+    view = args.get('view', default)
+    if view not in VIEWS:
+        raise ViewError(f"Unknown view '{view}' (use {', '.join(VIEWS)})")
+    return view, VIEWS[view]
+
+
+def select_list(columns, alias='p'):
+    """SELECT column list for a projection, e.g. 'p.id, p.name'"""
+    prefix = f'{alias}.' if alias else ''
+    return ', '.join(prefix + column for column in columns)
+
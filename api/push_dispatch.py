@@ -0,0 +1,394 @@
+# Glengala Fresh - Push notification dispatcher
+# send_price_notifications only enqueues: pending price changes are coalesced
+# into one digest per subscriber and stored as push_jobs rows. A background
+# thread claims due jobs in batches, sends them through a bounded worker pool,
+# retries failures with backoff and bulk-deletes subscriptions that are gone.
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import db
+
+try:
+    from pywebpush import webpush, WebPushException
+except ImportError:  # optional - without it pushes go out as plain JSON POSTs
+    webpush = None
+
+WORKERS = int(os.environ.get('PUSH_WORKERS', 4))
+CLAIM_BATCH = int(os.environ.get('PUSH_CLAIM_BATCH', 50))
+MAX_ATTEMPTS = int(os.environ.get('PUSH_MAX_ATTEMPTS', 5))
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 3600
+SEND_TIMEOUT_SECONDS = 10
+# A job left 'sending' this long belongs to a crashed worker
+STALE_SENDING_SECONDS = 300
+# app.py starts a dispatcher in every process that imports it; scripts that
+# only borrow the app (importer.py) switch this off first
+AUTOSTART = os.environ.get('PUSH_AUTOSTART', '1') != '0'
+# Pause after a failed dispatch cycle (e.g. 'database is locked') before trying again
+ERROR_BACKOFF_SECONDS = 5
+VAPID_PRIVATE_KEY = os.environ.get('VAPID_PRIVATE_KEY')
+VAPID_SUBJECT = os.environ.get('VAPID_SUBJECT', 'mailto:admin@glengalafresh.com.au')
+DIGEST_MAX_ITEMS = 5
+
+log = logging.getLogger('glengala.push')
+
+# Jobs ready to send: due retries, and sends a crashed worker left behind
+_DUE = '''(status = 'pending' AND next_attempt_at <= ?)
+          OR (status = 'sending' AND updated_at < ?)'''
+
+
+def create_schema(c):
+    """Create the dispatch queue tables (called from init_db)"""
+    c.execute('''CREATE TABLE IF NOT EXISTS push_batches
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  change_count INTEGER DEFAULT 0,
+                  job_count INTEGER DEFAULT 0,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS push_jobs
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  batch_id INTEGER NOT NULL,
+                  subscription_id INTEGER,
+                  endpoint TEXT NOT NULL,
+                  p256dh TEXT,
+                  auth TEXT,
+                  payload TEXT NOT NULL,
+                  status TEXT DEFAULT 'pending',
+                  attempts INTEGER DEFAULT 0,
+                  next_attempt_at REAL DEFAULT 0,
+                  last_error TEXT,
+                  updated_at REAL,
+                  FOREIGN KEY (batch_id) REFERENCES push_batches (id))''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_push_jobs_due
+                 ON push_jobs (status, next_attempt_at)''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_push_jobs_batch ON push_jobs (batch_id, status)')
+
+
+def build_digest(changes, favorite_ids=()):
+    """One notification summarising every pending change (favourites first)"""
+    # Coalesce repeated edits to the same product: first old price, last new price
+    by_product = {}
+    for change in sorted(changes, key=lambda ch: ch['changed_at']):
+        entry = by_product.setdefault(change['product_id'], dict(change))
+        entry['new_price'] = change['new_price']
+    items = [ch for ch in by_product.values() if ch['old_price'] != ch['new_price']]
+    items.sort(key=lambda ch: (ch['product_id'] not in favorite_ids,
+                               ch['new_price'] - ch['old_price']))
+
+    drops = [ch for ch in items if ch['new_price'] < ch['old_price']]
+    favourites = [ch for ch in items if ch['product_id'] in favorite_ids]
+    if favourites:
+        title = f"💚 {favourites[0]['product_name']} is now ${favourites[0]['new_price']:.2f}"
+    elif drops:
+        title = f"📉 {len(drops)} price drop{'s' if len(drops) > 1 else ''} today!"
+    else:
+        title = f"🛒 {len(items)} price update{'s' if len(items) != 1 else ''}"
+    lines = [f"{ch['product_name']}: ${ch['old_price']:.2f} → ${ch['new_price']:.2f}"
+             for ch in items[:DIGEST_MAX_ITEMS]]
+    if len(items) > DIGEST_MAX_ITEMS:
+        lines.append(f"+{len(items) - DIGEST_MAX_ITEMS} more")
+    return {'title': title, 'body': '\n'.join(lines), 'url': '/shop.html',
+            'product_ids': [ch['product_id'] for ch in items]}
+
+
+def enqueue_price_digest(c):
+    """Queue one digest per subscriber for all unnotified changes (runs on the writer).
+
+    Returns (batch_id, changes, job_count); batch_id is None when nothing is pending.
+    """
+    c.execute('''SELECT * FROM price_changes
+                 WHERE notified = 0
+                 ORDER BY changed_at DESC''')
+    changes = [dict(row) for row in c.fetchall()]
+    if not changes:
+        return None, [], 0
+
+    c.execute('SELECT id, user_id, endpoint, p256dh, auth FROM push_subscriptions')
+    subscriptions = c.fetchall()
+
+    changed_ids = sorted({ch['product_id'] for ch in changes})
+    placeholders = ','.join('?' * len(changed_ids))
+    c.execute(f'''SELECT user_id, product_id FROM favorites
+                  WHERE product_id IN ({placeholders})''', changed_ids)
+    favorites = {}
+    for user_id, product_id in c.fetchall():
+        favorites.setdefault(user_id, set()).add(product_id)
+
+    c.execute('INSERT INTO push_batches (change_count, job_count) VALUES (?, ?)',
+              (len(changes), len(subscriptions)))
+    batch_id = c.lastrowid
+
+    # Subscribers without matching favourites share one encoded digest
+    shared = json.dumps(build_digest(changes))
+    now = time.time()
+    jobs = []
+    for sub_id, user_id, endpoint, p256dh, auth in subscriptions:
+        favs = favorites.get(user_id)
+        payload = json.dumps(build_digest(changes, favs)) if favs else shared
+        jobs.append((batch_id, sub_id, endpoint, p256dh, auth, payload, now))
+    c.executemany('''INSERT INTO push_jobs
+                     (batch_id, subscription_id, endpoint, p256dh, auth, payload, updated_at)
+                     VALUES (?, ?, ?, ?, ?, ?, ?)''', jobs)
+    c.execute('UPDATE price_changes SET notified = 1 WHERE notified = 0')
+    return batch_id, changes, len(jobs)
+
+
+def send_push(job):
+    """Deliver one job; returns an HTTP status code (0 for network errors)"""
+    if webpush is not None and VAPID_PRIVATE_KEY:
+        try:
+            response = webpush(
+                subscription_info={'endpoint': job['endpoint'],
+                                   'keys': {'p256dh': job['p256dh'], 'auth': job['auth']}},
+                data=job['payload'],
+                vapid_private_key=VAPID_PRIVATE_KEY,
+                vapid_claims={'sub': VAPID_SUBJECT},
+                timeout=SEND_TIMEOUT_SECONDS)
+            return response.status_code
+        except WebPushException as e:
+            return e.response.status_code if e.response is not None else 0
+
+    # Development / mock push service: plain JSON POST to the endpoint
+    request = urllib.request.Request(job['endpoint'], data=job['payload'].encode('utf-8'),
+                                     headers={'Content-Type': 'application/json', 'TTL': '86400'},
+                                     method='POST')
+    try:
+        with urllib.request.urlopen(request, timeout=SEND_TIMEOUT_SECONDS) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except (urllib.error.URLError, OSError):
+        return 0
+
+
+def backoff_seconds(attempts):
+    """Exponential backoff with jitter: 5s, 10s, 20s ... capped at an hour"""
+    delay = min(BACKOFF_BASE_SECONDS * (2 ** (attempts - 1)), BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+class PushDispatcher:
+    def __init__(self, sender=send_push, workers=WORKERS):
+        self.sender = sender
+        self.workers = workers
+        self._executor = None
+        self._thread = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._running = False
+        self.stats = {'sent': 0, 'retried': 0, 'failed': 0, 'gone': 0,
+                      'cycles': 0, 'errors': 0, 'send_seconds': 0.0, 'started_at': None}
+
+    def start(self):
+        """Start the background thread (idempotent, restarts a dead one) and wake it"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._running = True
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                        thread_name_prefix='push')
+                self._thread = threading.Thread(target=self._loop, name='push-dispatcher',
+                                                daemon=True)
+                self.stats['started_at'] = time.time()
+                self._thread.start()
+        self._wake.set()
+
+    def restart_after_fork(self):
+        """Start afresh in a forked worker: threads (and any lock they held) don't survive fork"""
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._executor = None
+        self.start()
+
+    def stop(self, timeout=5):
+        self._running = False
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _loop(self):
+        conn = db.connect()
+        try:
+            while self._running:
+                try:
+                    jobs = self._claim(conn)
+                    if not jobs:
+                        self._wake.wait(self._idle_wait(conn))
+                        self._wake.clear()
+                        continue
+                    self._deliver(conn, jobs)
+                except Exception as e:
+                    # Keep the thread alive; jobs claimed this cycle go stale
+                    # and are picked up again after STALE_SENDING_SECONDS
+                    if 'no such table' in str(e):
+                        # Started with the app, before init_db() made the queue
+                        log.debug('Push queue not created yet')
+                    else:
+                        log.exception('Push dispatch cycle failed, retrying in %ds',
+                                      ERROR_BACKOFF_SECONDS)
+                    with self._lock:
+                        self.stats['errors'] += 1
+                    try:
+                        conn.rollback()
+                    except Exception:
+                        pass
+                    self._wake.wait(ERROR_BACKOFF_SECONDS)
+                    self._wake.clear()
+        finally:
+            self._running = False
+            conn.close()
+
+    def _idle_wait(self, conn):
+        row = conn.execute('''SELECT MIN(next_attempt_at) FROM push_jobs
+                              WHERE status = 'pending' ''').fetchone()
+        if row[0] is None:
+            return 30
+        return max(0.05, min(30, row[0] - time.time()))
+
+    def _claim(self, conn):
+        """Mark a batch of due jobs as sending (safe across worker processes)"""
+        now = time.time()
+        c = conn.cursor()
+        # Plain read first: an idle queue (the usual case, in every worker)
+        # must not take the write lock checkouts are waiting on
+        c.execute(f'''SELECT 1 FROM push_jobs WHERE {_DUE} LIMIT 1''',
+                  (now, now - STALE_SENDING_SECONDS))
+        if c.fetchone() is None:
+            return []
+        c.execute('BEGIN IMMEDIATE')
+        try:
+            c.execute(f'''SELECT id, endpoint, p256dh, auth, payload, attempts FROM push_jobs
+                          WHERE {_DUE}
+                          ORDER BY next_attempt_at
+                          LIMIT ?''', (now, now - STALE_SENDING_SECONDS, CLAIM_BATCH))
+            jobs = [dict(row) for row in c.fetchall()]
+            if jobs:
+                c.executemany("UPDATE push_jobs SET status = 'sending', updated_at = ? WHERE id = ?",
+                              [(now, job['id']) for job in jobs])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return jobs
+
+    def _deliver(self, conn, jobs):
+        started = time.perf_counter()
+        statuses = list(self._executor.map(self._safe_send, jobs))
+        elapsed = time.perf_counter() - started
+
+        now = time.time()
+        done, retry, failed, gone = [], [], [], []
+        for job, status in zip(jobs, statuses):
+            attempts = job['attempts'] + 1
+            if 200 <= status < 300:
+                done.append((attempts, now, job['id']))
+            elif status in (404, 410):
+                gone.append(job)
+            elif (status == 0 or status == 429 or status >= 500) and attempts < MAX_ATTEMPTS:
+                retry.append((attempts, now + backoff_seconds(attempts), f'HTTP {status}', now, job['id']))
+            else:
+                failed.append((attempts, f'HTTP {status}', now, job['id']))
+
+        c = conn.cursor()
+        c.executemany("UPDATE push_jobs SET status = 'sent', attempts = ?, updated_at = ? WHERE id = ?",
+                      done)
+        c.executemany('''UPDATE push_jobs SET status = 'pending', attempts = ?, next_attempt_at = ?,
+                         last_error = ?, updated_at = ? WHERE id = ?''', retry)
+        c.executemany('''UPDATE push_jobs SET status = 'failed', attempts = ?, last_error = ?,
+                         updated_at = ? WHERE id = ?''', failed)
+        if gone:
+            # Expired subscriptions: drop them and anything still queued for them
+            c.executemany("UPDATE push_jobs SET status = 'gone', updated_at = ? WHERE id = ?",
+                          [(now, job['id']) for job in gone])
+            endpoints = [(job['endpoint'],) for job in gone]
+            c.executemany('DELETE FROM push_subscriptions WHERE endpoint = ?', endpoints)
+            c.executemany('''UPDATE push_jobs SET status = 'gone', updated_at = ?
+                             WHERE endpoint = ? AND status = 'pending' ''',
+                          [(now, endpoint) for (endpoint,) in endpoints])
+        conn.commit()
+
+        with self._lock:
+            self.stats['sent'] += len(done)
+            self.stats['retried'] += len(retry)
+            self.stats['failed'] += len(failed)
+            self.stats['gone'] += len(gone)
+            self.stats['cycles'] += 1
+            self.stats['send_seconds'] += elapsed
+
+    def _safe_send(self, job):
+        try:
+            return self.sender(job)
+        except Exception as e:
+            log.warning('Push to %s... failed: %s', job['endpoint'][:40], e)
+            return 0
+
+    def get_stats(self, conn, batch_limit=10):
+        """Throughput plus per-batch progress for the admin panel"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats['running'] = self._running
+        stats['workers'] = self.workers
+        stats['throughput_per_second'] = (round(stats['sent'] / stats['send_seconds'], 2)
+                                          if stats['send_seconds'] else 0.0)
+        stats['send_seconds'] = round(stats['send_seconds'], 3)
+
+        c = conn.cursor()
+        c.execute('SELECT status, COUNT(*) FROM push_jobs GROUP BY status')
+        stats['queue'] = {status: count for status, count in c.fetchall()}
+        c.execute('''SELECT b.id, b.change_count, b.job_count, b.created_at,
+                            SUM(j.status = 'sent') AS sent,
+                            SUM(j.status IN ('pending', 'sending')) AS pending,
+                            SUM(j.status = 'failed') AS failed,
+                            SUM(j.status = 'gone') AS gone
+                     FROM push_batches b
+                     LEFT JOIN push_jobs j ON j.batch_id = b.id
+                     GROUP BY b.id
+                     ORDER BY b.id DESC
+                     LIMIT ?''', (batch_limit,))
+        stats['batches'] = [dict(row) for row in c.fetchall()]
+        return stats
+
+
+dispatcher = PushDispatcher()
+
+
+class MockPushService:
+    """Stand-in push service for local testing (see /api/mock-push/<token>).
+
+    Point a subscription's endpoint at http://localhost:5000/api/mock-push/<token>.
+    Tokens starting with 'gone' answer 410, 'fail' 500, and 'flaky' alternate
+    503 / 201; anything else is accepted.
+    """
+
+    def __init__(self, keep=200):
+        self._lock = threading.Lock()
+        self._attempts = {}
+        self.received = []
+        self.keep = keep
+
+    def receive(self, token, payload):
+        with self._lock:
+            attempt = self._attempts.get(token, 0) + 1
+            self._attempts[token] = attempt
+            if token.startswith('gone'):
+                return 410
+            if token.startswith('fail'):
+                return 500
+            if token.startswith('flaky') and attempt % 2 == 1:
+                return 503
+            self.received.append({'token': token, 'payload': payload, 'at': time.time()})
+            del self.received[:-self.keep]
+            return 201
+
+
+mock_push = MockPushService()
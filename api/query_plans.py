@@ -0,0 +1,80 @@
+# Glengala Fresh - Query plan self-check
+# Hot queries are registered here and run through EXPLAIN QUERY PLAN at
+# startup; any full SCAN of a large table is reported as a missing index.
+
+import logging
+import os
+import re
+
+# Tables with fewer rows than this are cheaper to scan than to index
+LARGE_TABLE_ROWS = int(os.environ.get('QUERY_CHECK_MIN_ROWS', 1000))
+
+_registry = {}
+
+log = logging.getLogger('glengala.query_plans')
+
+_TABLE_REF = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+_SCAN = re.compile(r'^SCAN (\w+)')
+_KEYWORDS = {'WHERE', 'ON', 'JOIN', 'LEFT', 'INNER', 'CROSS', 'ORDER', 'GROUP',
+             'LIMIT', 'USING', 'SET', 'NATURAL', 'OUTER'}
+
+
+def register(name, sql, params=()):
+    """Add a query (with representative parameters) to the self-check"""
+    _registry[name] = (sql, tuple(params))
+
+
+def _aliases(sql):
+    aliases = {}
+    for table, alias in _TABLE_REF.findall(sql):
+        aliases[table] = table
+        if alias and alias.upper() not in _KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+
+def check(conn, large_table_rows=None):
+    """Plan every registered query; returns a list of findings"""
+    threshold = LARGE_TABLE_ROWS if large_table_rows is None else large_table_rows
+    row_counts = {}
+    findings = []
+    c = conn.cursor()
+    for name, (sql, params) in sorted(_registry.items()):
+        try:
+            c.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = [row[3] for row in c.fetchall()]
+        except Exception as e:
+            findings.append({'query': name, 'error': str(e)})
+            continue
+        aliases = _aliases(sql)
+        for step in plan:
+            match = _SCAN.match(step)
+            if not match:
+                continue
+            table = aliases.get(match.group(1), match.group(1))
+            if table not in row_counts:
+                try:
+                    c.execute(f'SELECT COUNT(*) FROM "{table}"')
+                    row_counts[table] = c.fetchone()[0]
+                except Exception:
+                    row_counts[table] = 0
+            findings.append({
+                'query': name,
+                'table': table,
+                'rows': row_counts[table],
+                'plan': step,
+                'large': row_counts[table] >= threshold,
+            })
+    return findings
+
+
+def report(conn):
+    """Run the check and log a warning for each large-table scan"""
+    findings = check(conn)
+    for finding in findings:
+        if finding.get('error'):
+            log.warning('Query plan check failed for %s: %s', finding['query'], finding['error'])
+        elif finding['large']:
+            log.warning('%s scans %s (%d rows): %s', finding['query'], finding['table'],
+                        finding['rows'], finding['plan'])
+    return findings
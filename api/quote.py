@@ -0,0 +1,240 @@
+# Glengala Fresh - Server-side cart quotes
+# The active catalog is compiled into parallel arrays (sorted ids, prices,
+# unit factors, specials) once per catalog change, so pricing a cart is a
+# binary search and a multiply per line - no database read per quote.
+
+import threading
+from array import array
+from bisect import bisect_left
+
+# Same rules as calculateItemTotal (shop-functions-enhanced.js): hundredg and
+# halfkg quantities count 100g/500g steps of a per-kg price
+UNIT_FACTORS = {'hundredg': 0.1, 'halfkg': 0.5}
+
+# Same tiers as CHECKOUT_CONFIG (checkout-system.js). The shop shows these
+# quotes at checkout, so this module is the one pricing engine; the cart's
+# running totals (calculateItemTotal) follow the same rules
+ELIGIBLE_POSTCODES = {'3020', '3022'}
+DELIVERY_FEES = [(50, 0), (30, 5), (0, 10)]
+
+MAX_QUANTITY = 1000
+MAX_LINES = 200
+MAX_BATCH = 100
+
+
+class QuoteError(ValueError):
+    """Cart payload could not be read"""
+
+
+def _cents(amount):
+    return int(amount * 100 + 0.5)
+
+
+class PriceTable:
+    """Compact, read-only price table for the active catalog"""
+
+    def __init__(self, rows):
+        rows = sorted(rows, key=lambda row: row['id'])
+        self.ids = array('q', (row['id'] for row in rows))
+        self.prices = array('d', (row['price'] or 0 for row in rows))
+        self.factors = array('d', (UNIT_FACTORS.get(row['unit'], 1.0) for row in rows))
+        # A multi-buy deal is "special_qty (in sold units) for special_price";
+        # zero quantity means no deal
+        self.special_qty = array('d', (
+            (row['specialQuantity'] or 0) if row['hasSpecial'] and row['specialPrice'] else 0
+            for row in rows))
+        self.special_prices = array('d', (row['specialPrice'] or 0 for row in rows))
+        self.names = [row['name'] for row in rows]
+        self.units = [row['unit'] for row in rows]
+        self.categories = [row['category'] for row in rows]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def index(self, product_id):
+        i = bisect_left(self.ids, product_id)
+        if i < len(self.ids) and self.ids[i] == product_id:
+            return i
+        return -1
+
+    def price_line(self, i, quantity):
+        """(total, special_applied) for quantity of the product at index i"""
+        sold = quantity * self.factors[i]
+        total = self.prices[i] * sold
+        deal_qty = self.special_qty[i]
+        if deal_qty > 0:
+            # Round off float noise (0.1 * 10 steps is not quite 1kg)
+            deals = int(sold / deal_qty + 1e-9)
+            if deals:
+                with_deal = (deals * self.special_prices[i]
+                             + (sold - deals * deal_qty) * self.prices[i])
+                if with_deal < total:
+                    return with_deal, True
+        return total, False
+
+
+def load_table(conn):
+    c = conn.cursor()
+    c.execute('''SELECT id, name, category, price, unit, hasSpecial, specialPrice, specialQuantity
+                 FROM products WHERE active = 1''')
+    return PriceTable(c.fetchall())
+
+
+class PriceBook:
+    """Holds the current PriceTable; invalidated alongside the catalog caches"""
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.version = 0
+        self._table = None
+        self._table_version = -1
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self.stats = {'quotes': 0, 'rebuilds': 0, 'invalidations': 0}
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self.stats['invalidations'] += 1
+
+    def table(self):
+        if self._table is not None and self._table_version == self.version:
+            return self._table
+        with self._build_lock:
+            if self._table is not None and self._table_version == self.version:
+                return self._table
+            version = self.version
+            table = self.loader()
+            self.stats['rebuilds'] += 1
+            if version == self.version:
+                self._table, self._table_version = table, version
+        return table
+
+    def quote(self, cart, free_delivery=False):
+        self.stats['quotes'] += 1
+        return quote_cart(self.table(), cart, free_delivery)
+
+    def quote_batch(self, carts):
+        if not isinstance(carts, list):
+            raise QuoteError('carts must be a list')
+        if len(carts) > MAX_BATCH:
+            raise QuoteError(f'at most {MAX_BATCH} carts per request')
+        # One table for the whole batch so every cart sees the same prices
+        table = self.table()
+        self.stats['quotes'] += len(carts)
+        quotes = []
+        for cart in carts:
+            try:
+                quotes.append(quote_cart(table, cart))
+            except QuoteError as e:
+                quotes.append({'error': str(e)})
+        return quotes
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['version'] = self.version
+        stats['products'] = len(self._table) if self._table is not None else None
+        return stats
+
+
+def delivery_fee(subtotal, postcode):
+    """Fee for delivering subtotal to postcode, or None if we don't deliver there"""
+    if str(postcode or '').strip() not in ELIGIBLE_POSTCODES:
+        return None
+    for threshold, fee in DELIVERY_FEES:
+        if subtotal >= threshold:
+            return fee
+    return DELIVERY_FEES[-1][1]
+
+
+def _quantity(value):
+    try:
+        quantity = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not 0 < quantity <= MAX_QUANTITY:
+        return None
+    return quantity
+
+
+def quote_cart(table, cart, free_delivery=False):
+    """Price one cart: {items: [{id, quantity}], fulfilment, postcode}.
+
+    free_delivery waives the delivery fee (a reward the caller has already
+    checked the customer holds); it is only used when there is a fee to waive.
+    """
+    if not isinstance(cart, dict):
+        raise QuoteError('cart must be an object')
+    items = cart.get('items')
+    if not isinstance(items, list):
+        raise QuoteError('items must be a list')
+    if len(items) > MAX_LINES:
+        raise QuoteError(f'at most {MAX_LINES} items per cart')
+
+    lines = []
+    errors = []
+    subtotal_cents = 0
+    for position, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({'index': position, 'error': 'item must be an object'})
+            continue
+        try:
+            product_id = int(item.get('id', item.get('product_id')))
+        except (TypeError, ValueError):
+            errors.append({'index': position, 'error': 'id is required'})
+            continue
+        quantity = _quantity(item.get('quantity'))
+        if quantity is None:
+            errors.append({'index': position, 'id': product_id, 'error': 'invalid quantity'})
+            continue
+        i = table.index(product_id)
+        if i < 0:
+            errors.append({'index': position, 'id': product_id, 'error': 'product unavailable'})
+            continue
+        total, special = table.price_line(i, quantity)
+        total_cents = _cents(total)
+        subtotal_cents += total_cents
+        lines.append({
+            'id': product_id,
+            'name': table.names[i],
+            'unit': table.units[i],
+            'category': table.categories[i],
+            'quantity': quantity,
+            'price': table.prices[i],
+            'total': total_cents / 100,
+            'special_applied': special,
+        })
+
+    subtotal = subtotal_cents / 100
+    fulfilment = cart.get('fulfilment') or 'pickup'
+    fee = 0
+    waived = 0
+    delivery_available = True
+    if fulfilment == 'delivery':
+        fee = delivery_fee(subtotal, cart.get('postcode'))
+        if fee is None:
+            delivery_available = False
+            fee = 0
+        elif free_delivery and fee:
+            waived, fee = fee, 0
+
+    return {
+        'items': lines,
+        'errors': errors,
+        'fulfilment': fulfilment,
+        'subtotal': subtotal,
+        'delivery_fee': fee,
+        'delivery_available': delivery_available,
+        'free_delivery': bool(waived),
+        'waived_fee': waived,
+        'total': (subtotal_cents + _cents(fee)) / 100,
+    }
+
+
+def charge_waived_fee(quote):
+    """The quote again with a waived delivery fee put back (the reward ran out)"""
+    if not quote.get('free_delivery'):
+        return quote
+    fee = quote['waived_fee']
+    return dict(quote, delivery_fee=fee, free_delivery=False, waived_fee=0,
+                total=(_cents(quote['total']) + _cents(fee)) / 100)
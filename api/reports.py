@@ -0,0 +1,294 @@
+# Glengala Fresh - Sales reports from daily rollups
+# place_order adds each order to small per-day tables (totals by fulfilment,
+# orders by hour, and per-product and per-category sales) in its own
+# transaction. Reports are GROUP BYs over a date range of those rows - a year
+# is a few thousand rows at most, however many orders it held - instead of a
+# scan of orders and their items JSON. Days and hours are the shop's local time.
+
+from datetime import date, timedelta
+
+# Default report range, in days up to and including today
+DEFAULT_DAYS = 30
+# Longest range one request may ask for
+MAX_DAYS = 3 * 366
+
+# Period start for each ?group= (weeks start on Monday)
+GROUPS = {
+    'day': 'day',
+    'week': "date(day, '-6 days', 'weekday 1')",
+    'month': "strftime('%Y-%m-01', day)",
+}
+
+PRODUCT_SORTS = {'revenue': 'revenue', 'units': 'units', 'orders': 'orders'}
+
+# Order time as the shop sees it
+LOCAL_DAY = "date({}, 'localtime')"
+LOCAL_HOUR = "CAST(strftime('%H', {}, 'localtime') AS INTEGER)"
+
+
+class ReportError(ValueError):
+    """A report request that can't be answered as asked"""
+
+
+def create_schema(c):
+    """Create the rollup tables (called from init_db)"""
+    c.execute('''CREATE TABLE IF NOT EXISTS sales_daily
+                 (day DATE NOT NULL,
+                  fulfilment TEXT NOT NULL,
+                  orders INTEGER DEFAULT 0,
+                  revenue REAL DEFAULT 0,
+                  units REAL DEFAULT 0,
+                  lines INTEGER DEFAULT 0,
+                  PRIMARY KEY (day, fulfilment)) WITHOUT ROWID''')
+    c.execute('''CREATE TABLE IF NOT EXISTS sales_hourly
+                 (day DATE NOT NULL,
+                  hour INTEGER NOT NULL,
+                  orders INTEGER DEFAULT 0,
+                  revenue REAL DEFAULT 0,
+                  PRIMARY KEY (day, hour)) WITHOUT ROWID''')
+    c.execute('''CREATE TABLE IF NOT EXISTS sales_product_daily
+                 (day DATE NOT NULL,
+                  product_id INTEGER NOT NULL,
+                  orders INTEGER DEFAULT 0,
+                  units REAL DEFAULT 0,
+                  revenue REAL DEFAULT 0,
+                  PRIMARY KEY (day, product_id)) WITHOUT ROWID''')
+    c.execute('''CREATE TABLE IF NOT EXISTS sales_category_daily
+                 (day DATE NOT NULL,
+                  category TEXT NOT NULL,
+                  orders INTEGER DEFAULT 0,
+                  units REAL DEFAULT 0,
+                  revenue REAL DEFAULT 0,
+                  PRIMARY KEY (day, category)) WITHOUT ROWID''')
+    # Highest order id already counted, so backfill never counts one twice
+    c.execute('''CREATE TABLE IF NOT EXISTS sales_rollup_state
+                 (id INTEGER PRIMARY KEY CHECK (id = 1),
+                  last_order_id INTEGER NOT NULL DEFAULT 0)''')
+    c.execute('INSERT OR IGNORE INTO sales_rollup_state (id) VALUES (1)')
+
+
+def _number(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def record_order(c, order_id, total, lines, fulfilment=None):
+    """Add one order to the rollups; call inside the order's transaction.
+
+    lines are the priced items, each with id, category, quantity and total.
+    """
+    c.execute(f"SELECT {LOCAL_DAY.format('?')}, {LOCAL_HOUR.format('?')}", ('now', 'now'))
+    day, hour = c.fetchone()
+    units = sum(_number(line.get('quantity')) for line in lines)
+
+    c.execute('''INSERT INTO sales_daily (day, fulfilment, orders, revenue, units, lines)
+                 VALUES (?, ?, 1, ?, ?, ?)
+                 ON CONFLICT(day, fulfilment) DO UPDATE SET
+                 orders = orders + 1, revenue = revenue + excluded.revenue,
+                 units = units + excluded.units, lines = lines + excluded.lines''',
+              (day, fulfilment or 'unknown', total, units, len(lines)))
+    c.execute('''INSERT INTO sales_hourly (day, hour, orders, revenue) VALUES (?, ?, 1, ?)
+                 ON CONFLICT(day, hour) DO UPDATE SET
+                 orders = orders + 1, revenue = revenue + excluded.revenue''',
+              (day, hour, total))
+
+    # An order counts once per product and per category, however many lines it has
+    products, categories = {}, {}
+    for line in lines:
+        quantity, line_total = _number(line.get('quantity')), _number(line.get('total'))
+        product_id = line.get('id', line.get('product_id'))
+        if product_id is not None:
+            units_sold, revenue = products.get(product_id, (0.0, 0.0))
+            products[product_id] = (units_sold + quantity, revenue + line_total)
+        category = line.get('category') or 'other'
+        units_sold, revenue = categories.get(category, (0.0, 0.0))
+        categories[category] = (units_sold + quantity, revenue + line_total)
+    c.executemany('''INSERT INTO sales_product_daily (day, product_id, orders, units, revenue)
+                     VALUES (?, ?, 1, ?, ?)
+                     ON CONFLICT(day, product_id) DO UPDATE SET
+                     orders = orders + 1, units = units + excluded.units,
+                     revenue = revenue + excluded.revenue''',
+                  [(day, product_id, units_sold, revenue)
+                   for product_id, (units_sold, revenue) in products.items()])
+    c.executemany('''INSERT INTO sales_category_daily (day, category, orders, units, revenue)
+                     VALUES (?, ?, 1, ?, ?)
+                     ON CONFLICT(day, category) DO UPDATE SET
+                     orders = orders + 1, units = units + excluded.units,
+                     revenue = revenue + excluded.revenue''',
+                  [(day, category, units_sold, revenue)
+                   for category, (units_sold, revenue) in categories.items()])
+    c.execute('UPDATE sales_rollup_state SET last_order_id = MAX(last_order_id, ?) WHERE id = 1',
+              (order_id,))
+
+
+def backfill(conn):
+    """Roll up orders not counted yet, from orders and order_items (idempotent).
+
+    Run after order_items.backfill; lines without a product category count
+    under the product's current one.
+    """
+    c = conn.cursor()
+    c.execute('SELECT last_order_id FROM sales_rollup_state WHERE id = 1')
+    last_id = c.fetchone()[0]
+    c.execute('SELECT COUNT(*), MAX(id) FROM orders WHERE id > ?', (last_id,))
+    count, max_id = c.fetchone()
+    if not count:
+        return 0
+
+    day, hour = LOCAL_DAY.format('o.created_at'), LOCAL_HOUR.format('o.created_at')
+    # "WHERE ..." before each ON CONFLICT keeps the upsert unambiguous to the parser
+    c.execute(f'''INSERT INTO sales_daily (day, fulfilment, orders, revenue, units, lines)
+                  SELECT {day}, COALESCE(o.fulfilment, 'unknown'), COUNT(*), SUM(o.total),
+                         COALESCE(SUM(i.units), 0), COALESCE(SUM(i.lines), 0)
+                  FROM orders o
+                  LEFT JOIN (SELECT order_id, SUM(quantity) AS units, COUNT(*) AS lines
+                             FROM order_items WHERE order_id > ? GROUP BY order_id) i
+                         ON i.order_id = o.id
+                  WHERE o.id > ? GROUP BY 1, 2
+                  ON CONFLICT(day, fulfilment) DO UPDATE SET
+                  orders = orders + excluded.orders, revenue = revenue + excluded.revenue,
+                  units = units + excluded.units, lines = lines + excluded.lines''',
+              (last_id, last_id))
+    c.execute(f'''INSERT INTO sales_hourly (day, hour, orders, revenue)
+                  SELECT {day}, {hour}, COUNT(*), SUM(o.total) FROM orders o
+                  WHERE o.id > ? GROUP BY 1, 2
+                  ON CONFLICT(day, hour) DO UPDATE SET
+                  orders = orders + excluded.orders, revenue = revenue + excluded.revenue''',
+              (last_id,))
+    c.execute(f'''INSERT INTO sales_product_daily (day, product_id, orders, units, revenue)
+                  SELECT {day}, oi.product_id, COUNT(DISTINCT o.id), SUM(oi.quantity),
+                         SUM(oi.line_total)
+                  FROM order_items oi JOIN orders o ON o.id = oi.order_id
+                  WHERE oi.order_id > ? AND oi.product_id IS NOT NULL GROUP BY 1, 2
+                  ON CONFLICT(day, product_id) DO UPDATE SET
+                  orders = orders + excluded.orders, units = units + excluded.units,
+                  revenue = revenue + excluded.revenue''',
+              (last_id,))
+    c.execute(f'''INSERT INTO sales_category_daily (day, category, orders, units, revenue)
+                  SELECT {day}, COALESCE(p.category, 'other'), COUNT(DISTINCT o.id),
+                         SUM(oi.quantity), SUM(oi.line_total)
+                  FROM order_items oi JOIN orders o ON o.id = oi.order_id
+                  LEFT JOIN products p ON p.id = oi.product_id
+                  WHERE oi.order_id > ? GROUP BY 1, 2
+                  ON CONFLICT(day, category) DO UPDATE SET
+                  orders = orders + excluded.orders, units = units + excluded.units,
+                  revenue = revenue + excluded.revenue''',
+              (last_id,))
+    c.execute('UPDATE sales_rollup_state SET last_order_id = ? WHERE id = 1', (max_id,))
+    conn.commit()
+    return count
+
+
+def _day(value, name):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ReportError(f"{name} must be a date (YYYY-MM-DD), got {value!r}")
+
+
+def parse_range(args, today=None):
+    """(start, end) ISO dates from ?from= and ?to= (inclusive; default the last DEFAULT_DAYS)"""
+    today = today or date.today()
+    end = _day(args['to'], 'to') if args.get('to') else today
+    start = (_day(args['from'], 'from') if args.get('from')
+             else end - timedelta(days=DEFAULT_DAYS - 1))
+    if start > end:
+        raise ReportError('from must not be after to')
+    if (end - start).days >= MAX_DAYS:
+        raise ReportError(f'Reports cover at most {MAX_DAYS} days')
+    return start.isoformat(), end.isoformat()
+
+
+def _ratio(part, whole, digits=2):
+    return round(part / whole, digits) if whole else 0.0
+
+
+def summary(c, start, end, group='day'):
+    """Totals, fulfilment mix and a per-period series for start..end"""
+    if group not in GROUPS:
+        raise ReportError(f"Unknown group '{group}' (use {', '.join(GROUPS)})")
+    c.execute('''SELECT fulfilment, SUM(orders), SUM(revenue), SUM(units), SUM(lines)
+                 FROM sales_daily WHERE day BETWEEN ? AND ?
+                 GROUP BY fulfilment ORDER BY SUM(orders) DESC''', (start, end))
+    mix = c.fetchall()
+    orders = sum(row[1] for row in mix)
+    revenue = sum(row[2] for row in mix)
+    units = sum(row[3] for row in mix)
+    lines = sum(row[4] for row in mix)
+
+    c.execute(f'''SELECT {GROUPS[group]} AS period, SUM(orders), SUM(revenue), SUM(units)
+                  FROM sales_daily WHERE day BETWEEN ? AND ?
+                  GROUP BY period ORDER BY period''', (start, end))
+    series = [{'period': period, 'orders': period_orders, 'revenue': round(period_revenue, 2),
+               'units': round(period_units, 2),
+               'average_order': _ratio(period_revenue, period_orders)}
+              for period, period_orders, period_revenue, period_units in c.fetchall()]
+
+    return {
+        'from': start, 'to': end, 'group': group,
+        'orders': orders,
+        'revenue': round(revenue, 2),
+        'units': round(units, 2),
+        'average_order': _ratio(revenue, orders),
+        'average_units': _ratio(units, orders),
+        'average_lines': _ratio(lines, orders),
+        'fulfilment': [{'fulfilment': name, 'orders': count, 'revenue': round(amount, 2),
+                        'share': _ratio(count, orders, 4)}
+                       for name, count, amount, _, _ in mix],
+        'series': series,
+    }
+
+
+def products(c, start, end, sort='revenue', limit=20, category=None):
+    """Best sellers for start..end by revenue, units or orders"""
+    if sort not in PRODUCT_SORTS:
+        raise ReportError(f"Unknown sort '{sort}' (use {', '.join(PRODUCT_SORTS)})")
+    params = [start, end]
+    category_filter = ''
+    if category:
+        category_filter = 'AND p.category = ?'
+        params.append(category)
+    c.execute(f'''SELECT s.product_id, COALESCE(p.name, 'Product #' || s.product_id) AS name,
+                         p.category, SUM(s.orders) AS orders, SUM(s.units) AS units,
+                         SUM(s.revenue) AS revenue
+                  FROM sales_product_daily s LEFT JOIN products p ON p.id = s.product_id
+                  WHERE s.day BETWEEN ? AND ? {category_filter}
+                  GROUP BY s.product_id
+                  ORDER BY {PRODUCT_SORTS[sort]} DESC LIMIT ?''', params + [int(limit)])
+    return {
+        'from': start, 'to': end, 'sort': sort,
+        'products': [{'product_id': product_id, 'name': name, 'category': product_category,
+                      'orders': orders, 'units': round(units, 2), 'revenue': round(revenue, 2)}
+                     for product_id, name, product_category, orders, units, revenue in c.fetchall()],
+    }
+
+
+def categories(c, start, end):
+    """Revenue, units and orders per category for start..end, with revenue share"""
+    c.execute('''SELECT category, SUM(orders), SUM(units), SUM(revenue)
+                 FROM sales_category_daily WHERE day BETWEEN ? AND ?
+                 GROUP BY category ORDER BY SUM(revenue) DESC''', (start, end))
+    rows = c.fetchall()
+    total = sum(row[3] for row in rows)
+    return {
+        'from': start, 'to': end,
+        'categories': [{'category': category, 'orders': orders, 'units': round(units, 2),
+                        'revenue': round(revenue, 2), 'share': _ratio(revenue, total, 4)}
+                       for category, orders, units, revenue in rows],
+    }
+
+
+def heatmap(c, start, end):
+    """Orders and revenue by weekday (0 = Sunday) and hour for start..end"""
+    orders = [[0] * 24 for _ in range(7)]
+    revenue = [[0.0] * 24 for _ in range(7)]
+    c.execute('''SELECT CAST(strftime('%w', day) AS INTEGER) AS weekday, hour,
+                        SUM(orders), SUM(revenue)
+                 FROM sales_hourly WHERE day BETWEEN ? AND ?
+                 GROUP BY weekday, hour''', (start, end))
+    for weekday, hour, count, amount in c.fetchall():
+        orders[weekday][hour] = count
+        revenue[weekday][hour] = round(amount, 2)
+    return {'from': start, 'to': end, 'orders': orders, 'revenue': revenue}
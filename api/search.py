@@ -0,0 +1,255 @@
+# Glengala Fresh - Product search
+# An FTS5 index over active products (name, category and synonyms) is kept in
+# sync by triggers on products, so every write path updates it for free.
+# Queries are ranked prefix matches; when those come up short, each word is
+# widened to indexed terms within a small edit distance (typo tolerance).
+# Recent answers are kept in an LRU that is dropped on every catalog change.
+
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+MAX_RESULTS = 50
+DEFAULT_RESULTS = 20
+MAX_TERMS = 8
+LRU_SIZE = 256
+
+# bm25 column weights: name, category, synonyms
+RANK = 'bm25(product_search, 10.0, 2.0, 5.0)'
+
+# Words in a product name (lowercase, substring match) -> extra search terms
+SYNONYMS = {
+    'capsicum': 'pepper peppers bell',
+    'eggplant': 'aubergine',
+    'zucchini': 'courgette',
+    'rockmelon': 'cantaloupe',
+    'coriander': 'cilantro',
+    'potato': 'spud spuds',
+    'chili': 'chilli chile hot',
+    'mandarin': 'tangerine citrus',
+    'orange': 'citrus',
+    'lemon': 'citrus',
+    'grapefruit': 'citrus',
+    'pumpkin': 'squash',
+    'corn': 'maize sweetcorn',
+    'lettuce': 'salad greens',
+    'spinach': 'greens',
+    'almonds': 'nuts',
+    'walnuts': 'nuts',
+    'cashews': 'nuts',
+    'peanuts': 'nuts',
+    'pasta': 'noodles',
+    'sultanas': 'raisins',
+    'eggs': 'egg',
+}
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def create_schema(c):
+    """Create the search index, synonym table and sync triggers (called from init_db)"""
+    c.execute('''CREATE TABLE IF NOT EXISTS search_synonyms
+                 (term TEXT PRIMARY KEY,
+                  synonyms TEXT NOT NULL)''')
+    c.executemany('INSERT OR IGNORE INTO search_synonyms (term, synonyms) VALUES (?, ?)',
+                  SYNONYMS.items())
+
+    # rowid is the product id
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5
+                 (name, category, synonyms,
+                  tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')''')
+    # Indexed terms, for typo-tolerant matching
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS product_search_vocab
+                 USING fts5vocab(product_search, 'row')''')
+    _create_triggers(c)
+
+
+def _create_triggers(c):
+    insert = '''INSERT INTO product_search (rowid, name, category, synonyms)
+                SELECT new.id, new.name, new.category,
+                       (SELECT group_concat(synonyms, ' ') FROM search_synonyms
+                        WHERE instr(lower(new.name), term) > 0)
+                WHERE new.active = 1 AND trim(new.name) != '';'''
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS products_search_insert
+                  AFTER INSERT ON products BEGIN {insert} END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS products_search_update
+                  AFTER UPDATE OF name, category, active ON products BEGIN
+                  DELETE FROM product_search WHERE rowid = old.id;
+                  {insert} END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS products_search_delete
+                 AFTER DELETE ON products BEGIN
+                 DELETE FROM product_search WHERE rowid = old.id; END''')
+
+
+def rebuild(c):
+    """Re-index every active product (after synonym edits or on first run)"""
+    c.execute('DELETE FROM product_search')
+    c.execute('''INSERT INTO product_search (rowid, name, category, synonyms)
+                 SELECT p.id, p.name, p.category,
+                        (SELECT group_concat(s.synonyms, ' ') FROM search_synonyms s
+                         WHERE instr(lower(p.name), s.term) > 0)
+                 FROM products p WHERE p.active = 1 AND length(trim(p.name)) > 0''')
+
+
+@contextmanager
+def deferred_index(c):
+    """Write many products without per-row index upkeep, then rebuild once.
+
+    Only inside a write transaction: the triggers are dropped and re-created
+    in it, so no other connection ever sees them missing. Bulk imports use
+    this - one rebuild is several times cheaper than 100k trigger firings.
+    """
+    c.execute('DROP TRIGGER IF EXISTS products_search_insert')
+    c.execute('DROP TRIGGER IF EXISTS products_search_update')
+    yield
+    _create_triggers(c)
+    rebuild(c)
+
+
+def ensure_index(c):
+    """Rebuild the index if it is out of step with products (e.g. just created)"""
+    c.execute("SELECT COUNT(*) FROM products WHERE active = 1 AND trim(name) != ''")
+    expected = c.fetchone()[0]
+    c.execute('SELECT COUNT(*) FROM product_search')
+    if c.fetchone()[0] != expected:
+        rebuild(c)
+        return True
+    return False
+
+
+def terms(query):
+    """Lowercase words of a query, capped at MAX_TERMS"""
+    return _WORD.findall(query.lower())[:MAX_TERMS]
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance, or limit + 1 once it is known to exceed limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def max_typos(term):
+    if len(term) < 4:
+        return 0
+    return 1 if len(term) < 8 else 2
+
+
+def _phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+class ProductSearch:
+    """Ranked product search with an LRU of recent queries"""
+
+    def __init__(self, connection, lru_size=LRU_SIZE):
+        # connection() is a context manager yielding a database connection
+        self.connection = connection
+        self.lru_size = lru_size
+        self.version = 0
+        self._lru = OrderedDict()
+        self._vocabulary = None
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'fuzzy': 0, 'invalidations': 0}
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._lru.clear()
+            self._vocabulary = None
+            self.stats['invalidations'] += 1
+
+    def _vocab(self, c):
+        vocabulary = self._vocabulary
+        if vocabulary is None:
+            c.execute('SELECT term FROM product_search_vocab')
+            vocabulary = [row[0] for row in c.fetchall()]
+            self._vocabulary = vocabulary
+        return vocabulary
+
+    def _similar(self, c, term, is_last):
+        """Indexed terms within max_typos of term (prefixes too, for the last word)"""
+        limit = max_typos(term)
+        if not limit:
+            return [term]
+        matches = {term}
+        for candidate in self._vocab(c):
+            if edit_distance(term, candidate, limit) <= limit:
+                matches.add(candidate)
+            elif is_last:
+                # Still typing: "brocol" should find "broccoli" (via "broccol")
+                for length in range(len(term) - limit, len(term) + limit + 1):
+                    prefix = candidate[:length]
+                    if length < len(candidate) and edit_distance(term, prefix, limit) <= limit:
+                        matches.add(prefix)
+                        break
+        return sorted(matches)
+
+    def _match(self, c, match, columns, limit, exclude=()):
+        placeholders = ', '.join('?' for _ in exclude)
+        skip = f'AND p.id NOT IN ({placeholders})' if exclude else ''
+        c.execute(f'''SELECT {columns} FROM product_search
+                      JOIN products p ON p.id = product_search.rowid
+                      WHERE product_search MATCH ? AND p.active = 1 {skip}
+                      ORDER BY {RANK} LIMIT ?''', (match, *exclude, limit))
+        return [dict(row) for row in c.fetchall()]
+
+    def search(self, query, columns, limit=DEFAULT_RESULTS):
+        """{'query', 'results', 'fuzzy'} for a free-text query"""
+        words = terms(query)
+        key = (' '.join(words), tuple(columns), limit)
+        with self._lock:
+            cached = self._lru.get(key)
+            if cached is not None:
+                self._lru.move_to_end(key)
+                self.stats['hits'] += 1
+                return dict(cached, query=query)
+            self.stats['misses'] += 1
+            version = self.version
+
+        # Cached per normalised words, so the caller's raw text is added per call
+        result = {'results': [], 'fuzzy': False}
+        if words:
+            select = ', '.join(f'p.{column}' for column in columns)
+            with self.connection() as conn:
+                c = conn.cursor()
+                # Every word must match, each as a prefix
+                exact = ' AND '.join(_phrase(word) + '*' for word in words)
+                result['results'] = self._match(c, exact, select, limit)
+                if len(result['results']) < limit:
+                    widened = ' AND '.join(
+                        '(' + ' OR '.join(_phrase(t) + '*'
+                                          for t in self._similar(c, word, i == len(words) - 1)) + ')'
+                        for i, word in enumerate(words))
+                    if widened != exact:
+                        found = [row['id'] for row in result['results']]
+                        extra = self._match(c, widened, select, limit - len(found), found)
+                        if extra:
+                            result['results'] += extra
+                            result['fuzzy'] = True
+                            self.stats['fuzzy'] += 1
+
+        with self._lock:
+            # Don't cache an answer computed against a catalog that has since changed
+            if version == self.version:
+                self._lru[key] = result
+                if len(self._lru) > self.lru_size:
+                    self._lru.popitem(last=False)
+        return dict(result, query=query)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['cached_queries'] = len(self._lru)
+            stats['vocabulary'] = len(self._vocabulary) if self._vocabulary is not None else None
+        return stats
@@ -0,0 +1,12 @@
+# Glengala Fresh - API tests
+# Run from api/: python -m pytest tests (or python -m unittest discover tests).
+# Everything runs against a scratch database, never glengala.db, so it is
+# chosen here - before any test module imports app or db.
+
+import os
+
+import bench
+
+bench.use_scratch_database()
+# No background push thread polling the scratch database
+os.environ.setdefault('PUSH_AUTOSTART', '0')
@@ -0,0 +1,41 @@
+import unittest
+
+import app
+import catalog_sync
+from db import pool
+
+
+class NoOpBulkUpdateTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        app.init_db()
+        cls.client = app.app.test_client()
+        response = cls.client.post('/api/products', json={'name': 'Bulk Test Carrots',
+                                                          'category': 'vegetables',
+                                                          'price': 2.5, 'unit': 'kg'})
+        cls.product_id = response.get_json()['product_id']
+
+    def catalog_state(self):
+        with pool.connection() as conn:
+            c = conn.cursor()
+            version = catalog_sync.current_version(c)
+            c.execute("SELECT generation FROM cache_generations WHERE topic = 'catalog'")
+            generation = c.fetchone()
+        return version, generation[0] if generation else None
+
+    def test_unchanged_rows_leave_version_and_etag_alone(self):
+        etag = self.client.get('/api/products').headers['ETag']
+        before = self.catalog_state()
+
+        for route in ('/api/products/bulk', '/api/admin/bulk-update'):
+            response = self.client.post(route, json={'products': [
+                {'id': self.product_id, 'price': 2.5}]})
+            self.assertEqual(response.get_json()['updated_count'], 0)
+            self.assertEqual(response.get_json()['version'], before[0])
+
+        self.assertEqual(self.catalog_state(), before)
+        self.assertEqual(self.client.get('/api/products').headers['ETag'], etag)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import gzip
+import unittest
+from unittest import mock
+
+import cache
+
+
+class SnapshotEncodingTest(unittest.TestCase):
+    payload = {'products': [{'id': 1, 'name': 'Carrots'}] * 50}
+
+    def test_brotli_when_installed_and_accepted(self):
+        if cache.brotli is None:
+            self.skipTest('brotli not installed')
+        body, encoding, etag = cache.Snapshot(self.payload, 1).encoded('gzip, deflate, br')
+        self.assertEqual(encoding, 'br')
+        self.assertEqual(cache.brotli.decompress(body), cache.dumps(self.payload))
+        self.assertTrue(etag.endswith('-br"'))
+
+    def test_falls_back_to_gzip_without_brotli(self):
+        with mock.patch.object(cache, 'brotli', None):
+            snapshot = cache.Snapshot(self.payload, 1)
+        self.assertIsNone(snapshot.br)
+        body, encoding, etag = snapshot.encoded('gzip, deflate, br')
+        self.assertEqual(encoding, 'gzip')
+        self.assertEqual(gzip.decompress(body), snapshot.body)
+        self.assertTrue(etag.endswith('-gz"'))
+        self.assertEqual(snapshot.encoded('br'), (snapshot.body, None, snapshot.etag))
+
+
+if __name__ == '__main__':
+    unittest.main()
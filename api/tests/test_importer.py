@@ -0,0 +1,44 @@
+import hashlib
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DB = os.path.join(API_DIR, 'glengala.db')
+
+
+def fingerprint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class ImporterCliTest(unittest.TestCase):
+    def test_db_option_leaves_default_database_alone(self):
+        with tempfile.TemporaryDirectory() as scratch:
+            target = os.path.join(scratch, 'import.db')
+            csv_path = os.path.join(scratch, 'products.csv')
+            with open(csv_path, 'w', encoding='utf-8') as f:
+                f.write('ID,Name,Category,Price,Unit,Active\n'
+                        '1,Carrots,vegetables,2.5,kg,1\n'
+                        '2,Apples,fruits,4,kg,1\n')
+            env = dict(os.environ, IMAGE_DIR=os.path.join(scratch, 'images'))
+            env.pop('DATABASE_PATH', None)
+            before = fingerprint(DEFAULT_DB)
+
+            result = subprocess.run([sys.executable, 'importer.py', csv_path, '--db', target],
+                                    cwd=API_DIR, env=env, capture_output=True, text=True)
+
+            self.assertEqual(result.returncode, 0, result.stderr)
+            self.assertEqual(fingerprint(DEFAULT_DB), before)
+            with sqlite3.connect(target) as conn:
+                names = [row[0] for row in conn.execute('SELECT name FROM products ORDER BY id')]
+            self.assertEqual(names, ['Carrots', 'Apples'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import sqlite3
+import unittest
+
+import achievements
+import quote
+from quote import PriceTable, quote_cart
+
+
+def product(product_id, price, unit='each', special=None):
+    row = {'id': product_id, 'name': f'Product {product_id}', 'category': 'fruits',
+           'price': price, 'unit': unit, 'hasSpecial': 0, 'specialPrice': 0, 'specialQuantity': 0}
+    if special:
+        row.update(hasSpecial=1, specialQuantity=special[0], specialPrice=special[1])
+    return row
+
+
+TABLE = PriceTable([
+    product(1, 2.0),
+    product(2, 1.5, special=(3, 4.0)),          # 3 for $4
+    product(3, 10.0, unit='hundredg', special=(1, 8.0)),  # 1kg for $8, sold in 100g
+    product(4, 1.0, special=(2, 2.5)),          # a "deal" dearer than the price
+])
+
+
+def line_total(product_id, quantity):
+    return quote_cart(TABLE, {'items': [{'id': product_id, 'quantity': quantity}]})['subtotal']
+
+
+class SpecialsTest(unittest.TestCase):
+    """Same cases as calculateItemTotal (shop-functions-enhanced.js)"""
+
+    def test_plain_price(self):
+        self.assertEqual(line_total(1, 3), 6.0)
+
+    def test_multi_buy_with_remainder(self):
+        # 3 for $4 plus one at $1.50
+        self.assertEqual(line_total(2, 4), 5.5)
+        self.assertEqual(line_total(2, 2), 3.0)
+
+    def test_weight_steps_count_towards_the_deal(self):
+        # 12 x 100g = 1.2kg: 1kg for $8 plus 200g at $10/kg
+        self.assertEqual(line_total(3, 12), 10.0)
+
+    def test_deal_only_used_when_cheaper(self):
+        self.assertEqual(line_total(4, 2), 2.0)
+
+
+class FreeDeliveryTest(unittest.TestCase):
+    cart = {'items': [{'id': 1, 'quantity': 5}], 'fulfilment': 'delivery', 'postcode': '3020'}
+
+    def test_reward_waives_the_fee(self):
+        charged = quote_cart(TABLE, self.cart)
+        free = quote_cart(TABLE, self.cart, free_delivery=True)
+        self.assertEqual((charged['delivery_fee'], charged['total']), (10, 20.0))
+        self.assertEqual((free['delivery_fee'], free['total'], free['free_delivery']), (0, 10.0, True))
+        self.assertEqual(quote.charge_waived_fee(free)['total'], charged['total'])
+
+    def test_reward_not_spent_without_a_fee(self):
+        cart = dict(self.cart, items=[{'id': 1, 'quantity': 30}])
+        self.assertFalse(quote_cart(TABLE, cart, free_delivery=True)['free_delivery'])
+        pickup = dict(self.cart, fulfilment='pickup')
+        self.assertFalse(quote_cart(TABLE, pickup, free_delivery=True)['free_delivery'])
+
+    def test_credits_are_earned_less_spent(self):
+        conn = sqlite3.connect(':memory:')
+        c = conn.cursor()
+        achievements.create_schema(c)
+        c.execute('CREATE TABLE orders (id INTEGER PRIMARY KEY, user_id INTEGER, '
+                  'free_delivery INTEGER NOT NULL DEFAULT 0)')
+        self.assertEqual(achievements.free_deliveries_left(c, 1), 0)
+        c.executemany('INSERT INTO user_achievements (user_id, achievement_id) VALUES (1, ?)',
+                      [('first_order',), ('glengala_regular',), ('early_bird',)])
+        c.execute('INSERT INTO orders (user_id, free_delivery) VALUES (1, 1)')
+        self.assertEqual(achievements.free_deliveries_left(c, 1), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
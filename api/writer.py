@@ -0,0 +1,162 @@
+# Glengala Fresh - Single-writer queue with group commit
+# Request threads hand their writes to one writer thread instead of fighting
+# over SQLite's write lock. Whatever has queued up while the previous commit
+# was running goes into the next transaction together (group commit); each
+# write runs in its own savepoint, so one failure doesn't sink the batch, and
+# its caller gets the result through a future once the batch has committed.
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+import db
+import metrics
+
+MAX_BATCH = int(os.environ.get('WRITER_MAX_BATCH', 64))
+# Extra time a lone write waits for company before committing (0 = none)
+BATCH_WAIT_SECONDS = float(os.environ.get('WRITER_BATCH_WAIT_MS', 0)) / 1000
+MAX_PENDING = int(os.environ.get('WRITER_MAX_PENDING', 1000))
+WRITE_TIMEOUT_SECONDS = float(os.environ.get('WRITER_TIMEOUT', 30))
+
+
+class WriterBusy(Exception):
+    """The write queue is full or didn't get to a write in time"""
+
+
+class WriteQueue:
+    """One thread, one connection, every application write.
+
+    A write is a function `op(c, *args)` that uses the cursor it is given
+    and never commits or rolls back itself.
+    """
+
+    def __init__(self, path=None, max_batch=MAX_BATCH, batch_wait=BATCH_WAIT_SECONDS):
+        self.path = path
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait
+        self._queue = queue.Queue(maxsize=MAX_PENDING)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.stats = {'writes': 0, 'failed_writes': 0, 'batches': 0,
+                      'failed_batches': 0, 'largest_batch': 0, 'rejected': 0}
+
+    def start(self):
+        """Start the writer thread (idempotent; submit() calls this)"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name='db-writer', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=5):
+        """Finish queued writes, then stop the thread"""
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def submit(self, op, *args):
+        """Queue a write; returns a Future for op's return value"""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError('submit() from inside a write would deadlock')
+        self.start()
+        future = Future()
+        try:
+            # The request's metrics travel with the write so its SQL is charged to that route
+            self._queue.put((op, args, future, metrics.current(), time.perf_counter()),
+                            timeout=WRITE_TIMEOUT_SECONDS)
+        except queue.Full:
+            self.stats['rejected'] += 1
+            raise WriterBusy('write queue full')
+        return future
+
+    def run(self, op, *args, timeout=WRITE_TIMEOUT_SECONDS):
+        """Queue a write and wait for its committed result (or exception)"""
+        try:
+            return self.submit(op, *args).result(timeout)
+        except FutureTimeout:
+            raise WriterBusy('write timed out')
+
+    def _next_batch(self):
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        waited = False
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                if waited or not self.batch_wait:
+                    break
+                waited = True
+                time.sleep(self.batch_wait)
+                continue
+            if item is None:
+                # Stop after this batch
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        conn = db.connect(self.path)
+        try:
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    break
+                self._commit(conn, batch)
+        finally:
+            conn.close()
+
+    def _commit(self, conn, batch):
+        c = conn.cursor()
+        done = []
+        started = time.perf_counter()
+        for _, _, _, _, queued_at in batch:
+            metrics.writer_queue_seconds.observe(started - queued_at)
+        try:
+            c.execute('BEGIN IMMEDIATE')
+            metrics.writer_lock_seconds.observe(time.perf_counter() - started)
+            for op, args, future, request_stats, _ in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                c.execute('SAVEPOINT write')
+                try:
+                    with metrics.attributed(request_stats):
+                        result = op(c, *args)
+                except Exception as e:
+                    c.execute('ROLLBACK TO write')
+                    c.execute('RELEASE write')
+                    self.stats['failed_writes'] += 1
+                    future.set_exception(e)
+                    continue
+                c.execute('RELEASE write')
+                done.append((future, result))
+            conn.commit()
+        except Exception as e:
+            # BEGIN or COMMIT failed - nothing in this batch was written
+            if conn.in_transaction:
+                conn.rollback()
+            self.stats['failed_batches'] += 1
+            for _, _, future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.stats['batches'] += 1
+        self.stats['writes'] += len(done)
+        self.stats['largest_batch'] = max(self.stats['largest_batch'], len(batch))
+        for future, result in done:
+            future.set_result(result)
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['pending'] = self._queue.qsize()
+        stats['running'] = self._thread is not None and self._thread.is_alive()
+        stats['average_batch'] = (round(stats['writes'] / stats['batches'], 2)
+                                  if stats['batches'] else 0.0)
+        return stats
+
+
+writer = WriteQueue()
@@ -0,0 +1,55 @@
+// Glengala Fresh - Startup data in one round trip
+// The server inlines the catalog, settings, daily specials and recent price
+// changes into shop.html (<script id="glengala-bootstrap">); without that -
+// or for the customer's own profile - one /api/bootstrap call fetches them
+// all. Scripts ask for their part on first load and fall back to their own
+// endpoint when it isn't there.
+
+class GlengalaBootstrap {
+    constructor() {
+        this.apiBase = window.location.origin + '/api';
+        this.view = 'list'; // same catalog view as live-pricing.js
+        this.promise = null;
+    }
+
+    load() {
+        if (this.promise) return this.promise;
+        const userId = parseInt(localStorage.getItem('glengala_user_id'), 10);
+        const inline = document.getElementById('glengala-bootstrap');
+        let data = null;
+        if (inline) {
+            try {
+                data = JSON.parse(inline.textContent);
+            } catch (e) {
+                console.log('Inline startup data unreadable:', e);
+            }
+        }
+        // The page is the same for everyone; a customer's profile needs the API
+        if (data && !Number.isFinite(userId)) {
+            this.promise = Promise.resolve(data);
+            return this.promise;
+        }
+        if (data) {
+            this.promise = fetch(`${this.apiBase}/user/${userId}?view=${this.view}`)
+                .then(response => response.ok ? response.json() : null)
+                .catch(() => null)
+                .then(user => ({ ...data, user }));
+            return this.promise;
+        }
+        const query = `view=${this.view}` + (Number.isFinite(userId) ? `&user_id=${userId}` : '');
+        this.promise = fetch(`${this.apiBase}/bootstrap?${query}`)
+            .then(response => response.ok ? response.json() : data)
+            .catch(() => data);
+        return this.promise;
+    }
+
+    // One startup document ('catalog', 'settings', 'specials',
+    // 'price_changes' or 'user'), or null to fetch it the usual way
+    async get(name) {
+        const data = await this.load();
+        return data && data[name] != null ? data[name] : null;
+    }
+}
+
+const glengalaBootstrap = new GlengalaBootstrap();
+window.glengalaBootstrap = glengalaBootstrap;
@@ -10,7 +10,10 @@ const CHECKOUT_CONFIG = {
         UNDER_30: 10,
         UNDER_50: 5,
         OVER_50: 0
-    }
+    },
+    // The server forgets idempotency keys after IDEMPOTENCY_TTL_HOURS (72h), so
+    // an unconfirmed order older than that is dropped rather than resent
+    PENDING_ORDER_MAX_AGE_MS: 72 * 60 * 60 * 1000
 };
 
 const AUD = new Intl.NumberFormat('en-AU', { style: 'currency', currency: 'AUD' });
@@ -29,6 +32,9 @@ class CheckoutSystem {
             timeWindow: savedInfo.timeWindow || 'morning',
             notes: ''
         };
+        // Resend any order whose confirmation never arrived
+        this.retryPendingOrders();
+        window.addEventListener('online', () => this.retryPendingOrders());
     }
     saveCustomerInfo() {
         localStorage.setItem('glengala_customer_info', JSON.stringify({
@@ -89,6 +95,70 @@ class CheckoutSystem {
         return false;
     }
 
+    // The cart as /api/cart/quote and /api/order read it
+    cartPayload() {
+        const userId = parseInt(localStorage.getItem('glengala_user_id'), 10);
+        const fulfilment = this.customerInfo.fulfilment;
+        return {
+            items: this.shop.cart
+                .filter(item => item.id)
+                .map(item => ({ id: item.id, quantity: item.quantity })),
+            fulfilment,
+            postcode: this.customerInfo.postcode,
+            user_id: Number.isFinite(userId) ? userId : null,
+            // The server decides whether the reward is still there to spend
+            free_delivery: fulfilment === 'delivery' && this.hasFreeDeliveryReward()
+        };
+    }
+    
+    // Ask the server to price the cart; updateDeliveryUI redraws when it answers
+    refreshQuote() {
+        const cart = this.cartPayload();
+        const signature = JSON.stringify(cart);
+        if (signature === this.quoteSignature) return;
+        this.quoteSignature = signature;
+        this.serverQuote = null;
+        if (cart.items.length === 0) return;
+        
+        fetch(`${window.location.origin}/api/cart/quote`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: signature
+        })
+            .then(response => response.ok ? response.json() : null)
+            .then(quote => {
+                // The cart changed while this was in flight
+                if (signature !== this.quoteSignature) return;
+                this.serverQuote = quote && quote.errors.length === 0 ? quote : null;
+                if (this.serverQuote) this.updateDeliveryUI();
+            })
+            .catch(() => {});
+    }
+    
+    // The server quote for the cart as it is now, or null
+    currentQuote() {
+        if (!this.serverQuote) return null;
+        return JSON.stringify(this.cartPayload()) === this.quoteSignature ? this.serverQuote : null;
+    }
+    
+    // Subtotal, delivery fee (null if we don't deliver there) and total: the
+    // server's quote, or the same rules worked out locally until it arrives
+    getTotals() {
+        const { postcode, fulfilment } = this.customerInfo;
+        const quote = this.currentQuote();
+        if (quote) {
+            const fee = quote.delivery_available ? quote.delivery_fee : null;
+            return { subtotal: quote.subtotal, fee, deliveryFee: fee || 0,
+                     total: quote.total, freeDelivery: quote.free_delivery };
+        }
+        const subtotal = this.shop.cart.reduce((sum, item) => sum + item.total, 0);
+        const freeDelivery = fulfilment === 'delivery' && this.hasFreeDeliveryReward()
+            && (this.calculateDeliveryFee(subtotal, postcode) || 0) > 0;
+        const fee = this.calculateDeliveryFee(subtotal, postcode, freeDelivery);
+        const deliveryFee = (fulfilment === 'delivery' && fee !== null) ? fee : 0;
+        return { subtotal, fee, deliveryFee, total: subtotal + deliveryFee, freeDelivery };
+    }
+
     // Get cutoff status for next-day delivery
     getCutoffStatus(now = new Date()) {
         const day = now.getDay();
@@ -124,13 +194,10 @@ class CheckoutSystem {
     buildOrderText() {
         const { name, phone, address, postcode, fulfilment, timeWindow, notes } = this.customerInfo;
         const items = this.shop.cart;
-        const subtotal = this.shop.cart.reduce((sum, item) => sum + item.total, 0);
-        
-        const deliveryFee = (fulfilment === 'delivery') 
-            ? this.calculateDeliveryFee(subtotal, postcode) || 0 
-            : 0;
-        
-        const total = subtotal + deliveryFee;
+        // The server's prices when we have them - they are what the order is recorded at
+        const quote = this.currentQuote();
+        const lineTotals = new Map((quote ? quote.items : []).map(line => [line.id, line.total]));
+        const { subtotal, deliveryFee, total } = this.getTotals();
 
         // Unit display mapping
         const unitDisplayMap = {
@@ -146,7 +213,8 @@ class CheckoutSystem {
 
         const itemLines = items.map(item => {
             const unitText = unitDisplayMap[item.unit] || item.unit;
-            return `• ${item.name} — ${item.quantity} ${unitText} @ ${AUD.format(item.price)} = ${AUD.format(item.total)}`;
+            const lineTotal = lineTotals.has(item.id) ? lineTotals.get(item.id) : item.total;
+            return `• ${item.name} — ${item.quantity} ${unitText} @ ${AUD.format(item.price)} = ${AUD.format(lineTotal)}`;
         }).join('\n');
 
         const fulfilLine = fulfilment === 'delivery'
@@ -190,25 +258,87 @@ class CheckoutSystem {
         // Track order for achievements
         this.trackOrderForRewards();
         
-        // Use free delivery reward if applicable
-        if (this.customerInfo.fulfilment === 'delivery' && this.hasFreeDeliveryReward()) {
+        // Record the order with the shop (queued by the service worker if offline)
+        this.recordOrder();
+        
+        // Use free delivery reward if it was applied to this order
+        if (this.getTotals().freeDelivery) {
             this.applyFreeDeliveryReward();
         }
         
         window.location.href = `sms:${CHECKOUT_CONFIG.OWNER_SMS_NUMBER}${sep}body=${body}`;
     }
     
+    // Send the order to the API so it's priced and counted server-side
+    recordOrder() {
+        const order = this.cartPayload();
+        if (order.items.length === 0) return;
+        
+        // One key per checkout - retries of this order can't place it twice,
+        // but ordering the same basket again later is a new order
+        const key = (window.crypto && crypto.randomUUID)
+            ? crypto.randomUUID()
+            : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+        const pending = this.getPendingOrders();
+        pending.push({ key, order, created: Date.now() });
+        this.savePendingOrders(pending);
+        
+        this.sendOrder(key, order);
+    }
+    
+    // Orders sent but not yet confirmed, kept only until they can be retried
+    getPendingOrders() {
+        let pending;
+        try {
+            pending = JSON.parse(localStorage.getItem('glengala_pending_order') || '[]');
+        } catch {
+            pending = [];
+        }
+        if (!Array.isArray(pending)) return [];
+        const cutoff = Date.now() - CHECKOUT_CONFIG.PENDING_ORDER_MAX_AGE_MS;
+        return pending.filter(entry => entry && entry.key && entry.created > cutoff);
+    }
+    
+    savePendingOrders(pending) {
+        if (pending.length > 0) {
+            localStorage.setItem('glengala_pending_order', JSON.stringify(pending));
+        } else {
+            localStorage.removeItem('glengala_pending_order');
+        }
+    }
+    
+    retryPendingOrders() {
+        this.getPendingOrders().forEach(entry => this.sendOrder(entry.key, entry.order));
+    }
+    
+    sendOrder(key, order) {
+        fetch(`${window.location.origin}/api/order`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'Idempotency-Key': key },
+            body: JSON.stringify(order),
+            keepalive: true
+        }).then(response => {
+            // Busy or failing - keep it for the next retry
+            if (response.status === 429 || response.status >= 500) return;
+            // Placed, replayed, rejected or queued by the service worker (202) -
+            // either way it's no longer ours to resend
+            this.savePendingOrders(this.getPendingOrders().filter(entry => entry.key !== key));
+            // The server has counted it: pick up the new streak and any unlocks
+            if (response.status === 200 && typeof glengalaRewards !== 'undefined'
+                    && glengalaRewards.usesServerStats()) {
+                glengalaRewards.syncFromServer(true).then(() => this.updateRewardsBadge());
+            }
+        }).catch(() => {});
+    }
+
     // Track order for rewards system
     trackOrderForRewards() {
         if (typeof glengalaRewards === 'undefined') return;
-        
-        const subtotal = this.shop.cart.reduce((sum, item) => sum + item.total, 0);
-        const deliveryFee = (this.customerInfo.fulfilment === 'delivery') 
-            ? (this.calculateDeliveryFee(subtotal, this.customerInfo.postcode) || 0) 
-            : 0;
+        // Counted server-side when the order is recorded (see sendOrder)
+        if (glengalaRewards.usesServerStats()) return;
         
         const order = {
-            total: subtotal + deliveryFee,
+            total: this.getTotals().total,
             items: this.shop.cart.map(item => ({
                 name: item.name,
                 category: item.category || 'other',
@@ -223,16 +353,19 @@ class CheckoutSystem {
         if (newAchievements.length > 0) {
             setTimeout(() => {
                 glengalaRewards.showNewAchievements(newAchievements);
-                // Update badge
-                const freeDeliveries = glengalaRewards.getFreeDeliveryCount();
-                const badge = document.getElementById('rewardsBadge');
-                if (badge && freeDeliveries > 0) {
-                    badge.textContent = freeDeliveries;
-                    badge.style.display = 'inline-block';
-                }
+                this.updateRewardsBadge();
             }, 2000);
         }
     }
+    
+    updateRewardsBadge() {
+        const freeDeliveries = glengalaRewards.getFreeDeliveryCount();
+        const badge = document.getElementById('rewardsBadge');
+        if (badge && freeDeliveries > 0) {
+            badge.textContent = freeDeliveries;
+            badge.style.display = 'inline-block';
+        }
+    }
 
     // Copy order to clipboard
     async copyOrder() {
@@ -267,10 +400,9 @@ class CheckoutSystem {
 
     // Update delivery UI (fees, progress, cutoff)
     updateDeliveryUI() {
-        const subtotal = this.shop.cart.reduce((sum, item) => sum + item.total, 0);
-        const { postcode, fulfilment } = this.customerInfo;
-        const hasFreeReward = this.hasFreeDeliveryReward();
-        const fee = this.calculateDeliveryFee(subtotal, postcode, hasFreeReward);
+        this.refreshQuote();
+        const { fulfilment } = this.customerInfo;
+        const { subtotal, fee, deliveryFee, total, freeDelivery: hasFreeReward } = this.getTotals();
         
         // Update cart display with new delivery info
         if (this.shop && typeof this.shop.updateCart === 'function') {
@@ -302,9 +434,6 @@ class CheckoutSystem {
         }
 
         // Update totals
-        const deliveryFee = (fulfilment === 'delivery' && fee !== null) ? fee : 0;
-        const total = subtotal + deliveryFee;
-        
         const subtotalEl = document.getElementById('checkout-subtotal');
         const deliveryFeeEl = document.getElementById('checkout-delivery-fee');
         const totalEl = document.getElementById('checkout-total');
@@ -20,7 +20,9 @@ class GamificationSystem {
 
     async init() {
         if (this.userId) {
-            await this.loadUserData();
+            // First load: the profile comes with the startup data (bootstrap.js)
+            this.userData = window.glengalaBootstrap ? await glengalaBootstrap.get('user') : null;
+            if (!this.userData) await this.loadUserData();
             this.displayGamificationUI();
         }
     }
@@ -248,8 +250,11 @@ class GamificationSystem {
     // Daily special notification
     async checkDailySpecials() {
         try {
-            const response = await fetch(`${this.apiBase}/daily-specials`);
-            const data = await response.json();
+            let data = window.glengalaBootstrap ? await glengalaBootstrap.get('specials') : null;
+            if (!data) {
+                const response = await fetch(`${this.apiBase}/daily-specials`);
+                data = await response.json();
+            }
             
             if (data.specials && data.specials.length > 0) {
                 this.showSpecialsNotification(data.specials);
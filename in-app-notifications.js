@@ -8,20 +8,35 @@ class InAppNotificationManager {
         this.apiBase = window.location.origin + '/api';
         this.notificationContainer = null;
         this.priceChanges = [];
+        this.pollInterval = 300000; // 5 minutes, only while the live stream is down
     }
 
     async init() {
         // Check for price changes when app opens
-        await this.checkForPriceChanges();
+        await this.checkForPriceChanges({ startup: true });
         
         // Create notification UI container
         this.createNotificationUI();
         
         // Show any unseen changes
         this.showPendingNotifications();
+        
+        // Live price changes pushed over the stream (see live-pricing.js)
+        window.addEventListener('glengala:price-change', event => {
+            localStorage.setItem(this.lastCheckKey, new Date().toISOString());
+            this.priceChanges = [event.detail];
+            this.showPendingNotifications();
+        });
+        
+        // Fall back to polling when the stream isn't connected
+        setInterval(async () => {
+            if (window.livePricing && window.livePricing.streamConnected) return;
+            await this.checkForPriceChanges();
+            this.showPendingNotifications();
+        }, this.pollInterval);
     }
 
-    async checkForPriceChanges() {
+    async checkForPriceChanges({ startup = false } = {}) {
         try {
             // Get last check timestamp from localStorage
             let lastCheck = localStorage.getItem(this.lastCheckKey);
@@ -35,12 +50,23 @@ class InAppNotificationManager {
                 return;
             }
             
-            // Fetch price changes since last check
-            const response = await fetch(`${this.apiBase}/price-changes?since=${lastCheck}`);
-            if (!response.ok) throw new Error('Failed to fetch price changes');
-            
-            const data = await response.json();
-            const changes = Array.isArray(data) ? data : (data.changes || []);
+            // On startup the last week's changes come with the page (bootstrap.js)
+            const recent = Date.now() - new Date(lastCheck) < 7 * 24 * 60 * 60 * 1000;
+            let changes = startup && recent && window.glengalaBootstrap
+                ? await glengalaBootstrap.get('price_changes')
+                : null;
+            if (changes) {
+                // changed_at is SQLite UTC time ('YYYY-MM-DD HH:MM:SS')
+                const since = new Date(lastCheck);
+                changes = changes.filter(change => new Date(change.changed_at.replace(' ', 'T') + 'Z') > since);
+            } else {
+                // Fetch price changes since last check
+                const response = await fetch(`${this.apiBase}/price-changes?since=${lastCheck}`);
+                if (!response.ok) throw new Error('Failed to fetch price changes');
+                
+                const data = await response.json();
+                changes = Array.isArray(data) ? data : (data.changes || []);
+            }
             
             // Filter out already seen changes
             const seenChanges = JSON.parse(localStorage.getItem(this.seenChangesKey) || '[]');
@@ -264,7 +290,7 @@ class InAppNotificationManager {
 
     markAllAsSeen() {
         const seenChanges = JSON.parse(localStorage.getItem(this.seenChangesKey) || '[]');
-        const newSeenIds = this.priceChanges.map(c => c.id);
+        const newSeenIds = this.priceChanges.map(c => c.id).filter(id => id !== undefined);
         const allSeen = [...new Set([...seenChanges, ...newSeenIds])];
         
         // Keep only last 1000 IDs to prevent localStorage bloat
@@ -4,10 +4,15 @@
 class LivePricingSystem {
     constructor() {
         this.apiBase = window.location.origin + '/api';
+        this.catalogView = 'list'; // only the columns the shop grid renders
         this.products = [];
+        this.version = null; // catalog version for delta sync
         this.lastUpdate = null;
         this.updateInterval = 900000; // 15 minutes in milliseconds
         this.isLoading = true;
+        this.eventSource = null;
+        this.streamConnected = false; // live stream replaces polling while open
+        this.streamFailures = 0;
         this.init();
     }
 
@@ -20,11 +25,12 @@ class LivePricingSystem {
         
         // Step 2: Immediately fetch from database (primary source)
         // This runs in parallel - cache shows instantly, then gets updated
-        await this.fetchProducts();
+        await this.fetchProducts({ startup: true });
         
         this.isLoading = false;
         
-        // Set up periodic updates
+        // Live updates over SSE, with periodic polling as the fallback
+        this.connectStream();
         this.startPeriodicUpdates();
         
         // Listen for service worker messages
@@ -48,6 +54,7 @@ class LivePricingSystem {
                 // Use cache for instant display (any age OK for initial display)
                 this.products = data.products;
                 window.products = data.products;
+                this.version = data.version ?? null;
                 this.lastUpdate = new Date(data.updated_at);
                 
                 console.log('⚡ Instant load:', this.products.length, 'products from cache');
@@ -64,35 +71,25 @@ class LivePricingSystem {
         return false;
     }
 
-    async fetchProducts() {
+    async fetchProducts({ startup = false } = {}) {
         console.log('🌐 Fetching products from database...');
         try {
-            const response = await fetch(`${this.apiBase}/products`, {
-                cache: 'no-cache' // Always get fresh from database
-            });
-            if (!response.ok) {
-                throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+            // First load: the catalog arrives with the page (bootstrap.js)
+            let data = startup && window.glengalaBootstrap
+                ? await glengalaBootstrap.get('catalog')
+                : null;
+            if (!data) {
+                const response = await fetch(`${this.apiBase}/products?view=${this.catalogView}`, {
+                    cache: 'no-cache' // Always get fresh from database
+                });
+                if (!response.ok) {
+                    throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+                }
+                data = await response.json();
             }
-            const data = await response.json();
-            
-            this.products = data.products;
-            this.lastUpdate = new Date(data.updated_at);
             
+            this.applyFullCatalog(data);
             console.log('✅ Loaded', this.products.length, 'products from database (with photos)');
-            
-            // Update global products array IMMEDIATELY
-            window.products = this.products;
-            
-            // Update UI with fresh database data
-            this.updateProductDisplay();
-            this.updateLastUpdateTime();
-            
-            // Cache for next instant load
-            localStorage.setItem('glengala_products', JSON.stringify({
-                products: this.products,
-                updated_at: this.lastUpdate.toISOString()
-            }));
-            
             return this.products;
         } catch (error) {
             console.error('❌ Database fetch failed:', error.message);
@@ -114,6 +111,118 @@ class LivePricingSystem {
         }
     }
 
+    applyFullCatalog(data) {
+        this.products = data.products;
+        this.version = data.version ?? null;
+        // When we fetched it (the server's updated_at is when the catalog last changed)
+        this.lastUpdate = new Date();
+        
+        // Update global products array IMMEDIATELY
+        window.products = this.products;
+        
+        // Update UI with fresh database data
+        this.updateProductDisplay();
+        this.updateLastUpdateTime();
+        this.saveToCache();
+    }
+
+    saveToCache() {
+        // Cache for next instant load
+        localStorage.setItem('glengala_products', JSON.stringify({
+            products: this.products,
+            version: this.version,
+            updated_at: this.lastUpdate.toISOString()
+        }));
+    }
+
+    // Fetch only the products changed since our catalog version
+    async fetchChanges() {
+        const response = await fetch(`${this.apiBase}/products/changes?since=${this.version}&view=${this.catalogView}`, {
+            cache: 'no-cache'
+        });
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+        }
+        const data = await response.json();
+        
+        // Server sends the whole catalog when we are too far behind
+        if (data.products) {
+            console.log('📦 Catalog too far behind, applied full snapshot');
+            this.applyFullCatalog(data);
+            return this.products;
+        }
+        
+        if (data.upserted.length === 0 && data.deleted.length === 0) {
+            this.version = data.version;
+            return this.products;
+        }
+        
+        const byId = new Map(this.products.map(p => [p.id, p]));
+        data.deleted.forEach(id => byId.delete(id));
+        data.upserted.forEach(p => byId.set(p.id, p));
+        
+        // Keep the server's catalog order (category, then name)
+        this.products = Array.from(byId.values()).sort((a, b) =>
+            a.category < b.category ? -1 : a.category > b.category ? 1 :
+            a.name < b.name ? -1 : a.name > b.name ? 1 : 0
+        );
+        this.version = data.version;
+        this.lastUpdate = new Date();
+        console.log(`🔄 Applied catalog delta: ${data.upserted.length} updated, ${data.deleted.length} removed`);
+        
+        window.products = this.products;
+        this.updateProductDisplay();
+        this.updateLastUpdateTime();
+        this.saveToCache();
+        return this.products;
+    }
+
+    // Server-Sent Events stream for catalog, price and settings changes
+    connectStream() {
+        if (!('EventSource' in window) || this.streamFailures >= 3) {
+            console.log('📡 Live stream unavailable, polling instead');
+            return;
+        }
+        
+        const source = new EventSource(`${this.apiBase}/stream`);
+        this.eventSource = source;
+        
+        source.addEventListener('hello', () => {
+            this.streamConnected = true;
+            this.streamFailures = 0;
+            console.log('📡 Live price stream connected');
+        });
+        
+        source.addEventListener('catalog', () => this.scheduleStreamRefresh());
+        source.addEventListener('resync', () => this.scheduleStreamRefresh());
+        
+        source.addEventListener('price', event => {
+            window.dispatchEvent(new CustomEvent('glengala:price-change', {
+                detail: JSON.parse(event.data)
+            }));
+        });
+        
+        source.addEventListener('settings', () => {
+            window.dispatchEvent(new CustomEvent('glengala:settings-changed'));
+        });
+        
+        source.onerror = () => {
+            this.streamConnected = false;
+            // EventSource retries by itself; give up after repeated hard failures
+            if (source.readyState === EventSource.CLOSED) {
+                this.streamFailures++;
+                this.eventSource = null;
+                setTimeout(() => this.connectStream(), 30000 * this.streamFailures);
+            }
+        };
+    }
+
+    // Coalesce bursts of events (e.g. a bulk save) into one delta fetch
+    scheduleStreamRefresh() {
+        clearTimeout(this.streamRefreshTimer);
+        this.streamRefreshTimer = setTimeout(() => this.checkForUpdates(true), 250);
+    }
+
     startPeriodicUpdates() {
         console.log(`⏰ Starting periodic price updates every ${this.updateInterval / 60000} minutes`);
         setInterval(() => {
@@ -121,10 +230,18 @@ class LivePricingSystem {
         }, this.updateInterval);
     }
 
-    async checkForUpdates() {
+    async checkForUpdates(fromStream = false) {
+        // The live stream tells us when something changed - no need to poll
+        if (this.streamConnected && !fromStream) {
+            return;
+        }
         console.log('🔍 Checking for price updates...');
         try {
-            await this.fetchProducts();
+            if (this.version !== null && this.products.length > 0) {
+                await this.fetchChanges();
+            } else {
+                await this.fetchProducts();
+            }
             console.log('✅ Price update check complete');
         } catch (error) {
             console.error('❌ Error checking for updates:', error);
@@ -136,6 +253,7 @@ class LivePricingSystem {
             navigator.serviceWorker.addEventListener('message', event => {
                 if (event.data.type === 'PRICES_UPDATED') {
                     this.products = event.data.data.products;
+                    this.version = event.data.data.version ?? this.version;
                     this.updateProductDisplay();
                     this.showUpdateNotification();
                 }
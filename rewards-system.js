@@ -1,5 +1,6 @@
 // Glengala Fresh - Rewards & Achievements System
-// Client-side achievement tracking with localStorage
+// Achievement tracking with localStorage, synced from the server's
+// per-customer stats (api/achievements.py) when the customer is registered
 
 class GlengalaRewards {
     constructor() {
@@ -240,6 +241,67 @@ class GlengalaRewards {
         if (!this.getActiveRewards()) {
             this.saveActiveRewards([]);
         }
+        this.syncFromServer();
+    }
+
+    // Customers with an account are counted by the server when their order is
+    // recorded, so streaks and achievements come from there, not updateStats
+    usesServerStats() {
+        return Number.isFinite(parseInt(localStorage.getItem('glengala_user_id'), 10));
+    }
+
+    // Adopt the server's counters and achievements (they follow the customer
+    // across devices); unlocks this device hasn't shown yet pop up here.
+    // refresh skips the startup copy, e.g. straight after placing an order
+    async syncFromServer(refresh = false) {
+        const userId = parseInt(localStorage.getItem('glengala_user_id'), 10);
+        if (!Number.isFinite(userId)) return;
+        
+        // Already fetched with the startup data (bootstrap.js)
+        let profile = window.glengalaBootstrap && !refresh ? await glengalaBootstrap.get('user') : null;
+        try {
+            if (!profile) {
+                const response = await fetch(`${window.location.origin}/api/user/${userId}?fields=id`);
+                if (!response.ok) return;
+                profile = await response.json();
+            }
+        } catch {
+            return; // Offline - local stats stand until next time
+        }
+        if (!profile.stats) return;
+        
+        const stats = { ...this.getStats(), ...profile.stats };
+        // The server keeps the history; no need to grow it here as well
+        stats.orderHistory = [];
+        this.saveStats(stats);
+        
+        const earnedAchievements = this.getAchievements();
+        const earnedIds = new Set(earnedAchievements.map(a => a.id));
+        const newlyUnlocked = [];
+        for (const earned of profile.achievements || []) {
+            if (earnedIds.has(earned.id)) continue;
+            earnedAchievements.push({ id: earned.id, earnedAt: earned.earned_at });
+            const def = this.achievementDefs.find(d => d.id === earned.id);
+            // Unlocks from before this device synced were already celebrated elsewhere
+            if (def && (profile.new_achievements || []).includes(earned.id)) {
+                newlyUnlocked.push(def);
+                if (def.reward.type === 'free_delivery') {
+                    this.grantFreeDelivery(def.reward.uses);
+                }
+            }
+        }
+        this.saveAchievements(earnedAchievements);
+        
+        if (newlyUnlocked.length > 0) {
+            this.showNewAchievements(newlyUnlocked);
+        }
+        if ((profile.new_achievements || []).length > 0) {
+            fetch(`${window.location.origin}/api/user/${userId}/achievements/seen`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ ids: profile.new_achievements })
+            }).catch(() => {});
+        }
     }
 
     getDefaultStats() {
@@ -331,6 +393,12 @@ class GlengalaRewards {
         
         stats.categoriesOrdered = Math.max(stats.categoriesOrdered, categoriesSeen.size);
 
+        // Stats saved when weeks were counted from January 1st
+        if (stats.lastOrderWeek !== null && stats.lastOrderWeek < 1000) {
+            const last = stats.orderHistory[stats.orderHistory.length - 1];
+            stats.lastOrderWeek = last ? this.getWeekNumber(new Date(last.date)) : null;
+        }
+
         // Weekly streak
         if (stats.lastOrderWeek === null) {
             stats.weeklyStreak = 1;
@@ -354,10 +422,13 @@ class GlengalaRewards {
         return this.checkAchievements();
     }
 
+    // Monday-based week number, continuous across years - the same scale as
+    // week_of (api/achievements.py), so synced lastOrderWeek values line up
     getWeekNumber(date) {
-        const start = new Date(date.getFullYear(), 0, 1);
-        const days = Math.floor((date - start) / (24 * 60 * 60 * 1000));
-        return Math.ceil((days + 1) / 7);
+        // Days from 0001-01-01 (a Monday) to this local calendar date
+        const days = Math.floor(Date.UTC(date.getFullYear(), date.getMonth(), date.getDate())
+            / (24 * 60 * 60 * 1000)) + 719162;
+        return Math.floor(days / 7);
     }
 
     // Check for newly unlocked achievements
@@ -1,9 +1,14 @@
 // Glengala Fresh - Service Worker for PWA
 // Provides offline support and live price updates
 
+// `python api/assets.py` rewrites CACHE_NAME and STATIC_ASSETS from the
+// asset manifest in the built copy (dist/service-worker.js)
 const CACHE_NAME = 'glengala-v5';
 const API_CACHE = 'glengala-api-v5';
 
+// Fingerprinted build output (name.<hash>.ext) never changes at a given URL
+const IMMUTABLE_ASSET = /\.[0-9a-f]{10}\.[a-z0-9]+$/;
+
 // Files to cache for offline use - critical assets only
 const STATIC_ASSETS = [
   '/shop.html',
@@ -15,6 +20,7 @@ const STATIC_ASSETS = [
   '/products-data.js',
   '/shop-functions-enhanced.js',
   '/checkout-system.js',
+  '/bootstrap.js',
   '/live-pricing.js',
   '/admin.js',
   '/translations.js',
@@ -56,11 +62,19 @@ self.addEventListener('fetch', event => {
   const { request } = event;
   const url = new URL(request.url);
 
+  // Orders - queued in IndexedDB when the network is down
+  if (url.pathname === '/api/order' && request.method === 'POST') {
+    event.respondWith(submitOrder(request));
+    return;
+  }
+
   // API requests - Network first, fallback to cache
   if (url.pathname.startsWith('/api/')) {
     event.respondWith(
       fetch(request)
         .then(response => {
+          // Back online - send anything queued while we were offline
+          replayOrders();
           // Only cache GET requests
           if (request.method === 'GET') {
             const responseClone = response.clone();
@@ -93,12 +107,15 @@ self.addEventListener('fetch', event => {
   event.respondWith(
     caches.match(request).then(cached => {
       if (cached) {
-        // Return cached version and update in background
-        fetch(request).then(response => {
-          caches.open(CACHE_NAME).then(cache => {
-            cache.put(request, response);
-          });
-        }).catch(() => {});
+        // Return cached version and update in background (hashed assets
+        // can't have changed, so they cost no request at all)
+        if (!IMMUTABLE_ASSET.test(url.pathname)) {
+          fetch(request).then(response => {
+            caches.open(CACHE_NAME).then(cache => {
+              cache.put(request, response);
+            });
+          }).catch(() => {});
+        }
         return cached;
       }
 
@@ -117,16 +134,172 @@ self.addEventListener('fetch', event => {
   );
 });
 
-// Background sync for price updates
+// Background sync for price updates and queued orders
 self.addEventListener('sync', event => {
   if (event.tag === 'sync-prices') {
     event.waitUntil(syncPrices());
   }
+  if (event.tag === 'sync-orders') {
+    event.waitUntil(replayOrders());
+  }
 });
 
+// Pages can ask for a replay too (e.g. on the 'online' event)
+self.addEventListener('message', event => {
+  if (event.data && event.data.type === 'REPLAY_ORDERS') {
+    event.waitUntil(replayOrders());
+  }
+});
+
+// Offline order queue
+// Every order carries an idempotency key, so replaying one the server already
+// has (the response was lost, not the request) can't create a duplicate.
+const ORDER_DB = 'glengala-offline';
+const ORDER_STORE = 'orders';
+const ORDER_BATCH_SIZE = 50;
+
+function openOrderDb() {
+  return new Promise((resolve, reject) => {
+    const open = indexedDB.open(ORDER_DB, 1);
+    open.onupgradeneeded = () => {
+      open.result.createObjectStore(ORDER_STORE, { keyPath: 'idempotency_key' });
+    };
+    open.onsuccess = () => resolve(open.result);
+    open.onerror = () => reject(open.error);
+  });
+}
+
+async function orderStore(mode, action) {
+  const db = await openOrderDb();
+  return new Promise((resolve, reject) => {
+    const tx = db.transaction(ORDER_STORE, mode);
+    const result = action(tx.objectStore(ORDER_STORE));
+    tx.oncomplete = () => resolve(result && 'result' in result ? result.result : undefined);
+    tx.onerror = () => reject(tx.error);
+  });
+}
+
+function newIdempotencyKey() {
+  if (self.crypto && self.crypto.randomUUID) {
+    return self.crypto.randomUUID();
+  }
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
+function jsonResponse(body, status) {
+  return new Response(JSON.stringify(body), {
+    status,
+    headers: { 'Content-Type': 'application/json' }
+  });
+}
+
+async function submitOrder(request) {
+  const order = await request.clone().json().catch(() => null);
+  if (!order) {
+    return fetch(request);
+  }
+  order.idempotency_key = request.headers.get('Idempotency-Key') || order.idempotency_key || newIdempotencyKey();
+
+  try {
+    const response = await fetch('/api/order', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json', 'Idempotency-Key': order.idempotency_key },
+      body: JSON.stringify(order)
+    });
+    // Anything but "busy" is a definitive answer
+    if (response.status !== 503) {
+      return response;
+    }
+  } catch (error) {
+    // Offline - fall through to the queue
+  }
+
+  await orderStore('readwrite', store => store.put({
+    idempotency_key: order.idempotency_key,
+    order,
+    queued_at: Date.now()
+  }));
+  ordersQueued = true;
+  if (self.registration.sync) {
+    self.registration.sync.register('sync-orders').catch(() => {});
+  }
+  return jsonResponse({
+    success: true,
+    queued: true,
+    idempotency_key: order.idempotency_key,
+    message: 'You are offline - your order will be sent when you reconnect.'
+  }, 202);
+}
+
+let replaying = null;
+// Unknown after a restart, so look once; cleared when the queue is empty
+let ordersQueued = true;
+
+// One replay at a time: a reconnect burst shares a single batch request
+function replayOrders() {
+  if (!ordersQueued) {
+    return Promise.resolve();
+  }
+  if (!replaying) {
+    replaying = sendQueuedOrders().finally(() => { replaying = null; });
+  }
+  return replaying;
+}
+
+async function sendQueuedOrders() {
+  let queued;
+  try {
+    queued = await orderStore('readonly', store => store.getAll());
+  } catch (error) {
+    return;
+  }
+  if (!queued || queued.length === 0) {
+    ordersQueued = false;
+    return;
+  }
+
+  const results = [];
+  let kept = 0;
+  for (let start = 0; start < queued.length; start += ORDER_BATCH_SIZE) {
+    const chunk = queued.slice(start, start + ORDER_BATCH_SIZE);
+    let data;
+    try {
+      const response = await fetch('/api/orders/batch', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ orders: chunk.map(entry => entry.order) })
+      });
+      if (!response.ok) {
+        return; // still busy or down - keep the queue for the next attempt
+      }
+      data = await response.json();
+    } catch (error) {
+      return;
+    }
+    // Placed, replayed or rejected is final; an order the server couldn't
+    // write (retry) stays queued for the next replay
+    await orderStore('readwrite', store => {
+      chunk.forEach((entry, i) => {
+        if (data.results[i] && data.results[i].retry) {
+          kept++;
+        } else {
+          store.delete(entry.idempotency_key);
+        }
+      });
+    });
+    results.push(...data.results.filter(result => !result.retry));
+  }
+  ordersQueued = kept > 0;
+
+  const clients = await self.clients.matchAll();
+  clients.forEach(client => {
+    client.postMessage({ type: 'ORDERS_SYNCED', results });
+  });
+}
+
 async function syncPrices() {
   try {
-    const response = await fetch('/api/products');
+    const response = await fetch('/api/products?view=list');
     const data = await response.json();
     
     // Broadcast to all clients
@@ -453,7 +453,7 @@ class GlengalaShop {
                     font-size: 1.8em;
                     position: relative;
                 ">
-                    ${product.photo ? `<img src="${product.photo}" alt="${product.name}" style="width: 100%; height: 100%; object-fit: cover;">` : emoji}
+                    ${product.photo ? `<img src="${this.getPhotoThumb(product.photo)}" alt="${product.name}" loading="lazy" style="width: 100%; height: 100%; object-fit: cover;">` : emoji}
                     ${cartItem ? `<div style="position:absolute;top:-4px;right:-4px;background:#22c55e;color:#fff;font-size:0.65em;font-weight:700;padding:2px 5px;border-radius:8px;">✓</div>` : ''}
                 </div>
                 
@@ -488,6 +488,14 @@ class GlengalaShop {
         `;
     }
 
+    // Stored photos (/api/images/<hash>.jpg) have a small -thumb variant
+    getPhotoThumb(photo) {
+        if (photo && photo.startsWith('/api/images/')) {
+            return photo.replace(/\.(\w+)$/, '-thumb.$1');
+        }
+        return photo;
+    }
+
     getProductEmoji(product) {
         const emojis = {
             'vegetables': ['🥬', '🥒', '🥕', '🍅', '🥔', '🌽', '🥦', '🍆', '🌶️', '🍄', '🚀', '🥜', '🥖'],
@@ -608,26 +616,34 @@ class GlengalaShop {
         };
     }
 
+    // Same rules as PriceTable.price_line (api/quote.py), which prices the
+    // order for real - checkout shows the server's quote once it arrives
     calculateItemTotal(product, quantity) {
         const unit = product.unit || 'each';
         
         // For hundredg: quantity is number of 100g units, price is per kg
         // So 6 × 100g at $6.99/kg = 0.6kg × $6.99 = $4.19
-        if (unit === 'hundredg') {
-            return product.price * (quantity * 0.1); // quantity × 100g = quantity × 0.1kg
-        }
-        
         // For halfkg: quantity is number of 500g units, price is per kg
         // So 3 × 500g at $3.99/kg = 1.5kg × $3.99 = $5.99
-        if (unit === 'halfkg') {
-            return product.price * (quantity * 0.5); // quantity × 500g = quantity × 0.5kg
-        }
-        
         // For all other units, price is multiplied directly by quantity
         // - $10 per kg × 0.3kg = $3.00
         // - $5 per bunch × 2 bunches = $10.00
         // - $3 each × 4 items = $12.00
-        return product.price * quantity;
+        const factor = unit === 'hundredg' ? 0.1 : unit === 'halfkg' ? 0.5 : 1;
+        const sold = quantity * factor;
+        let total = product.price * sold;
+        
+        // Multi-buy special: specialQuantity (in sold units) for specialPrice,
+        // the rest at the normal price - only when that works out cheaper
+        const dealQty = product.hasSpecial && product.specialPrice ? (product.specialQuantity || 0) : 0;
+        if (dealQty > 0) {
+            // Round off float noise (0.1 × 10 steps is not quite 1kg)
+            const deals = Math.floor(sold / dealQty + 1e-9);
+            if (deals > 0) {
+                total = Math.min(total, deals * product.specialPrice + (sold - deals * dealQty) * product.price);
+            }
+        }
+        return Math.round(total * 100) / 100;
     }
 
     formatCartQuantity(item) {
@@ -974,16 +990,43 @@ class GlengalaShop {
     }
 
     searchProducts(query) {
+        clearTimeout(this.searchTimer);
         if (!query.trim()) {
             this.renderShop();
             return;
         }
 
+        // Instant local substring match, then the server's ranked results
+        // (prefixes, synonyms and typos) once typing pauses
         const allActiveProducts = this.getActiveProducts();
         const searchResults = allActiveProducts.filter(product => 
             product.name.toLowerCase().includes(query.toLowerCase())
         );
+        this.showSearchResults(searchResults);
+        this.searchTimer = setTimeout(() => this.fetchSearchResults(query, searchResults), 150);
+    }
+
+    async fetchSearchResults(query, localResults) {
+        try {
+            const response = await fetch(`${window.location.origin}/api/search?q=${encodeURIComponent(query)}&view=list`);
+            if (!response.ok) return;
+            const data = await response.json();
+            
+            // Ignore answers for a query the user has already changed
+            const searchEl = document.getElementById('shopSearch');
+            if (searchEl && searchEl.value !== query) return;
+            
+            // Prefer our own product objects (they carry live price updates)
+            const byId = new Map(this.getActiveProducts().map(p => [p.id, p]));
+            const ranked = data.results.map(result => byId.get(result.id) || result);
+            const seen = new Set(ranked.map(p => p.id));
+            this.showSearchResults(ranked.concat(localResults.filter(p => !seen.has(p.id))));
+        } catch (error) {
+            // Offline - the local results are already showing
+        }
+    }
 
+    showSearchResults(searchResults) {
         // Expand all categories that have search results
         const categoriesWithResults = new Set();
         searchResults.forEach(product => {
@@ -1332,6 +1375,20 @@ Thank you! 🌱`;
 
     // Load customization from admin settings
     async loadCustomization() {
+        // First load: the settings arrive with the page (bootstrap.js)
+        const startup = !this.settingsListenerAdded && window.glengalaBootstrap
+            ? await glengalaBootstrap.get('settings')
+            : null;
+        if (!this.settingsListenerAdded) {
+            // Re-apply when the admin saves settings (pushed over the live stream)
+            window.addEventListener('glengala:settings-changed', () => this.loadCustomization());
+            this.settingsListenerAdded = true;
+        }
+        if (startup) {
+            window.shopSettings = startup;
+            this.applyCustomization(startup);
+            return;
+        }
         try {
             const response = await fetch(`${window.location.origin}/api/settings`);
             if (response.ok) {